@@ -0,0 +1,408 @@
+# coding=utf-8
+"""Measure the throughput of the autopep8 engine on generated sources.
+
+Every corpus is generated from a fixed seed, so runs on different trees
+format the same text: clean code, whitespace-heavy code, long-line-heavy
+code, deeply nested code and huge single files. For each case the
+throughput (lines per second of the median run), the p50/p95 latency,
+the peak memory and the memory still held after the run (tracemalloc, of
+the benchmark process) are reported. Every run formats text which was not
+seen before, so the caches of the engine are filled but never hit. The
+memory of fix_multiple_files with more than one job is spent in other
+processes, so it is not reported.
+
+    python3 benchmarks/engine.py [--repeat N] [--filter TEXT]
+    python3 benchmarks/engine.py --filter huge --sizes 1000,10000,100000
+    python3 benchmarks/engine.py --output baseline.json
+    python3 benchmarks/engine.py --compare baseline.json
+
+With --compare a case is flagged when its p50 latency or its peak memory
+grew by more than --threshold; the exit status is 1 then. The baseline
+must have been run with the same --lines, --sizes, --project-files,
+--project-lines, --jobs and --aggressive.
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+KINDS = ('clean', 'whitespace', 'long_lines', 'nesting')
+DEFAULT_SIZES = '1000,10000'
+DEFAULT_THRESHOLD = 0.1
+# The arguments which change what the cases format.
+PARAMETERS = ('lines', 'sizes', 'project_files', 'project_lines', 'jobs',
+              'aggressive')
+
+
+def import_engine(packages_path):
+    """Import autopep8 and pycodestyle from this tree as AutoPEP8."""
+    os.symlink(PACKAGE_PATH, os.path.join(packages_path, 'AutoPEP8'))
+    sys.path.insert(0, packages_path)
+    # lib2to3 is deprecated on new pythons.
+    warnings.simplefilter('ignore', DeprecationWarning)
+    warnings.simplefilter('ignore', PendingDeprecationWarning)
+    from AutoPEP8.sublimeautopep8lib import autopep8, pycodestyle
+    return autopep8, pycodestyle
+
+
+def clean_block(rng, index):
+    limit = rng.randint(2, 50)
+    return [
+        'def function_{0}(first, second=None):'.format(index),
+        '    """Return a value computed from the arguments."""',
+        '    total = first + {0}'.format(limit),
+        '    for item in range(second or {0}):'.format(limit),
+        '        if item % 3 == 0:',
+        '            total += item * 2',
+        '        else:',
+        '            total -= item',
+        '    values = [total, first, second]',
+        '    return sum(value for value in values if value)',
+        '',
+        '',
+    ]
+
+
+def whitespace_block(rng, index):
+    """clean_block() with E1, E2 and W2 issues."""
+    lines = []
+    for line in clean_block(rng, index):
+        indent = len(line) - len(line.lstrip())
+        line = ' ' * (indent // 2) + line.lstrip()
+        line = line.replace(' = ', '=').replace(' + ', '+')
+        line = line.replace(', ', ' ,').replace('(', '( ')
+        if line and rng.random() < 0.3:
+            line += ' ' * rng.randint(1, 4)
+        lines.append(line)
+    return lines
+
+
+def long_lines_block(rng, index):
+    name = 'argument_{0}'.format(rng.randint(0, 1000))
+    return [
+        'def function_{0}(first_{1}, second_{1}, third_{1}, '
+        'fourth_{1}=None):'.format(index, name),
+        '    result = compute_something(first_{0}, second_{0}, '
+        "{{'key_one': first_{0}, 'key_two': [second_{0}, third_{0}]}}, "
+        'fourth_{0})'.format(name),
+        "    message = 'a long string literal which goes past the limit "
+        "of the line ' + str(result) + ' characters' + str(first_{0})"
+        .format(name),
+        '    return [result, message, first_{0}, second_{0}, third_{0}, '
+        'fourth_{0}]'.format(name),
+        '',
+        '',
+    ]
+
+
+def nesting_block(rng, index):
+    depth = rng.randint(4, 10)
+    lines = ['def function_{0}(value):'.format(index)]
+    for level in range(1, depth + 1):
+        lines.append('    ' * level + 'if value > {0}:'.format(level))
+    indent = '    ' * (depth + 1)
+    lines.append(indent + "data = {'a': [(1, {'b': [2, (3, [4, "
+                 "{'c': value}])]})]}")
+    lines.append(indent + 'return data')
+    lines.append('    return None')
+    lines.extend(['', ''])
+    return lines
+
+
+BLOCKS = {
+    'clean': clean_block,
+    'whitespace': whitespace_block,
+    'long_lines': long_lines_block,
+    'nesting': nesting_block,
+}
+
+
+def generate(kind, lines, seed=0):
+    """Return a source of kind with about the given number of lines.
+
+    A huge source mixes the blocks of all the other kinds.
+    """
+    rng = random.Random('{0}-{1}-{2}'.format(kind, lines, seed))
+    source = []
+    index = 0
+    while len(source) < lines:
+        if kind == 'huge':
+            block = BLOCKS[KINDS[index % len(KINDS)]]
+        else:
+            block = BLOCKS[kind]
+        source.extend(block(rng, index))
+        index += 1
+    return '\n'.join(source[:lines]).rstrip('\n') + '\n'
+
+
+def write(path, source):
+    with open(path, 'w') as fd:
+        fd.write(source)
+
+
+def unique(source, run):
+    """Return source with a first line of its own for this run."""
+    return '# run {0}\n{1}'.format(run, source)
+
+
+class Case(object):
+    """One measured call; setup() runs before every call, untimed.
+
+    Both are called with the number of the run, to make its text unique.
+    traced is False when the call runs in other processes, which
+    tracemalloc does not see.
+    """
+
+    def __init__(self, name, lines, func, setup=None, traced=True):
+        self.name = name
+        self.lines = lines
+        self.func = func
+        self.setup = setup
+        self.traced = traced
+        self.runs = 0
+
+    def run(self):
+        self.runs += 1
+        if self.setup is not None:
+            self.setup(self.runs)
+        start = time.perf_counter()
+        self.func(self.runs)
+        return time.perf_counter() - start
+
+
+def make_cases(args, autopep8, pycodestyle, work_path):
+    options = {'aggressive': args.aggressive}
+    aggressive = ['--aggressive'] * args.aggressive
+    sources = [(kind, generate(kind, args.lines)) for kind in KINDS]
+    sources += [('huge-{0}'.format(size), generate('huge', size))
+                for size in args.sizes]
+    style = pycodestyle.StyleGuide(quiet=True)
+    cases = []
+
+    for (name, source) in sources:
+        lines = source.count('\n')
+        cases.append(Case(
+            'fix_code/' + name, lines,
+            lambda run, source=source: autopep8.fix_code(
+                unique(source, run), options)))
+        cases.append(Case(
+            'check_all/' + name, lines,
+            lambda run, source=source: pycodestyle.Checker(
+                lines=unique(source, run).splitlines(True),
+                options=style.options).check_all()))
+
+    for (name, source) in sources[:len(KINDS)]:
+        filename = os.path.join(work_path, name + '.py')
+        file_options = autopep8.parse_args([filename] + aggressive)
+        cases.append(Case(
+            'fix_file/' + name, source.count('\n'),
+            lambda run, filename=filename, file_options=file_options:
+            autopep8.fix_file(filename, file_options),
+            lambda run, filename=filename, source=source:
+            write(filename, unique(source, run))))
+
+    # A project of small files of all kinds, fixed in place.
+    project = os.path.join(work_path, 'project')
+    files = [(os.path.join(project, 'module_{0}.py'.format(index)),
+              generate(KINDS[index % len(KINDS)], args.project_lines, index))
+             for index in range(args.project_files)]
+    project_lines = sum(source.count('\n') for (_, source) in files)
+
+    def reset_project(run):
+        shutil.rmtree(project, ignore_errors=True)
+        os.mkdir(project)
+        for (filename, source) in files:
+            write(filename, unique(source, run))
+
+    for jobs in sorted(set([1, args.jobs])):
+        project_options = autopep8.parse_args(
+            ['--in-place', '--recursive', '--jobs', str(jobs), project] +
+            aggressive)
+        cases.append(Case(
+            'fix_multiple_files/jobs-{0}'.format(jobs), project_lines,
+            lambda run, project_options=project_options:
+            autopep8.fix_multiple_files([project], project_options),
+            reset_project, traced=jobs == 1))
+
+    return [case for case in cases
+            if not args.filter or args.filter in case.name]
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of values."""
+    values = sorted(values)
+    rank = max(int(math.ceil(fraction * len(values))), 1)
+    return values[rank - 1]
+
+
+def measure(case, repeat):
+    case.run()  # warm up imports and the style guide of the options.
+    timings = [case.run() for _ in range(repeat)]
+
+    (retained, peak) = (None, None)
+    if case.traced:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            case.run()
+            gc.collect()
+            (retained, peak) = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    p50 = statistics.median(timings)
+    return {
+        'lines': case.lines,
+        'runs': len(timings),
+        'p50': p50,
+        'p95': percentile(timings, 0.95),
+        'lines_per_second': case.lines / p50 if p50 else None,
+        'peak_memory': peak,
+        'retained_memory': retained,
+    }
+
+
+def megabytes(size):
+    return 'n/a' if size is None else '{0:.1f}'.format(size / 1024.0 / 1024.0)
+
+
+def parameter_changes(parameters, baseline_parameters):
+    """Return the descriptions of the parameters which differ."""
+    return ['--{0} {1} (baseline {2})'.format(
+        name.replace('_', '-'), parameters.get(name),
+        baseline_parameters.get(name))
+        for name in PARAMETERS
+        if parameters.get(name) != baseline_parameters.get(name)]
+
+
+def compare(results, baseline, threshold):
+    """Print the change against baseline; return the regressed cases.
+
+    Cases of another number of lines than in the baseline are skipped;
+    memory is compared when both runs report it.
+    """
+    regressions = []
+    print()
+    print('{0:<32} {1:>10} {2:>10}'.format('vs baseline', 'p50', 'memory'))
+    for (name, result) in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if old['lines'] != result['lines']:
+            print('{0:<32} skipped: {1} lines, baseline {2}'.format(
+                name, result['lines'], old['lines']))
+            continue
+        time_change = result['p50'] / old['p50'] - 1
+        memory_change = None
+        if result['peak_memory'] is not None and old['peak_memory']:
+            memory_change = result['peak_memory'] / old['peak_memory'] - 1
+        regressed = time_change > threshold or (
+            memory_change is not None and memory_change > threshold)
+        if regressed:
+            regressions.append(name)
+        print('{0:<32} {1:>+9.1%} {2:>10}{3}'.format(
+            name, time_change,
+            'n/a' if memory_change is None else
+            '{0:+.1%}'.format(memory_change),
+            '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of timed runs per case '
+                             '(default: %(default)s)')
+    parser.add_argument('--filter', default='',
+                        help='only run the cases whose name contains this')
+    parser.add_argument('--lines', type=int, default=1000,
+                        help='lines of the clean, whitespace, long_lines '
+                             'and nesting sources (default: %(default)s)')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='comma separated lines of the huge sources '
+                             '(default: %(default)s)')
+    parser.add_argument('--project-files', type=int, default=20,
+                        help='files fixed by fix_multiple_files '
+                             '(default: %(default)s)')
+    parser.add_argument('--project-lines', type=int, default=200,
+                        help='lines of each of these files '
+                             '(default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=2,
+                        help='parallel jobs of fix_multiple_files; it is '
+                             'also run with one job (default: %(default)s)')
+    parser.add_argument('--aggressive', action='count', default=0,
+                        help='fix with autopep8 --aggressive')
+    parser.add_argument('--output', metavar='FILE',
+                        help='save the results as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare with results saved by --output')
+    parser.add_argument('--threshold', type=float,
+                        default=DEFAULT_THRESHOLD,
+                        help='relative growth of p50 or peak memory which '
+                             'is a regression (default: %(default)s)')
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(',') if size]
+    parameters = dict((name, getattr(args, name)) for name in PARAMETERS)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fd:
+            saved = json.load(fd)
+        if 'parameters' not in saved:
+            parser.error('{0} has no run parameters; run the baseline '
+                         'again'.format(args.compare))
+        changes = parameter_changes(parameters, saved['parameters'])
+        if changes:
+            parser.error('{0} was run with other parameters: {1}'.format(
+                args.compare, ', '.join(changes)))
+        baseline = saved['results']
+
+    work_path = tempfile.mkdtemp()
+    try:
+        autopep8, pycodestyle = import_engine(work_path)
+        results = {}
+        print('{0:<32} {1:>8} {2:>12} {3:>10} {4:>10} {5:>10} '
+              '{6:>10}'.format('case', 'lines', 'lines/s', 'p50 (ms)',
+                               'p95 (ms)', 'peak (MB)', 'kept (MB)'))
+        for case in make_cases(args, autopep8, pycodestyle, work_path):
+            result = results[case.name] = measure(case, args.repeat)
+            print('{0:<32} {1:>8} {2:>12.0f} {3:>10.1f} {4:>10.1f} '
+                  '{5:>10} {6:>10}'.format(
+                      case.name, result['lines'], result['lines_per_second'],
+                      result['p50'] * 1000, result['p95'] * 1000,
+                      megabytes(result['peak_memory']),
+                      megabytes(result['retained_memory'])))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(work_path)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({'python': platform.python_version(),
+                       'autopep8': autopep8.__version__,
+                       'pycodestyle': pycodestyle.__version__,
+                       'repeat': args.repeat,
+                       'parameters': parameters,
+                       'results': results}, fd, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
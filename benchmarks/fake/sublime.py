@@ -0,0 +1,605 @@
+# coding=utf-8
+"""Stand-in for the sublime module of Sublime Text.
+
+It covers the part of the API the plugin uses: settings loaded from the
+.sublime-settings files of the packages, windows with views, output
+panels and folders, views with text, selection, regions and status, and
+set_timeout/set_timeout_async run by two threads like the main and the
+async thread of plugin_host.
+
+The callbacks only run once start() is called, which is what
+sublime_plugin.load_plugin() does after the plugin module is imported;
+wait_idle() returns when no callback is due. set_packages_path(),
+start() and wait_idle() are not part of the real module.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
+import time
+
+DRAW_EMPTY = 1
+HIDE_ON_MINIMAP = 2
+DRAW_EMPTY_AS_OVERWRITE = 4
+PERSISTENT = 16
+DRAW_NO_FILL = 32
+HIDDEN = 128
+DRAW_NO_OUTLINE = 256
+DRAW_SOLID_UNDERLINE = 512
+DRAW_STIPPLED_UNDERLINE = 1024
+DRAW_SQUIGGLY_UNDERLINE = 2048
+
+_packages_path = ''
+_status = {'message': ''}
+
+
+def version():
+    return '3211'
+
+
+def platform():
+    return {'nt': 'windows', 'posix': 'linux'}.get(os.name, os.name)
+
+
+def arch():
+    return 'x64'
+
+
+def packages_path():
+    return _packages_path
+
+
+def installed_packages_path():
+    return os.path.join(os.path.dirname(_packages_path),
+                        'Installed Packages')
+
+
+def set_packages_path(path):
+    """Set the Packages folder which settings are loaded from."""
+    global _packages_path
+    _packages_path = path
+    _settings.clear()
+
+
+def status_message(message):
+    _status['message'] = message
+
+
+def last_status_message():
+    return _status['message']
+
+
+def expand_variables(value, variables):
+    """Replace ${name} and $name with variables; unknown names are ''."""
+    def replace(match):
+        return variables.get(match.group(1) or match.group(2), '')
+    return re.sub(r'\$\{(\w+)\}|\$(\w+)', replace, value)
+
+
+class TimeoutLoop(object):
+    """Run callbacks once they are due on one thread."""
+
+    def __init__(self, name):
+        self.name = name
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._busy = False
+        self._thread = None
+
+    def add(self, callback, delay):
+        due = time.time() + delay / 1000.0
+        with self._condition:
+            heapq.heappush(self._queue, (due, next(self._counter), callback))
+            self._condition.notify_all()
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def is_idle(self):
+        with self._condition:
+            return not self._busy and not (
+                self._queue and self._queue[0][0] <= time.time())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.time():
+                    timeout = None
+                    if self._queue:
+                        timeout = self._queue[0][0] - time.time()
+                    self._condition.wait(timeout)
+                (_, _, callback) = heapq.heappop(self._queue)
+                self._busy = True
+            try:
+                callback()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._busy = False
+
+
+_main_loop = TimeoutLoop('main')
+_async_loop = TimeoutLoop('async')
+
+
+def set_timeout(callback, delay=0):
+    _main_loop.add(callback, delay)
+
+
+def set_timeout_async(callback, delay=0):
+    _async_loop.add(callback, delay)
+
+
+def start():
+    """Start running the set_timeout and set_timeout_async callbacks."""
+    _main_loop.start()
+    _async_loop.start()
+
+
+def wait_idle(timeout=10, poll=0.0001):
+    """Wait until no callback is due or running; return False on timeout.
+
+    Callbacks that are due later, like the reset of a status message,
+    do not count.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if _main_loop.is_idle() and _async_loop.is_idle():
+            return True
+        time.sleep(poll)
+    return False
+
+
+class Region(object):
+
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.b - self.a)
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def __len__(self):
+        return self.size()
+
+    def __eq__(self, other):
+        return (isinstance(other, Region) and
+                (self.a, self.b) == (other.a, other.b))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '({0}, {1})'.format(self.a, self.b)
+
+
+class Selection(object):
+
+    def __init__(self):
+        self._regions = [Region(0)]
+
+    def __len__(self):
+        return len(self._regions)
+
+    def __getitem__(self, index):
+        return self._regions[index]
+
+    def __iter__(self):
+        return iter(list(self._regions))
+
+    def clear(self):
+        self._regions = []
+
+    def add(self, region):
+        if isinstance(region, int):
+            region = Region(region)
+        self._regions.append(region)
+        self._regions.sort(key=Region.begin)
+
+
+class Settings(object):
+
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+        self._callbacks = {}
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def has(self, key):
+        return key in self._values
+
+    def set(self, key, value):
+        self._values[key] = value
+        self._changed()
+
+    def erase(self, key):
+        if key in self._values:
+            del self._values[key]
+            self._changed()
+
+    def add_on_change(self, tag, callback):
+        self._callbacks[tag] = callback
+
+    def clear_on_change(self, tag):
+        self._callbacks.pop(tag, None)
+
+    def _changed(self):
+        for callback in list(self._callbacks.values()):
+            callback()
+
+
+def decode_value(text):
+    """Parse the JSON of a .sublime-settings file, which has comments."""
+    def keep_strings(match):
+        return match.group(1) or ''
+    string = r'("(?:\\.|[^"\\])*")'
+    text = re.sub(string + r'|//[^\n]*|/\*.*?\*/', keep_strings, text,
+                  flags=re.S)
+    # Sublime also accepts trailing commas.
+    return json.loads(re.sub(string + r'|,(?=\s*[}\]])', keep_strings, text))
+
+
+_settings = {}
+
+
+def load_settings(name):
+    """Return settings of name, read from the packages like Sublime does.
+
+    The User package is read last, so it overrides the others.
+    """
+    if name not in _settings:
+        values = {}
+        packages = sorted(os.listdir(_packages_path)) if _packages_path else []
+        if 'User' in packages:
+            packages.remove('User')
+            packages.append('User')
+        for package in packages:
+            path = os.path.join(_packages_path, package, name)
+            if os.path.isfile(path):
+                with open(path, encoding='utf-8') as fd:
+                    values.update(decode_value(fd.read()))
+        _settings[name] = Settings(values)
+    return _settings[name]
+
+
+def save_settings(name):
+    pass
+
+
+class Edit(object):
+    """Token which allows the edits of one command run."""
+
+    def __init__(self, view):
+        self.view = view
+        self.valid = True
+
+
+_ids = itertools.count(1)
+
+
+class View(object):
+
+    def __init__(self, window, file_name=None):
+        self._id = next(_ids)
+        self._window = window
+        self._file_name = file_name
+        self._text = ''
+        self._lock = threading.RLock()
+        self._change_count = 0
+        self._saved_change_count = 0
+        self._settings = Settings()
+        self._selection = Selection()
+        self._regions = {}
+        self._status = {}
+        self._encoding = 'UTF-8'
+        self._scratch = False
+        self._read_only = False
+        if file_name and os.path.isfile(file_name):
+            with open(file_name, encoding='utf-8', newline='') as fd:
+                self._text = fd.read()
+
+    def id(self):
+        return self._id
+
+    def buffer_id(self):
+        return self._id
+
+    def window(self):
+        return self._window
+
+    def file_name(self):
+        return self._file_name
+
+    def settings(self):
+        return self._settings
+
+    def sel(self):
+        return self._selection
+
+    def size(self):
+        with self._lock:
+            return len(self._text)
+
+    def substr(self, x):
+        with self._lock:
+            if isinstance(x, Region):
+                return self._text[x.begin():x.end()]
+            return self._text[x:x + 1]
+
+    def change_count(self):
+        return self._change_count
+
+    def is_dirty(self):
+        return self._change_count != self._saved_change_count
+
+    def encoding(self):
+        return self._encoding
+
+    def set_encoding(self, encoding):
+        self._encoding = encoding
+
+    def set_syntax_file(self, syntax_file):
+        self._settings.set('syntax', syntax_file)
+
+    def set_scratch(self, scratch):
+        self._scratch = scratch
+
+    def set_read_only(self, read_only):
+        self._read_only = read_only
+
+    def is_read_only(self):
+        return self._read_only
+
+    def insert(self, edit, point, text):
+        self._edit(edit, Region(point), text)
+        return len(text)
+
+    def replace(self, edit, region, text):
+        self._edit(edit, region, text)
+
+    def erase(self, edit, region):
+        self._edit(edit, region, '')
+
+    def end_edit(self, edit):
+        pass
+
+    def _edit(self, edit, region, text):
+        if not (isinstance(edit, Edit) and edit.valid and
+                edit.view is self):
+            raise ValueError('Edit objects may not be used after the '
+                             'TextCommand\'s run method has returned')
+        with self._lock:
+            self._text = (self._text[:region.begin()] + text +
+                          self._text[region.end():])
+            self._change_count += 1
+
+    def text_point(self, row, col):
+        with self._lock:
+            lines = self._text.split('\n')
+            row = min(max(row, 0), len(lines) - 1)
+            return sum(len(line) + 1 for line in lines[:row]) + min(
+                col, len(lines[row]))
+
+    def rowcol(self, point):
+        with self._lock:
+            before = self._text[:point]
+            return before.count('\n'), len(before) - before.rfind('\n') - 1
+
+    def line(self, x):
+        if isinstance(x, Region):
+            begin, end = x.begin(), x.end()
+        else:
+            begin = end = x
+        with self._lock:
+            begin = self._text.rfind('\n', 0, begin) + 1
+            end = self._text.find('\n', end)
+            return Region(begin, len(self._text) if end < 0 else end)
+
+    def add_regions(self, key, regions, scope='', icon='', flags=0):
+        self._regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return list(self._regions.get(key, []))
+
+    def erase_regions(self, key):
+        self._regions.pop(key, None)
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def get_status(self, key):
+        return self._status.get(key, '')
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def run_command(self, cmd, args=None):
+        """Run a TextCommand of a loaded plugin or a built-in command."""
+        import sublime_plugin
+        args = dict(args or {})
+        if cmd == 'save':
+            self._save(sublime_plugin)
+            return
+        if cmd == 'select_all':
+            self._selection.clear()
+            self._selection.add(Region(0, self.size()))
+            sublime_plugin.on_selection_modified(self)
+            return
+        change_count = self._change_count
+        edit = Edit(self)
+        try:
+            if cmd == 'append':
+                self.insert(edit, self.size(), args['characters'])
+            elif cmd == 'insert':
+                self._insert_characters(edit, args['characters'])
+            else:
+                command = sublime_plugin.text_command(cmd, self)
+                if command is None or not command.is_enabled_(args):
+                    return
+                command.run(edit, **args)
+        finally:
+            edit.valid = False
+        if self._change_count != change_count:
+            sublime_plugin.on_modified(self)
+
+    def _insert_characters(self, edit, characters):
+        # Replace the selections, the last first, and put the carets after
+        # the inserted text.
+        carets = []
+        for region in reversed(list(self._selection)):
+            self.replace(edit, region, characters)
+            shift = len(characters) - region.size()
+            carets = [point + shift for point in carets]
+            carets.append(region.begin() + len(characters))
+        self._selection.clear()
+        for point in carets:
+            self._selection.add(Region(point))
+
+    def _save(self, sublime_plugin):
+        sublime_plugin.on_pre_save(self)
+        if self._file_name:
+            with self._lock:
+                with open(self._file_name, 'w', encoding='utf-8',
+                          newline='') as fd:
+                    fd.write(self._text)
+                self._saved_change_count = self._change_count
+        sublime_plugin.on_post_save(self)
+
+    def close(self):
+        import sublime_plugin
+        self._window._views.remove(self)
+        sublime_plugin.on_close(self)
+
+    def __repr__(self):
+        return '<View {0} {1!r}>'.format(self._id, self._file_name)
+
+
+class Window(object):
+
+    def __init__(self):
+        self._id = next(_ids)
+        self._views = []
+        self._panels = {}
+        self._active_panel = None
+        self._folders = []
+        self._project_data = None
+
+    def id(self):
+        return self._id
+
+    def views(self):
+        return list(self._views)
+
+    def active_view(self):
+        return self._views[-1] if self._views else None
+
+    def new_file(self):
+        return self._open(View(self))
+
+    def open_file(self, file_name):
+        for view in self._views:
+            if view.file_name() == file_name:
+                return view
+        return self._open(View(self, file_name))
+
+    def _open(self, view):
+        import sublime_plugin
+        self._views.append(view)
+        if view.file_name():
+            sublime_plugin.on_load(view)
+        sublime_plugin.on_activated(view)
+        return view
+
+    def get_output_panel(self, name):
+        if name not in self._panels:
+            self._panels[name] = View(self)
+        return self._panels[name]
+
+    def active_panel(self):
+        return self._active_panel
+
+    def folders(self):
+        return list(self._folders)
+
+    def set_folders(self, folders):
+        """Open folders in the side bar; not part of the real API."""
+        self._folders = list(folders)
+
+    def project_data(self):
+        return self._project_data
+
+    def set_project_data(self, data):
+        self._project_data = data
+
+    def extract_variables(self):
+        variables = {'packages': _packages_path, 'platform': platform()}
+        if self._folders:
+            variables['folder'] = self._folders[0]
+        view = self.active_view()
+        if view is not None and view.file_name():
+            file_name = view.file_name()
+            variables['file'] = file_name
+            variables['file_path'] = os.path.dirname(file_name)
+            variables['file_name'] = os.path.basename(file_name)
+            variables['file_base_name'] = os.path.splitext(
+                os.path.basename(file_name))[0]
+        return variables
+
+    def run_command(self, cmd, args=None):
+        """Run a WindowCommand of a loaded plugin or a built-in command."""
+        import sublime_plugin
+        args = dict(args or {})
+        if cmd == 'show_panel':
+            self._active_panel = args.get('panel')
+        elif cmd == 'hide_panel':
+            self._active_panel = None
+        else:
+            command = sublime_plugin.window_command(cmd, self)
+            if command is not None and command.is_enabled_(args):
+                command.run(**args)
+
+
+_windows = [Window()]
+
+
+def windows():
+    return list(_windows)
+
+
+def active_window():
+    return _windows[0]
+
+
+def run_command(cmd, args=None):
+    """Run an ApplicationCommand of a loaded plugin."""
+    import sublime_plugin
+    args = dict(args or {})
+    command = sublime_plugin.application_command(cmd)
+    if command is not None and command.is_enabled_(args):
+        command.run(**args)
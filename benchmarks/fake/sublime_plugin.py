@@ -0,0 +1,159 @@
+# coding=utf-8
+"""Stand-in for the sublime_plugin module of Sublime Text.
+
+load_plugin() registers the commands and event listeners of an imported
+plugin module like plugin_host does, then starts the set_timeout loops of
+the fake sublime module. Events are sent to the listeners by the fake
+views and windows: the plain handlers run at once, the _async ones on the
+async thread.
+"""
+
+import sublime
+
+_text_commands = {}
+_window_commands = {}
+_application_commands = {}
+_listeners = []
+_plugins = []
+
+
+class Command(object):
+
+    def name(self):
+        return command_name(type(self))
+
+    def is_enabled_(self, args):
+        """Return is_enabled(**args), without args if it does not take them."""
+        try:
+            return self.is_enabled(**args)
+        except TypeError:
+            return self.is_enabled()
+
+    def is_enabled(self, *args, **kwargs):
+        return True
+
+    def is_visible(self, *args, **kwargs):
+        return True
+
+
+class TextCommand(Command):
+
+    def __init__(self, view):
+        self.view = view
+
+
+class WindowCommand(Command):
+
+    def __init__(self, window):
+        self.window = window
+
+
+class ApplicationCommand(Command):
+    pass
+
+
+class EventListener(object):
+    pass
+
+
+def command_name(cls):
+    """Return the name a command class is run by, e.g. auto_pep8."""
+    class_name = cls.__name__
+    name = class_name[0].lower()
+    last_upper = False
+    for char in class_name[1:]:
+        if char.isupper() and not last_upper:
+            name += '_' + char.lower()
+        else:
+            name += char
+        last_upper = char.isupper()
+    if name.endswith('_command'):
+        name = name[:-len('_command')]
+    return name
+
+
+def load_plugin(module):
+    """Register the commands and listeners defined in module."""
+    registries = ((TextCommand, _text_commands),
+                  (WindowCommand, _window_commands),
+                  (ApplicationCommand, _application_commands))
+    for value in vars(module).values():
+        if not isinstance(value, type) or value.__module__ != module.__name__:
+            continue
+        for (base, registry) in registries:
+            if issubclass(value, base):
+                registry[command_name(value)] = value
+        if issubclass(value, EventListener):
+            _listeners.append(value())
+    _plugins.append(module)
+    if hasattr(module, 'plugin_loaded'):
+        module.plugin_loaded()
+    sublime.start()
+
+
+def unload_plugins():
+    """Call plugin_unloaded() and drop everything load_plugin() added."""
+    for module in _plugins:
+        if hasattr(module, 'plugin_unloaded'):
+            module.plugin_unloaded()
+    del _plugins[:]
+    del _listeners[:]
+    for registry in (_text_commands, _window_commands,
+                     _application_commands):
+        registry.clear()
+
+
+def text_command(name, view):
+    cls = _text_commands.get(name)
+    return cls(view) if cls is not None else None
+
+
+def window_command(name, window):
+    cls = _window_commands.get(name)
+    return cls(window) if cls is not None else None
+
+
+def application_command(name):
+    cls = _application_commands.get(name)
+    return cls() if cls is not None else None
+
+
+def _emit(event, view):
+    for listener in list(_listeners):
+        handler = getattr(listener, event, None)
+        if handler is not None:
+            handler(view)
+    async_event = event + '_async'
+    for listener in list(_listeners):
+        handler = getattr(listener, async_event, None)
+        if handler is not None:
+            sublime.set_timeout_async(
+                lambda handler=handler: handler(view), 0)
+
+
+def on_load(view):
+    _emit('on_load', view)
+
+
+def on_activated(view):
+    _emit('on_activated', view)
+
+
+def on_modified(view):
+    _emit('on_modified', view)
+
+
+def on_selection_modified(view):
+    _emit('on_selection_modified', view)
+
+
+def on_pre_save(view):
+    _emit('on_pre_save', view)
+
+
+def on_post_save(view):
+    _emit('on_post_save', view)
+
+
+def on_close(view):
+    _emit('on_close', view)
@@ -0,0 +1,262 @@
+# coding=utf-8
+"""Measure the latency of the plugin commands without Sublime Text.
+
+The plugin is loaded with the stand-ins of benchmarks/fake, so the real
+commands run from a view: auto_pep8 builds the options, runs the job on
+the scheduler, creates the diff or applies the edit and shows the result.
+For each buffer size the end-to-end time from the command to the applied
+edit is reported, for a preview, a format, a format of text which is
+already in the result cache and a format on save, together with the
+stages on their own: pep8_params(), the engine, create_diff() and the
+auto_pep8_replace edit. "plugin overhead" is the time of each format run
+minus the time spent formatting the text in that run (in autopep8 or the
+formatter process).
+
+    python3 benchmarks/plugin.py [--sizes 100,1000,5000] [--repeat N]
+    python3 benchmarks/plugin.py --formatter-process --output plugin.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_PATH = os.path.dirname(BENCHMARKS_PATH)
+FAKE_PATH = os.path.join(BENCHMARKS_PATH, 'fake')
+SYNTAX = 'Packages/Python/Python.sublime-syntax'
+
+USER_SETTINGS = {
+    'format_on_save': True,
+    # the debounce delay would be measured otherwise.
+    'format_on_save_delay': 0,
+}
+
+sys.path.insert(0, FAKE_PATH)
+
+import sublime  # noqa: E402
+import sublime_plugin  # noqa: E402
+
+from engine import generate, percentile  # noqa: E402
+
+
+def load_plugin(packages_path, user_settings):
+    """Lay out packages_path like the Packages folder and load the plugin."""
+    os.symlink(PACKAGE_PATH, os.path.join(packages_path, 'AutoPEP8'))
+    user_path = os.path.join(packages_path, 'User')
+    os.mkdir(user_path)
+    with open(os.path.join(user_path, 'AutoPep8.sublime-settings'),
+              'w') as fd:
+        json.dump(user_settings, fd)
+    sys.path.insert(0, packages_path)
+    sublime.set_packages_path(packages_path)
+
+    # on_ready() prints the settings.
+    with contextlib.redirect_stdout(io.StringIO()):
+        import AutoPEP8.sublautopep8 as plugin
+        sublime_plugin.load_plugin(plugin)
+        sublime.wait_idle()
+    return plugin
+
+
+class Runner(object):
+    """Run commands on one view and wait until their work is done."""
+
+    def __init__(self, plugin, view):
+        self.plugin = plugin
+        self.common = plugin.common
+        self.view = view
+        self.runs = 0
+
+    def wait(self, timeout=60):
+        jobs = self.common.get_scheduler()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if (sublime.wait_idle(timeout) and not jobs.queue_depth() and
+                    not jobs.running()):
+                return
+            time.sleep(0.0001)
+        raise RuntimeError('The plugin did not finish in time.')
+
+    def reset(self, source, fresh=True):
+        """Put source in the view; fresh text is not in the result cache."""
+        if fresh:
+            self.runs += 1
+            source = '# run {0}\n{1}'.format(self.runs, source)
+        self.view.run_command('select_all')
+        self.view.run_command('insert', {'characters': source})
+        self.view.sel().clear()
+        self.view.sel().add(sublime.Region(0))
+        self.wait()
+        return source
+
+    def close_other_views(self):
+        window = self.view.window()
+        for view in window.views():
+            if view is not self.view:
+                view.close()
+
+    def text(self):
+        return self.view.substr(sublime.Region(0, self.view.size()))
+
+    def timed(self, func):
+        start = time.perf_counter()
+        func()
+        self.wait()
+        return time.perf_counter() - start
+
+    def timed_engine(self, func):
+        """Return the seconds of func and of the formatting within it."""
+        common = self.common
+        fix_code = common._fix_code
+        spent = []
+
+        def timed_fix_code(*args):
+            start = time.perf_counter()
+            try:
+                return fix_code(*args)
+            finally:
+                spent.append(time.perf_counter() - start)
+
+        common._fix_code = timed_fix_code
+        try:
+            seconds = self.timed(func)
+        finally:
+            common._fix_code = fix_code
+        if not spent:
+            raise RuntimeError('The text was not formatted.')
+        return seconds, sum(spent)
+
+
+def measure(runner, source, repeat):
+    """Return {case: [seconds]} for source."""
+    view = runner.view
+    common = runner.common
+    params = runner.plugin.pep8_params()
+    timings = {}
+
+    def add(case, seconds):
+        timings.setdefault(case, []).append(seconds)
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        params = runner.plugin.pep8_params()
+        add('pep8_params', time.perf_counter() - start)
+
+        text = runner.reset(source)
+        start = time.perf_counter()
+        formatted = common.engine().fix_code_result(text, params).source
+        add('engine', time.perf_counter() - start)
+
+        start = time.perf_counter()
+        common.create_diff(text, formatted, view.file_name())
+        add('create_diff', time.perf_counter() - start)
+
+        add('auto_pep8_replace', runner.timed(
+            lambda: view.run_command('auto_pep8_replace', {
+                'text': formatted, 'a': 0, 'b': view.size()})))
+        if runner.text() != formatted:
+            raise RuntimeError('auto_pep8_replace did not apply the edit.')
+
+        runner.reset(source)
+        add('preview', runner.timed(
+            lambda: view.run_command('auto_pep8', {'preview': True})))
+        runner.close_other_views()
+
+        text = runner.reset(source)
+        (seconds, engine_seconds) = runner.timed_engine(
+            lambda: view.run_command('auto_pep8', {'preview': False}))
+        add('format', seconds)
+        add('plugin overhead', seconds - engine_seconds)
+        if formatted != text and runner.text() == text:
+            raise RuntimeError('auto_pep8 did not format the view.')
+
+        runner.reset(text, fresh=False)
+        add('format (cached)', runner.timed(
+            lambda: view.run_command('auto_pep8', {'preview': False})))
+
+        runner.reset(source)
+        add('format on save', runner.timed(lambda: view.run_command('save')))
+        if view.is_dirty():
+            raise RuntimeError('Format on save did not save the view.')
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='100,1000,5000',
+                        help='comma separated lines of the buffers '
+                             '(default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of timed runs per case '
+                             '(default: %(default)s)')
+    parser.add_argument('--formatter-process', action='store_true',
+                        help='format in the formatter process')
+    parser.add_argument('--output', metavar='FILE',
+                        help='save the results as JSON')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    user_settings = dict(USER_SETTINGS)
+    if args.formatter_process:
+        user_settings.update(formatter_process=True,
+                             python_interpreter=sys.executable)
+
+    work_path = tempfile.mkdtemp()
+    packages_path = os.path.join(work_path, 'Packages')
+    project_path = os.path.join(work_path, 'project')
+    os.mkdir(packages_path)
+    os.mkdir(project_path)
+    results = {}
+    try:
+        plugin = load_plugin(packages_path, user_settings)
+        window = sublime.active_window()
+        window.set_folders([project_path])
+        print('{0:<20} {1:>8} {2:>10} {3:>10}'.format(
+            'case', 'lines', 'p50 (ms)', 'p95 (ms)'))
+        for size in sizes:
+            filename = os.path.join(project_path,
+                                    'module_{0}.py'.format(size))
+            source = generate('huge', size)
+            with open(filename, 'w') as fd:
+                fd.write(source)
+            view = window.open_file(filename)
+            view.set_syntax_file(SYNTAX)
+            runner = Runner(plugin, view)
+            runner.wait()
+
+            timings = measure(runner, source, args.repeat)
+            view.close()
+            cases = results['{0} lines'.format(size)] = {
+                case: {'p50': statistics.median(values),
+                       'p95': percentile(values, 0.95),
+                       'runs': len(values)}
+                for (case, values) in timings.items()}
+            for (case, result) in sorted(cases.items()):
+                print('{0:<20} {1:>8} {2:>10.1f} {3:>10.1f}'.format(
+                    case, size, result['p50'] * 1000,
+                    result['p95'] * 1000))
+            sys.stdout.flush()
+    finally:
+        sublime_plugin.unload_plugins()
+        shutil.rmtree(work_path)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({'python': platform.python_version(),
+                       'plugin': plugin.VERSION,
+                       'formatter_process': args.formatter_process,
+                       'repeat': args.repeat,
+                       'results': results}, fd, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
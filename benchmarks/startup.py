@@ -0,0 +1,82 @@
+# coding=utf-8
+"""Measure how long plugin_host takes to load the plugin.
+
+Every sample runs a fresh interpreter which imports the plugin the way
+Sublime Text does, with the stand-ins of benchmarks/fake. The
+median is reported for the plugin alone and for the plugin plus the
+autopep8 engine, which is what the first format of a session loads.
+
+    python3 benchmarks/startup.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_PATH = os.path.dirname(BENCHMARKS_PATH)
+FAKE_PATH = os.path.join(BENCHMARKS_PATH, 'fake')
+
+SAMPLE = '''
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import AutoPEP8.sublautopep8
+loaded = time.perf_counter()
+engine_loaded = 'AutoPEP8.sublimeautopep8lib.autopep8' in sys.modules
+AutoPEP8.sublautopep8.common.engine()
+print(json.dumps({'plugin': loaded - start,
+                  'engine': time.perf_counter() - loaded,
+                  'engine_at_startup': engine_loaded}))
+'''
+
+
+def make_packages(path):
+    """Lay out path like the Packages folder of Sublime Text."""
+    os.symlink(PACKAGE_PATH, os.path.join(path, 'AutoPEP8'))
+    # The set_timeout callbacks of the fake sublime module do not run
+    # until sublime_plugin.load_plugin(), so on_ready() is not measured.
+    for name in ('sublime.py', 'sublime_plugin.py'):
+        os.symlink(os.path.join(FAKE_PATH, name), os.path.join(path, name))
+
+
+def sample(packages_path):
+    # -B: no bytecode is written into the package.
+    output = subprocess.check_output(
+        [sys.executable, '-B', '-c', SAMPLE], cwd=packages_path)
+    return json.loads(output.decode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20,
+                        help='number of samples (default: %(default)s)')
+    args = parser.parse_args()
+
+    packages_path = tempfile.mkdtemp()
+    try:
+        make_packages(packages_path)
+        samples = [sample(packages_path) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(packages_path)
+
+    plugin = statistics.median(result['plugin'] for result in samples)
+    engine = statistics.median(result['engine'] for result in samples)
+    print('plugin load:          {0:8.1f} ms'.format(plugin * 1000))
+    print('engine import:        {0:8.1f} ms'.format(engine * 1000))
+    print('plugin load + engine: {0:8.1f} ms'.format((plugin + engine) * 1000))
+    if any(result['engine_at_startup'] for result in samples):
+        print('autopep8 is imported at startup.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
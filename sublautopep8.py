@@ -1,18 +1,24 @@
 # coding=utf-8
 """SublimeAutoPEP8 plugin."""
 
+import copy
 import glob
 import logging
 import os
 import sys
+import threading
+
+from collections import OrderedDict
 
 import sublime
 import sublime_plugin
 
-from AutoPEP8.sublimeautopep8lib import autopep8
+from AutoPEP8.sublimeautopep8lib import batch
 from AutoPEP8.sublimeautopep8lib import common
+from AutoPEP8.sublimeautopep8lib import lint
 
 VERSION = '2.3.0'
+SETTINGS_CHANGE_KEY = 'autopep8_pep8_params'
 
 logger = logging.getLogger('SublimeAutoPEP8')
 
@@ -26,6 +32,8 @@ AUTOPEP8_OPTIONS = (
     'indent-size',
     'exclude',
     'hang-closing',
+    'cache-dir',
+    'cache-size',
 )
 
 
@@ -83,9 +91,21 @@ def _print_debug_info():
 
     plugin_keys = (
         'format_on_save',
+        'format_on_save_changed_lines',
+        'format_on_save_delay',
+        'git_diff_ref',
         'syntax_list',
         'file_menu_search_depth',
         'avoid_new_line_in_select_mode',
+        'formatter_process',
+        'python_interpreter',
+        'formatter_process_timeout',
+        'folder_processes',
+        'worker_threads',
+        'warm_up',
+        'warm_up_check',
+        'lint',
+        'lint_delay',
         'debug',
         'logfile',
     )
@@ -113,10 +133,81 @@ def _print_debug_info():
         print(message % message_values)
 
 
-def pep8_params():
+class Pep8ParamsCache(object):
+    """Parsed autopep8 options by argv.
+
+    Entries are dropped when the plugin settings change and are checked
+    against the mtimes of the config files that autopep8 reads. At most
+    max_entries argvs (one per project folder) are kept, the least
+    recently used are dropped first. get() returns a copy, so callers may
+    change it.
+    """
+
+    max_entries = 32
+
+    def __init__(self):
+        self.revision = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        with self.lock:
+            self.revision += 1
+            self.entries.clear()
+
+    def get(self, params):
+        with self.lock:
+            key = (self.revision, tuple(params))
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[1] != config_mtimes(entry[0]):
+                options = common.engine().parse_args(params,
+                                                     apply_config=True)
+                entry = (options, config_mtimes(options))
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            return copy.deepcopy(entry[0])
+
+
+def config_mtimes(options):
+    """Return mtimes of the config files autopep8 looks for.
+
+    Missing files are included too, so creating one is noticed.
+    """
+    paths = [options.global_config]
+    if not options.ignore_local_config:
+        # the same lookup as autopep8.read_config and read_pyproject_toml.
+        names = common.engine().PROJECT_CONFIG + ('pyproject.toml',)
+        parent = tail = options.files and os.path.abspath(
+            os.path.commonprefix(options.files))
+        while tail:
+            paths.extend(os.path.join(parent, name) for name in names)
+            (parent, tail) = os.path.split(parent)
+
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.path.getmtime(path))
+        except (OSError, TypeError):
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+_pep8_params_cache = Pep8ParamsCache()
+
+
+def is_python(view):
+    """Return True if the syntax of view is in the syntax_list setting."""
+    view_syntax = view.settings().get('syntax') or ''
+    syntax_list = get_user_settings().get('syntax_list', ['Python'])
+    filename = os.path.basename(view_syntax)
+    return os.path.splitext(filename)[0] in syntax_list
+
+
+def pep8_params(window=None):
     """Return params for the autopep8 module."""
     user_settings = get_user_settings()
-    env_vars = sublime.active_window().extract_variables()
+    env_vars = (window or sublime.active_window()).extract_variables()
 
     params = ['-d']  # args for preview
     # read settings
@@ -124,10 +215,10 @@ def pep8_params():
         opt_value = user_settings.get(opt, '')
         if opt_value == '' or opt_value is None:
             continue
-        if opt_value and opt in ('exclude', 'global-config'):
+        if opt_value and opt in ('exclude', 'global-config', 'cache-dir'):
             opt_value = sublime.expand_variables(opt_value, env_vars)
 
-        if opt in ('exclude', 'global-config'):
+        if opt in ('exclude', 'global-config', 'cache-dir'):
             if opt_value:
                 opt_value = sublime.expand_variables(opt_value, env_vars)
                 params.append('--{0}={1}'.format(opt, opt_value))
@@ -142,16 +233,12 @@ def pep8_params():
         else:
             params.append('--{0}={1}'.format(opt, opt_value))
 
-    # use verbose==2 to catch non-fixed issues
-    params.extend(['--verbose'] * 2)
-
     # autopep8.parse_args required at least one positional argument,
     # fake-file parent folder is used as location for local configs.
     params.append(sublime.expand_variables('${folder}/fake-file', env_vars))
 
     logger.info('pep8_params: %s', params)
-    args = autopep8.parse_args(params, apply_config=True)
-    return args
+    return _pep8_params_cache.get(params)
 
 
 class AutoPep8Command(sublime_plugin.TextCommand):
@@ -164,22 +251,32 @@ class AutoPep8Command(sublime_plugin.TextCommand):
 
         return region, self.view.substr(region), self.view.encoding()
 
-    def run(self, edit, preview=True, skip_selected=False):
-        queue = common.Queue()
+    def run(self, edit, preview=True, skip_selected=False,
+            changed_since=None):
         region, source, encoding = self.get_selection(skip_selected)
         if not isinstance(source, str) and hasattr('decode'):
             source = source.decode(encoding)
 
-        queue.put((source, self.view.file_name(), self.view, region, encoding))
-        sublime.set_timeout_async(
-            lambda: common.worker(queue, preview, pep8_params()),
-            common.WORKER_START_TIMEOUT)
+        if region.size() != self.view.size():
+            changed_since = None
+        base_lines = None
+        if changed_since == common.CHANGED_SINCE_SAVE:
+            # taken now: the next save replaces the kept lines.
+            base_lines = common.saved_lines(self.view.id())
+        job = common.FormatJob(
+            source, self.view.file_name(), self.view, region, encoding,
+            changed_since, self.view.change_count(), base_lines)
+        if not preview and self.view.settings().get(common.VIEW_AUTOSAVE):
+            # the job saves the view, so an outdated job can not take
+            # the flag from a newer save.
+            self.view.settings().erase(common.VIEW_AUTOSAVE)
+            common.submit_view_job(job, preview, pep8_params())
+            return
+
+        common.submit_job(job, preview, pep8_params())
 
     def is_enabled(self, *args):
-        view_syntax = self.view.settings().get('syntax')
-        syntax_list = get_user_settings().get('syntax_list', ["Python"])
-        filename = os.path.basename(view_syntax)
-        return os.path.splitext(filename)[0] in syntax_list
+        return is_python(self.view)
 
     def is_visible(self, *args):
         return True
@@ -206,7 +303,12 @@ class AutoPep8ReplaceCommand(sublime_plugin.TextCommand):
             lines = text.split('\n')
             if not lines[-1]:
                 text = '\n'.join(lines[:-1])
-        self.view.replace(edit, region, text)
+        # replace changed lines only: the rest of the view keeps its
+        # highlighting, folds and selections.
+        source = self.view.substr(region)
+        for begin, end, hunk in common.line_hunks(source, text):
+            self.view.replace(
+                edit, sublime.Region(region.a + begin, region.a + end), hunk)
 
     def is_visible(self, *args):
         return False
@@ -217,24 +319,15 @@ class AutoPep8FileCommand(sublime_plugin.WindowCommand):
     def run(self, paths=None, preview=True):
         if not paths:
             return
-        queue = common.Queue()
-
-        for path in self.files(paths, pep8_params().exclude):
-            with open(path, 'r') as fd:
-                source = fd.read()
-
-            encoding = common.get_pyencoding(source)
-            if not isinstance(source, str) and hasattr(source, 'decode'):
-                source = source.decode(encoding)
-
-            queue.put((source, path, None, None, encoding))
-
-        sublime.set_timeout_async(
-            lambda: common.worker(queue, preview, pep8_params()),
-            common.WORKER_START_TIMEOUT)
+        params = pep8_params()
+        processes = get_user_settings().get('folder_processes',
+                                            batch.DEFAULT_FOLDER_PROCESSES)
+        batch.BatchFormatter(self.files(paths, params.exclude), params,
+                             preview, processes).start()
 
     def files(self, paths, exclude=None):
-        for path in autopep8.find_files(paths, recursive=True, exclude=exclude):
+        find_files = common.engine().find_files
+        for path in find_files(paths, recursive=True, exclude=exclude):
             if path.endswith('.py'):
                 yield path
 
@@ -268,6 +361,32 @@ class AutoPep8FileCommand(sublime_plugin.WindowCommand):
         return True
 
 
+class AutoPep8ClearCacheCommand(sublime_plugin.ApplicationCommand):
+
+    def run(self):
+        params = pep8_params()
+        sublime.set_timeout_async(lambda: common.clear_caches(params), 0)
+        sublime.status_message('AutoPep8: cache is cleared.')
+
+
+class AutoPep8JobsCommand(sublime_plugin.ApplicationCommand):
+
+    def run(self):
+        jobs = common.get_scheduler()
+        running, pending = jobs.running(), jobs.pending()
+        logger.info('Running jobs: %s', running)
+        logger.info('Pending jobs: %s', pending)
+        sublime.status_message('AutoPep8: {0} job(s) running, {1} queued.'
+                               .format(len(running), len(pending)))
+
+
+class AutoPep8CancelJobsCommand(sublime_plugin.ApplicationCommand):
+
+    def run(self):
+        common.get_scheduler().cancel_all()
+        sublime.status_message('AutoPep8: jobs are cancelled.')
+
+
 class AutoPep8Listener(sublime_plugin.EventListener):
 
     def on_pre_save_async(self, view):
@@ -277,18 +396,86 @@ class AutoPep8Listener(sublime_plugin.EventListener):
             view.settings().erase(common.VIEW_SKIP_FORMAT)
             view.settings().erase(common.VIEW_AUTOSAVE)
             return
-        view_syntax = view.settings().get('syntax')
-        syntax_list = user_settings.get('syntax_list', ['Python'])
-        if os.path.splitext(os.path.basename(view_syntax))[0] in syntax_list:
+        if is_python(view):
             view.settings().set(common.VIEW_AUTOSAVE, True)
+            changed_since = None
+            if user_settings.get('format_on_save_changed_lines', False):
+                changed_since = common.CHANGED_SINCE_SAVE
             view.run_command('auto_pep8',
-                             {'preview': False, 'skip_selected': True})
+                             {'preview': False, 'skip_selected': True,
+                              'changed_since': changed_since})
+
+    def on_post_save_async(self, view):
+        self.remember_saved_lines(view)
+
+    def on_load_async(self, view):
+        self.remember_saved_lines(view)
+        self.warm_up(view)
+        self.lint(view)
+
+    def on_activated_async(self, view):
+        # views opened before the plugin was loaded.
+        if common.saved_lines(view.id()) is None:
+            self.remember_saved_lines(view)
+        self.warm_up(view)
+        self.lint(view)
+
+    def on_modified_async(self, view):
+        self.lint(view)
+
+    def on_selection_modified_async(self, view):
+        lint.show_status(view)
+
+    def remember_saved_lines(self, view):
+        """Keep the saved lines for format_on_save_changed_lines."""
+        if (get_user_settings().get('format_on_save_changed_lines', False) and
+                view.file_name() and is_python(view)):
+            common.remember_saved_lines(view.id(), view.file_name())
+
+    def lint(self, view):
+        window = view.window()
+        if (not get_user_settings().get('lint', False) or window is None or
+                not is_python(view)):
+            lint.clear(view)
+            return
+        lint.schedule(view, lambda: pep8_params(window))
+
+    def warm_up(self, view):
+        """Load autopep8 and the options of the project before a format.
+
+        With warm_up_check the view text is formatted in the background
+        too, so format-on-save of the unchanged text hits the cache.
+        """
+        user_settings = get_user_settings()
+        window = view.window()
+        if (not user_settings.get('warm_up', True) or window is None or
+                not is_python(view)):
+            return
+        params = pep8_params(window)
+        if user_settings.get('warm_up_check', False):
+            common.submit_check(view, params)
+
+    def on_close(self, view):
+        common.forget_view(view.id())
+        lint.clear(view)
 
 
 def on_ready():
     """Run code once plugin is loaded."""
     _setup_logger()
     _print_debug_info()
+    get_user_settings().add_on_change(
+        SETTINGS_CHANGE_KEY, _pep8_params_cache.invalidate)
+
+
+def plugin_unloaded():
+    get_user_settings().clear_on_change(SETTINGS_CHANGE_KEY)
+    common.get_scheduler().cancel_all()
+    common.stop_formatter_process()
+    common.clear_engine_caches()
+    for window in sublime.windows():
+        for view in window.views():
+            lint.clear(view)
 
 
 # Timeout is required for ST3
@@ -41,21 +41,30 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import argparse
+import bisect
 import codecs
 import collections
+import contextlib
 import copy
 import difflib
 import fnmatch
+import hashlib
 import inspect
 import io
 import itertools
+import json
 import keyword
 import locale
 import os
 import re
 import signal
+import subprocess
 import sys
+import tempfile
 import textwrap
+import threading
+import time
+import timeit
 import token
 import tokenize
 import warnings
@@ -94,6 +103,7 @@ STARTSWITH_DEF_REGEX = re.compile(r'^(async\s+def|def)\s.*\):')
 DOCSTRING_START_REGEX = re.compile(r'^u?r?(?P<kind>["\']{3})')
 ENABLE_REGEX = re.compile(r'# *(fmt|autopep8): *on')
 DISABLE_REGEX = re.compile(r'# *(fmt|autopep8): *off')
+ENABLE_DISABLE_REGEX = re.compile(r'# *(fmt|autopep8): *(on|off)')
 
 EXIT_CODE_OK = 0
 EXIT_CODE_ERROR = 1
@@ -153,10 +163,19 @@ if not os.path.exists(DEFAULT_CONFIG):  # pragma: no cover
     else:
         DEFAULT_CONFIG = os.path.join(os.path.expanduser('~/.config'), 'pep8')
 PROJECT_CONFIG = ('setup.cfg', 'tox.ini', '.pep8', '.flake8')
+DEFAULT_CACHE_SIZE = 100  # megabytes
 
 
 MAX_PYTHON_FILE_DETECTION_BYTES = 1024
 
+# Comments which look like code are compiled under this name. Their
+# SyntaxWarning in Python3.8+ (https://bugs.python.org/issue15248) is
+# ignored by a filter set once: warnings.catch_warnings() would swap the
+# filters of every thread of the process.
+COMMENT_FILENAME = '<comment>'
+warnings.filterwarnings('ignore', category=SyntaxWarning,
+                        module=re.escape(COMMENT_FILENAME))
+
 
 def open_with_encoding(filename, mode='r', encoding=None, limit_byte_check=-1):
     """Return opened file with a specific encoding."""
@@ -450,7 +469,8 @@ class FixPEP8(object):
     def __init__(self, filename,
                  options,
                  contents=None,
-                 long_line_ignore_cache=None):
+                 long_line_ignore_cache=None,
+                 incremental_pep8=None):
         self.filename = filename
         if contents is None:
             self.source = readlines_from_file(filename)
@@ -471,42 +491,16 @@ class FixPEP8(object):
         self.long_line_ignore_cache = (
             set() if long_line_ignore_cache is None
             else long_line_ignore_cache)
+        self.incremental_pep8 = incremental_pep8
+        # Results that a fixer was tried on but could not fix.
+        self.not_fixed = []
 
-        # Many fixers are the same even though pycodestyle categorizes them
-        # differently.
-        self.fix_e115 = self.fix_e112
-        self.fix_e121 = self._fix_reindent
-        self.fix_e122 = self._fix_reindent
-        self.fix_e123 = self._fix_reindent
-        self.fix_e124 = self._fix_reindent
-        self.fix_e126 = self._fix_reindent
-        self.fix_e127 = self._fix_reindent
-        self.fix_e128 = self._fix_reindent
-        self.fix_e129 = self._fix_reindent
-        self.fix_e133 = self.fix_e131
-        self.fix_e202 = self.fix_e201
-        self.fix_e203 = self.fix_e201
-        self.fix_e211 = self.fix_e201
-        self.fix_e221 = self.fix_e271
-        self.fix_e222 = self.fix_e271
-        self.fix_e223 = self.fix_e271
-        self.fix_e226 = self.fix_e225
-        self.fix_e227 = self.fix_e225
-        self.fix_e228 = self.fix_e225
-        self.fix_e241 = self.fix_e271
-        self.fix_e242 = self.fix_e224
-        self.fix_e252 = self.fix_e225
-        self.fix_e261 = self.fix_e262
-        self.fix_e272 = self.fix_e271
-        self.fix_e273 = self.fix_e271
-        self.fix_e274 = self.fix_e271
-        self.fix_e306 = self.fix_e301
+        long_line_logically = bool(
+            options and (options.aggressive >= 2 or options.experimental))
         self.fix_e501 = (
-            self.fix_long_line_logically if
-            options and (options.aggressive >= 2 or options.experimental) else
+            self.fix_long_line_logically if long_line_logically else
             self.fix_long_line_physically)
-        self.fix_e703 = self.fix_e702
-        self.fix_w293 = self.fix_w291
+        self.fixers = get_fixers(type(self), long_line_logically)
 
     def _fix_source(self, results):
         try:
@@ -515,19 +509,25 @@ class FixPEP8(object):
         except (SyntaxError, tokenize.TokenError):  # pragma: no cover
             logical_support = False
 
+        fixers = self.fixers
+        profile = current_profile()
+
+        def priority_key(result):
+            fixer = fixers.get(result['id'])
+            return fixer[2] if fixer else _priority_key(result)
+
         completed_lines = set()
-        for result in sorted(results, key=_priority_key):
+        for result in sorted(results, key=priority_key):
             if result['line'] in completed_lines:
                 continue
 
-            fixed_methodname = 'fix_' + result['id'].lower()
-            if hasattr(self, fixed_methodname):
-                fix = getattr(self, fixed_methodname)
+            fixer = fixers.get(result['id'])
+            if fixer:
+                (fix, is_logical_fix, _) = fixer
 
                 line_index = result['line'] - 1
                 original_line = self.source[line_index]
 
-                is_logical_fix = len(_get_parameters(fix)) > 2
                 if is_logical_fix:
                     logical = None
                     if logical_support:
@@ -535,15 +535,18 @@ class FixPEP8(object):
                                                result,
                                                logical_start,
                                                logical_end)
-                        if logical and set(range(
-                            logical[0][0] + 1,
-                            logical[1][0] + 1)).intersection(
-                                completed_lines):
+                        if logical and _intersects(completed_lines,
+                                                   logical[0][0] + 1,
+                                                   logical[1][0] + 1):
                             continue
 
-                    modified_lines = fix(result, logical)
+                    fix_args = (result, logical)
                 else:
-                    modified_lines = fix(result)
+                    fix_args = (result,)
+
+                with _timed(profile, 'FixPEP8.' + fix.__name__,
+                            {'line': result['line']}):
+                    modified_lines = fix(self, *fix_args)
 
                 if modified_lines is None:
                     # Force logical fixes to report what they modified.
@@ -555,6 +558,7 @@ class FixPEP8(object):
                 if modified_lines:
                     completed_lines.update(modified_lines)
                 elif modified_lines == []:  # Empty list means no fix
+                    self.not_fixed.append(result)
                     if self.options.verbose >= 2:
                         print(
                             '--->  Not fixing {error} on line {line}'.format(
@@ -565,7 +569,8 @@ class FixPEP8(object):
             else:
                 if self.options.verbose >= 3:
                     print(
-                        "--->  '{}' is not defined.".format(fixed_methodname),
+                        "--->  '{}' is not defined.".format(
+                            'fix_' + result['id'].lower()),
                         file=sys.stderr)
 
                     info = result['info'].strip()
@@ -577,13 +582,16 @@ class FixPEP8(object):
 
     def fix(self):
         """Return a version of the source code with PEP 8 violations fixed."""
-        pep8_options = {
-            'ignore': self.options.ignore,
-            'select': self.options.select,
-            'max_line_length': self.options.max_line_length,
-            'hang_closing': self.options.hang_closing,
-        }
-        results = _execute_pep8(pep8_options, self.source)
+        if self.incremental_pep8:
+            results = self.incremental_pep8.check(self.source)
+        else:
+            pep8_options = {
+                'ignore': self.options.ignore,
+                'select': self.options.select,
+                'max_line_length': self.options.max_line_length,
+                'hang_closing': self.options.hang_closing,
+            }
+            results = _execute_pep8(pep8_options, self.source)
 
         if self.options.verbose:
             progress = {}
@@ -599,9 +607,20 @@ class FixPEP8(object):
             results = [r for r in results
                        if start <= r['line'] <= end]
 
-        self._fix_source(filter_results(source=''.join(self.source),
-                                        results=results,
-                                        aggressive=self.options.aggressive))
+        line_ranges = getattr(self.options, 'line_ranges', None)
+        if line_ranges:
+            results = [r for r in results
+                       if any(start <= r['line'] <= end
+                              for (start, end) in line_ranges)]
+
+        original_source = list(self.source)
+        with _timed(current_profile(), 'filter_results'):
+            results = list(filter_results(source=''.join(self.source),
+                                          results=results,
+                                          aggressive=self.options.aggressive))
+        self._fix_source(results)
+        if self.incremental_pep8:
+            self.incremental_pep8.record_fixes(original_source, self.source)
 
         if self.options.line_range:
             # If number of lines has changed then change line_range.
@@ -609,6 +628,19 @@ class FixPEP8(object):
                         for sline in self.source[start - 1:end])
             self.options.line_range[1] = start + count - 1
 
+        if line_ranges:
+            # Move the ranges to the line numbers of the fixed source.
+            line_numbers = [1]
+            for sline in self.source:
+                line_numbers.append(line_numbers[-1] + sline.count('\n'))
+            # W391 drops the trailing blank lines from the source.
+            line_numbers.extend([line_numbers[-1]] * (
+                len(original_source) + 1 - len(line_numbers)))
+            self.options.line_ranges = [
+                [line_numbers[start - 1], line_numbers[end] - 1]
+                for (start, end) in line_ranges
+                if line_numbers[end] > line_numbers[start - 1]]
+
         return ''.join(self.source)
 
     def _fix_reindent(self, result):
@@ -1400,6 +1432,75 @@ class FixPEP8(object):
             self.source[line_index] = '{}r{}'.format(
                 target[:pos], target[pos:])
 
+    # Many fixers are the same even though pycodestyle categorizes them
+    # differently.
+    fix_e115 = fix_e112
+    fix_e121 = _fix_reindent
+    fix_e122 = _fix_reindent
+    fix_e123 = _fix_reindent
+    fix_e124 = _fix_reindent
+    fix_e126 = _fix_reindent
+    fix_e127 = _fix_reindent
+    fix_e128 = _fix_reindent
+    fix_e129 = _fix_reindent
+    fix_e133 = fix_e131
+    fix_e202 = fix_e201
+    fix_e203 = fix_e201
+    fix_e211 = fix_e201
+    fix_e221 = fix_e271
+    fix_e222 = fix_e271
+    fix_e223 = fix_e271
+    fix_e226 = fix_e225
+    fix_e227 = fix_e225
+    fix_e228 = fix_e225
+    fix_e241 = fix_e271
+    fix_e242 = fix_e224
+    fix_e252 = fix_e225
+    fix_e261 = fix_e262
+    fix_e272 = fix_e271
+    fix_e273 = fix_e271
+    fix_e274 = fix_e271
+    fix_e306 = fix_e301
+    fix_e703 = fix_e702
+    fix_w293 = fix_w291
+
+
+FIXER_REGEX = re.compile(r'^fix_([ew][0-9]{3})$')
+
+_fixer_tables = {}
+
+
+def get_fixers(fixer_class, long_line_logically=False):
+    """Return the fixer table of a FixPEP8 class.
+
+    The table maps each error code to a tuple of the fixer function, whether
+    it is a logical-line fix (takes a "logical" argument) and its priority
+    (see _priority_key()). Tables are built once per class, so fixing a
+    result is a dictionary lookup instead of getattr() and signature
+    inspection.
+
+    """
+    key = (fixer_class, long_line_logically)
+    fixers = _fixer_tables.get(key)
+    if fixers is None:
+        functions = {}
+        for name in dir(fixer_class):
+            match = FIXER_REGEX.match(name)
+            if match:
+                functions[match.group(1)] = getattr(fixer_class, name)
+        functions['e501'] = (
+            fixer_class.fix_long_line_logically if long_line_logically else
+            fixer_class.fix_long_line_physically)
+
+        fixers = {}
+        for (code, function) in functions.items():
+            fixers[code.upper()] = (
+                function,
+                len(_get_parameters(function)) > 2,
+                _priority_key({'id': code}))
+        _fixer_tables[key] = fixers
+    return fixers
+
 
 def get_w605_position(tokens):
     """workaround get pointing out position by W605."""
@@ -1546,22 +1647,25 @@ def get_fixed_long_line(target, previous_line, original,
     # Check for partial multiline.
     tokens = list(generate_tokens(source))
 
-    candidates = shorten_line(
-        tokens, source, indent,
-        indent_word,
-        max_line_length,
-        aggressive=aggressive,
-        experimental=experimental,
-        previous_line=previous_line)
-
-    # Also sort alphabetically as a tie breaker (for determinism).
-    candidates = sorted(
-        sorted(set(candidates).union([target, original])),
-        key=lambda x: line_shortening_rank(
-            x,
+    profile = current_profile()
+    with _timed(profile, 'E501: shorten_line'):
+        candidates = set(shorten_line(
+            tokens, source, indent,
             indent_word,
             max_line_length,
-            experimental=experimental))
+            aggressive=aggressive,
+            experimental=experimental,
+            previous_line=previous_line))
+
+    # Also sort alphabetically as a tie breaker (for determinism).
+    with _timed(profile, 'E501: rank candidates'):
+        candidates = sorted(
+            sorted(candidates.union([target, original])),
+            key=lambda x: line_shortening_rank(
+                x,
+                indent_word,
+                max_line_length,
+                experimental=experimental))
 
     if verbose >= 4:
         print(('-' * 79 + '\n').join([''] + candidates + ['']),
@@ -1621,29 +1725,10 @@ def untokenize_without_newlines(tokens):
 
 
 def _find_logical(source_lines):
-    # Make a variable which is the index of all the starts of lines.
-    logical_start = []
-    logical_end = []
-    last_newline = True
-    parens = 0
-    for t in generate_tokens(''.join(source_lines)):
-        if t[0] in [tokenize.COMMENT, tokenize.DEDENT,
-                    tokenize.INDENT, tokenize.NL,
-                    tokenize.ENDMARKER]:
-            continue
-        if not parens and t[0] in [tokenize.NEWLINE, tokenize.SEMI]:
-            last_newline = True
-            logical_end.append((t[3][0] - 1, t[2][1]))
-            continue
-        if last_newline and not parens:
-            logical_start.append((t[2][0] - 1, t[2][1]))
-            last_newline = False
-        if t[0] == tokenize.OP:
-            if t[1] in '([{':
-                parens += 1
-            elif t[1] in '}])':
-                parens -= 1
-    return (logical_start, logical_end)
+    analysis = analyze_source(''.join(source_lines))
+    if analysis.error:
+        raise analysis.error
+    return (analysis.logical_start, analysis.logical_end)
 
 
 def _get_logical(source_lines, result, logical_start, logical_end):
@@ -1654,21 +1739,24 @@ def _get_logical(source_lines, result, logical_start, logical_end):
     """
     row = result['line'] - 1
     col = result['column'] - 1
-    ls = None
-    le = None
-    for i in range(0, len(logical_start), 1):
-        assert logical_end
-        x = logical_end[i]
-        if x[0] > row or (x[0] == row and x[1] > col):
-            le = x
-            ls = logical_start[i]
-            break
-    if ls is None:
+    # The ends are sorted, so the logical line is the first one that ends
+    # after the result.
+    index = bisect.bisect_right(logical_end, (row, col))
+    if index >= min(len(logical_start), len(logical_end)):
         return None
+    ls = logical_start[index]
+    le = logical_end[index]
     original = source_lines[ls[0]:le[0] + 1]
     return ls, le, original
 
 
+def _intersects(line_numbers, start, end):
+    """Return True if any of line_numbers is within range(start, end)."""
+    if end - start <= len(line_numbers):
+        return any(line in line_numbers for line in range(start, end))
+    return any(start <= line < end for line in line_numbers)
+
+
 def get_item(items, index, default=None):
     if 0 <= index < len(items):
         return items[index]
@@ -1836,15 +1924,7 @@ def find_newline(source):
 
 def _get_indentword(source):
     """Return indentation type."""
-    indent_word = '    '  # Default in case source has no indentation
-    try:
-        for t in generate_tokens(source):
-            if t[0] == token.INDENT:
-                indent_word = t[1]
-                break
-    except (SyntaxError, tokenize.TokenError):
-        pass
-    return indent_word
+    return analyze_source(source).indent_word
 
 
 def _get_indentation(line):
@@ -1876,6 +1956,30 @@ def get_diff_text(old, new, filename):
     return text
 
 
+PRIORITY = [
+    # Fix multiline colon-based before semicolon based.
+    'e701',
+    # Break multiline statements early.
+    'e702',
+    # Things that make lines longer.
+    'e225', 'e231',
+    # Remove extraneous whitespace before breaking lines.
+    'e201',
+    # Shorten whitespace in comment before resorting to wrapping.
+    'e262'
+]
+MIDDLE_PRIORITY_INDEX = 10000
+LOWEST_PRIORITY = [
+    # We need to shorten lines last since the logical fixer can get in a
+    # loop, which causes us to exit early.
+    'e501',
+]
+_priority_indexes = dict(
+    [(code, index) for (index, code) in enumerate(PRIORITY)] +
+    [(code, MIDDLE_PRIORITY_INDEX + index + 1)
+     for (index, code) in enumerate(LOWEST_PRIORITY)])
+
+
 def _priority_key(pep8_result):
     """Key for sorting PEP8 results.
 
@@ -1883,32 +1987,8 @@ def _priority_key(pep8_result):
     indentation.
 
     """
-    priority = [
-        # Fix multiline colon-based before semicolon based.
-        'e701',
-        # Break multiline statements early.
-        'e702',
-        # Things that make lines longer.
-        'e225', 'e231',
-        # Remove extraneous whitespace before breaking lines.
-        'e201',
-        # Shorten whitespace in comment before resorting to wrapping.
-        'e262'
-    ]
-    middle_index = 10000
-    lowest_priority = [
-        # We need to shorten lines last since the logical fixer can get in a
-        # loop, which causes us to exit early.
-        'e501',
-    ]
-    key = pep8_result['id'].lower()
-    try:
-        return priority.index(key)
-    except ValueError:
-        try:
-            return middle_index + lowest_priority.index(key) + 1
-        except ValueError:
-            return middle_index
+    return _priority_indexes.get(pep8_result['id'].lower(),
+                                 MIDDLE_PRIORITY_INDEX)
 
 
 def shorten_line(tokens, source, indentation, indent_word, max_line_length,
@@ -2973,42 +3053,525 @@ def fix_whitespace(line, offset, replacement):
     return left + replacement + right
 
 
+class QuietReport(pycodestyle.BaseReport):
+
+    """Version of checker that does not print."""
+
+    def __init__(self, options):
+        super(QuietReport, self).__init__(options)
+        self.__full_error_results = []
+
+    def error(self, line_number, offset, text, check):
+        """Collect errors."""
+        code = super(QuietReport, self).error(line_number,
+                                              offset,
+                                              text,
+                                              check)
+        if code:
+            self.__full_error_results.append(
+                {'id': code,
+                 'line': line_number,
+                 'column': offset + 1,
+                 'info': text})
+
+    def full_error_results(self):
+        """Return error results in detail.
+
+        Results are in the form of a list of dictionaries. Each
+        dictionary contains 'id', 'line', 'column', and 'info'.
+
+        """
+        return self.__full_error_results
+
+
+class StyleGuideCache(object):
+
+    """A cache of compiled pycodestyle.StyleGuide objects.
+
+    Building a StyleGuide parses the options, reads the user configuration
+    and collects the registered checks. None of that depends on the source
+    being checked, so a compiled guide is shared by every pass of
+    fix_lines() and by later calls with the same options.
+
+    """
+
+    max_size = 16
+
+    def __init__(self):
+        self.style_guides = {}
+
+    def get(self, pep8_options):
+        """Return a StyleGuide compiled for pep8_options."""
+        key = self._key(pep8_options)
+        style_guide = self.style_guides.get(key)
+        if style_guide is None:
+            if len(self.style_guides) >= self.max_size:
+                self.style_guides.clear()
+            style_guide = pycodestyle.StyleGuide(pep8_options,
+                                                 reporter=QuietReport)
+            self.style_guides[key] = style_guide
+        return style_guide
+
+    def clear(self):
+        self.style_guides.clear()
+
+    @staticmethod
+    def _key(pep8_options):
+        key = []
+        for name, value in sorted(pep8_options.items()):
+            if isinstance(value, (set, frozenset, list, tuple)):
+                value = tuple(sorted(value))
+            key.append((name, value))
+        # The user configuration is read while compiling, so it has to be
+        # recompiled once the file is edited.
+        try:
+            config_mtime = os.path.getmtime(pycodestyle.USER_CONFIG)
+        except (OSError, TypeError):
+            config_mtime = None
+        key.append(('user_config_mtime', config_mtime))
+        return tuple(key)
+
+
+_style_guide_cache = StyleGuideCache()
+
+
 def _execute_pep8(pep8_options, source):
     """Execute pycodestyle via python method calls."""
-    class QuietReport(pycodestyle.BaseReport):
+    with _timed(current_profile(), 'pycodestyle'):
+        style_guide = _style_guide_cache.get(pep8_options)
+        checker = pycodestyle.Checker('', lines=source,
+                                      options=style_guide.options,
+                                      report=QuietReport(style_guide.options))
+        checker.check_all()
+    return checker.report.full_error_results()
 
-        """Version of checker that does not print."""
 
-        def __init__(self, options):
-            super(QuietReport, self).__init__(options)
-            self.__full_error_results = []
+CheckerSnapshot = collections.namedtuple(
+    'CheckerSnapshot', ['line', 'result_index', 'reach', 'state'])
 
-        def error(self, line_number, offset, text, check):
-            """Collect errors."""
-            code = super(QuietReport, self).error(line_number,
-                                                  offset,
-                                                  text,
-                                                  check)
-            if code:
-                self.__full_error_results.append(
-                    {'id': code,
-                     'line': line_number,
-                     'column': offset + 1,
-                     'info': text})
 
-        def full_error_results(self):
-            """Return error results in detail.
+class TrackedLines(object):
 
-            Results are in the form of a list of dictionaries. Each
-            dictionary contains 'id', 'line', 'column', and 'info'.
+    """Read-only view of the source lines that records which lines are read.
 
-            """
-            return self.__full_error_results
+    IncrementalChecker passes it to the checks taking the "lines" argument,
+    so that a result depending on lines outside of its own logical line is
+    re-checked once any of those lines change.
 
-    checker = pycodestyle.Checker('', lines=source, reporter=QuietReport,
-                                  **pep8_options)
-    checker.check_all()
-    return checker.report.full_error_results()
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.reset()
+
+    def reset(self):
+        self.low = None
+        self.high = None
+
+    def _touch(self, low, high):
+        if self.low is None or low < self.low:
+            self.low = low
+        if self.high is None or high > self.high:
+            self.high = high
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        if self.lines:
+            self._touch(0, len(self.lines) - 1)
+        return iter(self.lines)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(*index.indices(len(self.lines)))
+            if indices:
+                self._touch(min(indices[0], indices[-1]),
+                            max(indices[0], indices[-1]))
+        elif -len(self.lines) <= index < len(self.lines):
+            index %= len(self.lines)
+            self._touch(index, index)
+        return self.lines[index]
+
+
+class IncrementalChecker(pycodestyle.Checker):
+
+    """pycodestyle.Checker that can resume from a logical line boundary.
+
+    The source is checked from a list of tokens produced up front instead
+    of being tokenized while checking. After every logical line, the
+    checker state is recorded as a CheckerSnapshot together with the lines
+    the checks of that line depended on. recheck() uses the snapshots of
+    a previous run to restore the state in front of each modified region of
+    a new version of the source and only checks until the state matches
+    the previous run again.
+
+    """
+
+    def __init__(self, lines, tokens, options, report):
+        super(IncrementalChecker, self).__init__('', lines=lines,
+                                                 options=options,
+                                                 report=report)
+        self.source_tokens = tokens
+        self.tracked_lines = TrackedLines(self.lines)
+        self._physical_checks = self._track_lines(self._physical_checks)
+        self._logical_checks = self._track_lines(self._logical_checks)
+        self.snapshots = []
+
+    @staticmethod
+    def _track_lines(checks):
+        return [(name, check, ['tracked_lines' if argument == 'lines'
+                               else argument for argument in arguments])
+                for (name, check, arguments) in checks]
+
+    def check_all(self, expected=None, line_offset=0):
+        """Run all checks on the input file."""
+        self._init_file(expected, line_offset)
+        self._restore(1, self._initial_state())
+        self._boundary(1)
+        self._check_tokens(0)
+        return self.report.get_file_results()
+
+    def recheck(self, snapshots, results, changes):
+        """Check the input file reusing the results of a previous run.
+
+        "snapshots" and "results" come from the run over the previous
+        version of the source, and "changes" is a LineChanges object
+        mapping the previous version to the current one.
+
+        """
+        self._init_file()
+        new_results = self.report.full_error_results()
+        token_rows = [t[2][0] for t in self.source_tokens]
+
+        # A segment (the lines between two snapshots) can be reused only if
+        # none of the lines it depended on have changed.
+        reusable = [index > 0 and not changes.intersects(*snapshot.reach)
+                    for (index, snapshot) in enumerate(snapshots)]
+        snapshot_at = {}
+        for (index, snapshot) in enumerate(snapshots):
+            line = changes.map_boundary(snapshot.line)
+            if line is not None:
+                snapshot_at[line] = index
+
+        def converge(snapshot):
+            index = snapshot_at.get(snapshot.line)
+            if (
+                index is not None and
+                snapshots[index].state == snapshot.state
+            ):
+                return index
+            return None
+
+        self._restore(1, self._initial_state())
+        self._boundary(1)
+        start = 0
+        while True:
+            end = start
+            while end + 1 < len(snapshots) and reusable[end + 1]:
+                end += 1
+
+            line_delta = (changes.map_boundary(snapshots[start].line) -
+                          snapshots[start].line)
+            index_delta = len(new_results) - snapshots[start].result_index
+            for result in results[snapshots[start].result_index:
+                                  snapshots[end].result_index]:
+                if line_delta:
+                    result = dict(result, line=result['line'] + line_delta)
+                new_results.append(result)
+            for snapshot in snapshots[start + 1:end + 1]:
+                self.snapshots.append(CheckerSnapshot(
+                    snapshot.line + line_delta,
+                    snapshot.result_index + index_delta,
+                    (snapshot.reach[0] + line_delta,
+                     snapshot.reach[1] + line_delta),
+                    snapshot.state))
+
+            if end + 1 == len(snapshots):
+                break
+
+            line = changes.map_boundary(snapshots[end].line)
+            self._restore(line, snapshots[end].state)
+            start = self._check_tokens(bisect.bisect_left(token_rows, line),
+                                       converge)
+            if start is None:
+                break
+
+        return self.report.get_file_results()
+
+    def _init_file(self, expected=None, line_offset=0):
+        self.report.init_file(self.filename, self.lines, expected, line_offset)
+        self.total_lines = len(self.lines)
+        if self._ast_checks:
+            self.check_ast()
+
+    def _initial_state(self):
+        return (None, 0, 0, '', '', 0, 0, (), {})
+
+    def _state(self):
+        return (self.indent_char,
+                self.indent_level,
+                self.previous_indent_level,
+                self.previous_logical,
+                self.previous_unindented_logical_line,
+                self.blank_lines,
+                self.blank_before,
+                tuple(self.indent_stack),
+                {name: dict(state)
+                 for (name, state) in self._checker_states.items()})
+
+    def _restore(self, line, state):
+        (self.indent_char,
+         self.indent_level,
+         self.previous_indent_level,
+         self.previous_logical,
+         self.previous_unindented_logical_line,
+         self.blank_lines,
+         self.blank_before,
+         indent_stack,
+         checker_states) = state
+        self.indent_stack = list(indent_stack)
+        self._checker_states = {name: dict(state)
+                                for (name, state) in checker_states.items()}
+        self.line_number = line - 1
+        self.tokens = []
+        self.tracked_lines.reset()
+        self._segment_start = line
+
+    def _boundary(self, line, converge=None):
+        """Record a snapshot in front of "line"."""
+        if self.snapshots:
+            low, high = self._segment_start, line - 1
+            if self.tracked_lines.low is not None:
+                low = min(low, self.tracked_lines.low + 1)
+                high = max(high, self.tracked_lines.high + 1)
+            reach = (low, high)
+        else:
+            reach = None
+        snapshot = CheckerSnapshot(line,
+                                   len(self.report.full_error_results()),
+                                   reach,
+                                   self._state())
+        self.snapshots.append(snapshot)
+        self.tracked_lines.reset()
+        self._segment_start = line
+        return converge(snapshot) if converge else None
+
+    def _readline_until(self, row):
+        """Advance line_number like pycodestyle.Checker.readline() does."""
+        row = min(row, self.total_lines)
+        while self.line_number < row:
+            line = self.lines[self.line_number]
+            self.line_number += 1
+            if self.indent_char is None and line[:1] in pycodestyle.WHITESPACE:
+                self.indent_char = line[0]
+
+    def _check_tokens(self, index, converge=None):
+        """Run the checks from the token at "index".
+
+        This mirrors pycodestyle.Checker.check_all(). Returns the value of
+        "converge" once it is true for a snapshot, or None at the end of
+        the file.
+
+        """
+        tokens = self.source_tokens
+        parens = 0
+        while index < len(tokens):
+            token = tokens[index]
+            index += 1
+            if token[2][0] > self.total_lines:
+                break
+            self._readline_until(token[3][0])
+            self.noqa = token[4] and pycodestyle.noqa(token[4])
+            self.maybe_check_physical(token)
+            self.tokens.append(token)
+            token_type, text = token[0:2]
+            if token_type == tokenize.OP:
+                if text in '([{':
+                    parens += 1
+                elif text in '}])':
+                    parens -= 1
+            elif token_type == tokenize.INDENT:
+                self.indent_stack.append(text)
+            elif token_type == tokenize.DEDENT:
+                self.indent_stack.pop()
+            elif not parens and token_type in pycodestyle.NEWLINE:
+                if token_type == tokenize.NEWLINE:
+                    self.check_logical()
+                    self.blank_before = 0
+                elif len(self.tokens) == 1:
+                    # The physical line contains only this token.
+                    self.blank_lines += 1
+                    del self.tokens[0]
+                    continue
+                else:
+                    self.check_logical()
+                converged = self._boundary(token[2][0] + 1, converge)
+                if converged is not None:
+                    return converged
+        if self.tokens:
+            self.check_physical(self.lines[-1])
+            self.check_logical()
+        self._boundary(self.total_lines + 1)
+        return None
+
+
+class LineChanges(object):
+
+    """Map the lines of a source to the lines of its fixed version.
+
+    "original_lines" and "fixed_lines" are parallel lists as FixPEP8 keeps
+    them: each item of "fixed_lines" replaces the item of "original_lines"
+    at the same index and may hold any number of lines.
+
+    """
+
+    def __init__(self, original_lines, fixed_lines):
+        fixed_lines = list(fixed_lines)
+        if len(fixed_lines) > len(original_lines) > 0:
+            fixed_lines[len(original_lines) - 1:] = [
+                ''.join(fixed_lines[len(original_lines) - 1:])]
+        fixed_lines += [''] * (len(original_lines) - len(fixed_lines))
+
+        self.text = ''.join(fixed_lines)
+        # Line numbers are indexed at 1; None marks a changed line.
+        self.line_map = [None] * (len(original_lines) + 1)
+        self.changed = []
+
+        new_line = 1
+        at_line_start = True
+        for (line_number, (original, fixed)) in enumerate(
+                zip(original_lines, fixed_lines), 1):
+            if at_line_start and fixed == original:
+                self.line_map[line_number] = new_line
+            else:
+                self.changed.append(line_number)
+            new_line += fixed.count('\n')
+            if fixed:
+                at_line_start = fixed.endswith('\n')
+
+        # Some checks depend on which line is the last one (W391, W292),
+        # so the line in front of a changed end of file counts as changed.
+        if self.changed and self.changed[-1] == len(original_lines):
+            line_number = len(original_lines)
+            while line_number > 0 and self.line_map[line_number] is None:
+                line_number -= 1
+            if line_number > 0:
+                self.line_map[line_number] = None
+                bisect.insort(self.changed, line_number)
+
+    def map_boundary(self, line):
+        """Return the new line number for the start of an original line.
+
+        Return None if the line in front of it was changed.
+
+        """
+        if line == 1:
+            return 1
+        new_line = self.line_map[line - 1]
+        return None if new_line is None else new_line + 1
+
+    def intersects(self, low, high):
+        """Return True if any line in the inclusive range was changed."""
+        index = bisect.bisect_left(self.changed, low)
+        return index < len(self.changed) and self.changed[index] <= high
+
+
+class IncrementalPep8(object):
+
+    """Run pycodestyle over successive versions of the same source.
+
+    fix_lines() checks the source once per pass, but a pass usually changes
+    only a few lines. FixPEP8 reports what it changed with record_fixes(),
+    and the next check() re-checks only the logical lines around those
+    changes, reusing the previous results for everything else.
+
+    """
+
+    def __init__(self, pep8_options):
+        self.pep8_options = pep8_options
+        self.text = None
+        self.lines = None
+        self.results = None
+        self.snapshots = None
+        self.changes = None
+
+    def check(self, source_lines):
+        """Return pycodestyle results for source_lines."""
+        text = ''.join(source_lines)
+        if text == self.text:
+            return list(self.results)
+
+        changes = self.changes
+        if changes is not None and changes.text != text:
+            changes = None
+        self.changes = None
+
+        analysis = analyze_source(text)
+        if analysis.error or text[:1] in ('\ufeff', '\xef'):
+            # Let pycodestyle report the error (or strip the BOM) itself.
+            results = _execute_pep8(self.pep8_options, source_lines)
+            snapshots = None
+        else:
+            with _timed(current_profile(), 'pycodestyle (incremental)'):
+                style_guide = _style_guide_cache.get(self.pep8_options)
+                checker = IncrementalChecker(
+                    source_lines, analysis.tokens, style_guide.options,
+                    QuietReport(style_guide.options))
+                if changes is None or self.snapshots is None:
+                    checker.check_all()
+                else:
+                    checker.recheck(self.snapshots, self.results, changes)
+                results = checker.report.full_error_results()
+                snapshots = checker.snapshots
+
+        self.text = text
+        self.lines = list(source_lines)
+        self.results = results
+        self.snapshots = snapshots
+        return list(results)
+
+    def record_fixes(self, original_lines, fixed_lines):
+        """Remember the lines that were changed since the last check()."""
+        if self.text is not None and ''.join(original_lines) == self.text:
+            self.changes = LineChanges(original_lines, fixed_lines)
+        else:
+            self.changes = None
+
+    def record_edit(self, source_lines):
+        """Remember how source_lines differ from the last check().
+
+        Unlike record_fixes(), the changed lines are found by comparing
+        both versions, so it works for text edited in an editor. The lines
+        between the first and the last difference count as changed.
+
+        """
+        original_lines = self.lines
+        if not original_lines:
+            self.changes = None
+            return
+
+        limit = min(len(original_lines), len(source_lines))
+        start = 0
+        while (start < limit and
+               original_lines[start] == source_lines[start]):
+            start += 1
+        end = 0
+        while (end < limit - start and
+               original_lines[-1 - end] == source_lines[-1 - end]):
+            end += 1
+
+        changed = ''.join(source_lines[start:len(source_lines) - end])
+        fixed_lines = list(original_lines)
+        if start < len(original_lines) - end:
+            fixed_lines[start:len(original_lines) - end] = (
+                [changed] + [''] * (len(original_lines) - end - start - 1))
+        elif start < len(original_lines):
+            # Lines were only inserted: attach them to the next line.
+            fixed_lines[start] = changed + fixed_lines[start]
+        else:
+            fixed_lines[-1] += changed
+        self.changes = LineChanges(original_lines, fixed_lines)
 
 
 def _remove_leading_and_normalize(line):
@@ -3216,10 +3779,10 @@ def refactor_with_2to3(source_text, fixer_names, filename=''):
         return source_text
 
 
-def check_syntax(code):
+def check_syntax(code, filename='<string>'):
     """Return True if syntax is okay."""
     try:
-        return compile(code, '<string>', 'exec', dont_inherit=True)
+        return compile(code, filename, 'exec', dont_inherit=True)
     except (SyntaxError, TypeError, ValueError):
         return False
 
@@ -3263,15 +3826,17 @@ def get_disabled_ranges(source):
     If disabled and no re-enable will disable for rest of file.
 
     """
-    enable_line_nums = find_with_line_numbers(ENABLE_REGEX, source)
-    disable_line_nums = find_with_line_numbers(DISABLE_REGEX, source)
-    total_lines = len(re.findall("\n", source)) + 1
-
     enable_commands = {}
-    for num in enable_line_nums:
-        enable_commands[num] = True
-    for num in disable_line_nums:
-        enable_commands[num] = False
+    line_number = 1
+    position = 0
+    for match in ENABLE_DISABLE_REGEX.finditer(source):
+        line_number += source.count('\n', position, match.start())
+        position = match.start()
+        if match.group(2) == 'off':
+            enable_commands[line_number] = False
+        else:
+            enable_commands.setdefault(line_number, True)
+    total_lines = source.count('\n', position) + line_number
 
     disabled_ranges = []
     currently_enabled = True
@@ -3286,31 +3851,55 @@ def get_disabled_ranges(source):
             currently_enabled = True
 
     if currently_enabled is False:
-        disabled_ranges.append((disabled_start, total_lines))
+        # Up to the last line, also when it does not end with a newline.
+        disabled_ranges.append((disabled_start, total_lines + 1))
 
     return disabled_ranges
 
 
+class LineRanges(object):
+
+    """Sorted, non-overlapping ranges of line numbers.
+
+    Each range is a (start, end) tuple like the arguments of range().
+    Membership is looked up with bisect.
+
+    """
+
+    def __init__(self, ranges):
+        self.starts = [start for (start, _) in ranges]
+        self.ends = [end for (_, end) in ranges]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, line):
+        index = bisect.bisect_right(self.starts, line) - 1
+        return index >= 0 and line < self.ends[index]
+
+    def exclude(self, results):
+        """Return the results whose line is not within any range."""
+        return [result for result in results if result['line'] not in self]
+
+
 def filter_results(source, results, aggressive):
     """Filter out spurious reports from pycodestyle.
 
     If aggressive is True, we allow possibly unsafe fixes (E711, E712).
 
     """
-    non_docstring_string_line_numbers = multiline_string_lines(
-        source, include_docstrings=False)
-    all_string_line_numbers = multiline_string_lines(
-        source, include_docstrings=True)
+    analysis = analyze_source(source)
+    non_docstring_string_line_numbers = (
+        analysis.non_docstring_string_line_numbers)
+    all_string_line_numbers = analysis.string_line_numbers
 
-    commented_out_code_line_numbers = commented_out_code_lines(source)
+    commented_out_code_line_numbers = (
+        analysis.commented_out_code_line_numbers)
 
     # Filter out the disabled ranges
-    disabled_ranges = get_disabled_ranges(source)
-    if len(disabled_ranges) > 0:
-        results = [result for result in results
-                   if any(result['line'] not in range(*disabled_range)
-                          for disabled_range in disabled_ranges)
-                   ]
+    disabled_ranges = analysis.disabled_ranges
+    if disabled_ranges:
+        results = disabled_ranges.exclude(results)
 
     has_e901 = any(result['id'].lower() == 'e901' for result in results)
 
@@ -3367,28 +3956,10 @@ def multiline_string_lines(source, include_docstrings=False):
     Docstrings are ignored.
 
     """
-    line_numbers = set()
-    previous_token_type = ''
-    try:
-        for t in generate_tokens(source):
-            token_type = t[0]
-            start_row = t[2][0]
-            end_row = t[3][0]
-
-            if token_type == tokenize.STRING and start_row != end_row:
-                if (
-                    include_docstrings or
-                    previous_token_type != tokenize.INDENT
-                ):
-                    # We increment by one since we want the contents of the
-                    # string.
-                    line_numbers |= set(range(1 + start_row, 1 + end_row))
-
-            previous_token_type = token_type
-    except (SyntaxError, tokenize.TokenError):
-        pass
-
-    return line_numbers
+    analysis = analyze_source(source)
+    if include_docstrings:
+        return set(analysis.string_line_numbers)
+    return set(analysis.non_docstring_string_line_numbers)
 
 
 def commented_out_code_lines(source):
@@ -3398,36 +3969,109 @@ def commented_out_code_lines(source):
     more clutter.
 
     """
-    line_numbers = []
-    try:
-        for t in generate_tokens(source):
+    return list(analyze_source(source).commented_out_code_line_numbers)
+
+
+class SourceAnalysis(object):
+
+    """Token based information about one version of a source.
+
+    The source is tokenized once and everything FixPEP8 and
+    filter_results() need from the tokens (logical lines, multiline
+    strings, commented-out code and the indentation word) is collected in
+    the same loop. If the source can not be tokenized, "error" holds the
+    exception and the line number collections are empty.
+
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.tokens = None
+        self.error = None
+        self.logical_start = []
+        self.logical_end = []
+        self.string_line_numbers = frozenset()
+        self.non_docstring_string_line_numbers = frozenset()
+        self.commented_out_code_line_numbers = []
+        self.indent_word = '    '  # Default in case source has no indentation
+        self._disabled_ranges = None
+        try:
+            self.tokens = generate_tokens(source)
+        except (SyntaxError, tokenize.TokenError) as error:
+            self.error = error
+        else:
+            self._analyze()
+
+    @property
+    def disabled_ranges(self):
+        """Return the "autopep8: off" ranges as LineRanges."""
+        if self._disabled_ranges is None:
+            self._disabled_ranges = LineRanges(get_disabled_ranges(self.source))
+        return self._disabled_ranges
+
+    def _analyze(self):
+        string_line_numbers = set()
+        non_docstring_string_line_numbers = set()
+        comments = []
+        has_indent_word = False
+        previous_token_type = ''
+        last_newline = True
+        parens = 0
+        for t in self.tokens:
             token_type = t[0]
-            token_string = t[1]
             start_row = t[2][0]
-            line = t[4]
+            end_row = t[3][0]
 
-            # Ignore inline comments.
-            if not line.lstrip().startswith('#'):
-                continue
+            if token_type == tokenize.INDENT and not has_indent_word:
+                self.indent_word = t[1]
+                has_indent_word = True
 
-            if token_type == tokenize.COMMENT:
-                stripped_line = token_string.lstrip('#').strip()
-                with warnings.catch_warnings():
-                    # ignore SyntaxWarning in Python3.8+
-                    # refs:
-                    #   https://bugs.python.org/issue15248
-                    #   https://docs.python.org/3.8/whatsnew/3.8.html#other-language-changes
-                    warnings.filterwarnings("ignore", category=SyntaxWarning)
-                    if (
-                        ' ' in stripped_line and
-                        '#' not in stripped_line and
-                        check_syntax(stripped_line)
-                    ):
-                        line_numbers.append(start_row)
-    except (SyntaxError, tokenize.TokenError):
-        pass
+            if token_type == tokenize.STRING and start_row != end_row:
+                # We increment by one since we want the contents of the
+                # string.
+                rows = range(1 + start_row, 1 + end_row)
+                string_line_numbers.update(rows)
+                if previous_token_type != tokenize.INDENT:
+                    non_docstring_string_line_numbers.update(rows)
+            previous_token_type = token_type
 
-    return line_numbers
+            # Ignore inline comments.
+            if (
+                token_type == tokenize.COMMENT and
+                t[4].lstrip().startswith('#')
+            ):
+                comments.append((start_row, t[1]))
+
+            # Make a variable which is the index of all the starts of lines.
+            if token_type in [tokenize.COMMENT, tokenize.DEDENT,
+                              tokenize.INDENT, tokenize.NL,
+                              tokenize.ENDMARKER]:
+                continue
+            if not parens and token_type in [tokenize.NEWLINE, tokenize.SEMI]:
+                last_newline = True
+                self.logical_end.append((t[3][0] - 1, t[2][1]))
+                continue
+            if last_newline and not parens:
+                self.logical_start.append((t[2][0] - 1, t[2][1]))
+                last_newline = False
+            if token_type == tokenize.OP:
+                if t[1] in '([{':
+                    parens += 1
+                elif t[1] in '}])':
+                    parens -= 1
+
+        self.string_line_numbers = frozenset(string_line_numbers)
+        self.non_docstring_string_line_numbers = frozenset(
+            non_docstring_string_line_numbers)
+
+        for (start_row, token_string) in comments:
+            stripped_line = token_string.lstrip('#').strip()
+            if (
+                ' ' in stripped_line and
+                '#' not in stripped_line and
+                check_syntax(stripped_line, COMMENT_FILENAME)
+            ):
+                self.commented_out_code_line_numbers.append(start_row)
 
 
 def shorten_comment(line, max_line_length, last_comment=False):
@@ -3495,19 +4139,295 @@ def code_match(code, select, ignore):
     return True
 
 
+class Profile(object):
+
+    """Call counts and cumulative wall time of the stages of a run.
+
+    The stages are only timed in a thread that runs within profiling().
+    Otherwise each instrumented call site costs one thread-local lookup
+    and an empty with block.
+
+    """
+
+    def __init__(self):
+        # {stage: [calls, seconds]}
+        self.stats = {}
+
+    def add(self, stage, seconds, calls=1, args=None):
+        """Record a stage which has just ended.
+
+        args describes this call of the stage, e.g. the file name; only
+        Trace keeps it.
+
+        """
+        entry = self.stats.get(stage)
+        if entry is None:
+            self.stats[stage] = [calls, seconds]
+        else:
+            entry[0] += calls
+            entry[1] += seconds
+
+    def merge(self, other):
+        """Add the stats of another Profile, e.g. from a worker process."""
+        for (stage, (calls, seconds)) in other.stats.items():
+            Profile.add(self, stage, seconds, calls)
+
+    def report(self):
+        """Return the stages as a table, the slowest first."""
+        width = max([len(stage) for stage in self.stats] + [5])
+        lines = ['{0:<{width}} {1:>8} {2:>12}'.format(
+            'stage', 'calls', 'total (ms)', width=width)]
+        for (stage, (calls, seconds)) in sorted(
+                self.stats.items(), key=lambda item: -item[1][1]):
+            lines.append('{0:<{width}} {1:>8} {2:>12.1f}'.format(
+                stage, calls, seconds * 1000, width=width))
+        return '\n'.join(lines) + '\n'
+
+
+class Trace(Profile):
+
+    """Profile which also keeps every stage as a span of a trace.
+
+    write() saves the spans in the Chrome Trace Event format, which trace
+    viewers (chrome://tracing, Perfetto) show as nested bars per process
+    and thread: a file contains its passes, a pass its pycodestyle check
+    and fixers.
+
+    """
+
+    def __init__(self):
+        Profile.__init__(self)
+        self.events = []
+
+    def add(self, stage, seconds, calls=1, args=None):
+        Profile.add(self, stage, seconds, calls)
+        # Wall clock time, so spans of worker processes line up.
+        end = time.time()
+        event = {'name': stage, 'ph': 'X',
+                 'ts': int((end - seconds) * 1e6),
+                 'dur': int(seconds * 1e6),
+                 'pid': os.getpid(),
+                 'tid': threading.current_thread().ident}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def merge(self, other):
+        Profile.merge(self, other)
+        self.events.extend(getattr(other, 'events', []))
+
+    def write(self, filename):
+        """Save the spans as a Chrome Trace Event JSON file."""
+        main_pid = os.getpid()
+        metadata = [
+            {'name': 'process_name', 'ph': 'M', 'pid': pid,
+             'args': {'name': 'autopep8' if pid == main_pid
+                      else 'autopep8 worker {0}'.format(pid)}}
+            for pid in sorted(set(event['pid'] for event in self.events))]
+        with open(filename, 'w') as output:
+            json.dump({'traceEvents': metadata + self.events,
+                       'displayTimeUnit': 'ms'}, output)
+
+
+_profile_state = threading.local()
+
+
+def current_profile():
+    """Return the Profile of the running thread or None."""
+    return getattr(_profile_state, 'profile', None)
+
+
+class _Timer(object):
+
+    """Add the time spent in a with block to a Profile as stage."""
+
+    __slots__ = ('profile', 'stage', 'args', 'start')
+
+    def __init__(self, profile, stage, args=None):
+        self.profile = profile
+        self.stage = stage
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+
+    def __exit__(self, *exc_info):
+        self.profile.add(self.stage, timeit.default_timer() - self.start,
+                         args=self.args)
+
+
+class _NullTimer(object):
+
+    """Stand-in for _Timer when nothing is profiled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _timed(profile, stage, args=None):
+    """Return a context manager which adds its time to profile as stage.
+
+    The clock is not read when profile is None.
+
+    """
+    if profile is None:
+        return _NULL_TIMER
+    return _Timer(profile, stage, args)
+
+
+@contextlib.contextmanager
+def profiling(profile):
+    """Record the stages run in this thread into profile (if not None)."""
+    previous = current_profile()
+    _profile_state.profile = profile
+    try:
+        yield profile
+    finally:
+        _profile_state.profile = previous
+
+
+# Fixed source code and the issues left in it. "not_fixed" lists the
+# pycodestyle results ({'id', 'line', 'column', 'info'}, with lines of the
+# fixed source) of the last pass that a fixer was tried on but could not
+# fix: what "--verbose --verbose" reports as "Not fixing".
+FixResult = collections.namedtuple('FixResult', ['source', 'not_fixed'])
+
+
 def fix_code(source, options=None, encoding=None, apply_config=False):
     """Return fixed source code.
 
     "encoding" will be used to decode "source" if it is a byte string.
 
     """
+    return fix_code_result(source, options, encoding, apply_config).source
+
+
+def fix_code_result(source, options=None, encoding=None, apply_config=False):
+    """Return a FixResult of source, see fix_code()."""
     options = _get_options(options, apply_config)
 
     if not isinstance(source, unicode):
         source = source.decode(encoding or get_encoding())
 
     sio = io.StringIO(source)
-    return fix_lines(sio.readlines(), options=options)
+    return fix_lines_result(sio.readlines(), options=options)
+
+
+def fix_line_ranges(source, line_ranges, options):
+    """Return source with only the lines within line_ranges fixed.
+
+    line_ranges are inclusive (start, end) line numbers, as --line-range.
+    Each range is widened to whole logical lines. The fixer only runs on
+    the top-level statements around the ranges, from the one before the
+    range so that blank lines in front of a definition are checked too,
+    so the cost does not depend on the size of the file. As with
+    --line-range, global fixes are not applied.
+
+    """
+    return fix_line_ranges_result(source, line_ranges, options).source
+
+
+def fix_line_ranges_result(source, line_ranges, options):
+    """Return a FixResult of source, see fix_line_ranges()."""
+    if not line_ranges:
+        return FixResult(source, [])
+
+    source_lines = io.StringIO(source).readlines()
+    analysis = analyze_source(''.join(
+        normalize_line_endings(source_lines, '\n')))
+    if analysis.error or analysis.disabled_ranges:
+        # Without tokens there are no statements to split on, and the
+        # fixer has to see the "autopep8: off" comments.
+        fragments = [(1, len(source_lines), sorted(line_ranges))]
+    else:
+        fragments = _line_range_fragments(source_lines, line_ranges,
+                                          analysis)
+
+    not_fixed = []
+    for (start, end, ranges) in reversed(fragments):
+        fragment_options = copy.copy(options)
+        fragment_options.line_range = None
+        fragment_options.line_ranges = [
+            [range_start - start + 1, range_end - start + 1]
+            for (range_start, range_end) in ranges]
+        # Line numbers in the report would be relative to the fragment.
+        fragment_options.verbose = 0
+        result = fix_lines_result(source_lines[start - 1:end],
+                                  fragment_options)
+        fixed_lines = io.StringIO(result.source).readlines()
+        # The fragments below move with the lines added or removed here.
+        delta = len(fixed_lines) - (end - start + 1)
+        not_fixed = [dict(issue, line=issue['line'] + start - 1)
+                     for issue in result.not_fixed] + [
+            dict(issue, line=issue['line'] + delta) for issue in not_fixed]
+        source_lines[start - 1:end] = fixed_lines
+
+    return FixResult(''.join(source_lines), not_fixed)
+
+
+def _line_range_fragments(source_lines, line_ranges, analysis):
+    """Return (start, end, ranges) of the fragments to fix.
+
+    A fragment starts and ends at top-level statements, so it can be
+    checked on its own. Trailing blank lines are left out of a fragment
+    unless it ends the file, else they would look like W391, and the
+    ranges are cut to the fragment.
+
+    """
+    logical_start = [(row + 1, col) for (row, col) in analysis.logical_start]
+    logical_end = [(row + 1, col) for (row, col) in analysis.logical_end]
+    top_level = [row for (row, col) in logical_start if col == 0]
+    total = len(source_lines)
+
+    fragments = []
+    for (range_start, range_end) in sorted(line_ranges):
+        range_start = max(range_start, 1)
+        range_end = min(range_end, total)
+        if range_start > range_end:
+            continue
+
+        # Widen the range to whole logical lines.
+        index = bisect.bisect_left(logical_end, (range_start, 0))
+        if (index < len(logical_start) and
+                logical_start[index][0] <= range_start):
+            range_start = logical_start[index][0]
+        index = bisect.bisect_left(logical_end, (range_end, 0))
+        if (index < len(logical_start) and
+                logical_start[index][0] <= range_end):
+            range_end = max(range_end, logical_end[index][0])
+
+        index = bisect.bisect_left(top_level, range_start)
+        start = top_level[index - 1] if index else 1
+        index = bisect.bisect_right(top_level, range_end)
+        if index < len(top_level):
+            end = top_level[index] - 1
+            while end > start and not source_lines[end - 1].strip():
+                end -= 1
+            range_end = min(range_end, end)
+            if range_start > range_end:
+                continue
+        else:
+            end = total
+
+        if fragments and start <= fragments[-1][1] + 1:
+            (previous_start, previous_end, ranges) = fragments.pop()
+            start = previous_start
+            end = max(end, previous_end)
+        else:
+            ranges = []
+        ranges.append((range_start, range_end))
+        fragments.append((start, end, ranges))
+
+    return fragments
 
 
 def _get_options(raw_options, apply_config):
@@ -3534,8 +4454,237 @@ def _get_options(raw_options, apply_config):
     return options
 
 
+def _code_version():
+    """Return a hash of the sources of autopep8 and pycodestyle.
+
+    The vendored modules are patched without changing __version__, so the
+    cached fixes are keyed on their code. Falls back to __version__ when a
+    source can not be read, e.g. from a zipped package.
+
+    """
+    global _CODE_VERSION
+    if _CODE_VERSION is None:
+        code = hashlib.sha256()
+        try:
+            for module_file in (__file__, pycodestyle.__file__):
+                if module_file.endswith(('.pyc', '.pyo')):
+                    module_file = module_file[:-1]
+                with open(module_file, 'rb') as source:
+                    code.update(source.read())
+            _CODE_VERSION = code.hexdigest()
+        except (IOError, OSError):
+            _CODE_VERSION = __version__
+    return _CODE_VERSION
+
+
+_CODE_VERSION = None
+
+
+class FixCache(object):
+
+    """An on-disk store of fixed sources.
+
+    Fixed sources are kept in files named after a hash of the original
+    source, the options that change the output and the code of autopep8,
+    spread over 256 subdirectories. Files are written to a temporary file
+    and renamed into place, so several processes can share a store. When
+    it grows over max_size bytes, the least recently used files are
+    removed. The size is counted from the files at most every
+    recount_interval seconds, to take the writes of other processes into
+    account, and added up in between.
+
+    """
+
+    recount_interval = 60
+
+    hashed_options = ('aggressive', 'experimental', 'hang_closing',
+                      'ignore', 'indent_size', 'line_range', 'line_ranges',
+                      'max_line_length', 'pep8_passes', 'select')
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self._size = None
+        self._counted = 0
+
+    def key(self, source, options, namespace=''):
+        """Return the key of source fixed with options.
+
+        Callers which store something else than the fixed source use their
+        own namespace.
+
+        """
+        values = {}
+        for name in self.hashed_options:
+            value = getattr(options, name, None)
+            if isinstance(value, (set, frozenset, dict)):
+                value = sorted(value)
+            values[name] = value
+        # pycodestyle reads the user configuration too.
+        try:
+            values['user_config_mtime'] = os.path.getmtime(
+                pycodestyle.USER_CONFIG)
+        except (OSError, TypeError):
+            values['user_config_mtime'] = None
+
+        key = hashlib.sha256()
+        key.update('{0}\n{1}\n{2}\n'.format(
+            namespace, _code_version(),
+            sorted(values.items())).encode('utf-8'))
+        key.update(source.encode('utf-8', 'backslashreplace'))
+        return key.hexdigest()
+
+    def get(self, key):
+        """Return the text stored under key or None."""
+        filename = self._filename(key)
+        try:
+            with io.open(filename, encoding='utf-8', newline='') as cached:
+                text = cached.read()
+        except (IOError, OSError, UnicodeDecodeError):
+            return None
+        try:
+            # Recently used files are evicted last.
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return text
+
+    def put(self, key, text):
+        """Store text under key."""
+        filename = self._filename(key)
+        directory = os.path.dirname(filename)
+        data = text.encode('utf-8')
+        try:
+            replaced_size = os.path.getsize(filename)
+        except OSError:
+            replaced_size = 0
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            (fd, temp_filename) = tempfile.mkstemp(dir=directory,
+                                                   prefix='.tmp-')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as cached:
+                cached.write(data)
+            getattr(os, 'replace', os.rename)(temp_filename, filename)
+        except (IOError, OSError):
+            # Another process may hold the file on Windows.
+            _remove_file(temp_filename)
+            return
+
+        if (self._size is None or
+                time.time() - self._counted > self.recount_interval):
+            self._count(list(self._entries()))
+        else:
+            self._size += len(data) - replaced_size
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used files down to 80% of max_size.
+
+        The files are counted again first, so nothing is removed while
+        the store is not over max_size.
+
+        """
+        entries = sorted(self._entries())
+        self._count(entries)
+        if self._size <= self.max_size:
+            return
+        for (_, filename, size) in entries:
+            if self._size <= self.max_size * 0.8:
+                break
+            _remove_file(filename)
+            self._size -= size
+
+    def clear(self):
+        """Remove every stored file."""
+        for (_, filename, _) in self._entries():
+            _remove_file(filename)
+        self._size = 0
+
+    def _count(self, entries):
+        self._size = sum(size for (_, _, size) in entries)
+        self._counted = time.time()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def _entries(self):
+        """Yield (mtime, filename, size) of the stored files."""
+        try:
+            directories = os.listdir(self.path)
+        except OSError:
+            return
+        for directory in directories:
+            directory = os.path.join(self.path, directory)
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                filename = os.path.join(directory, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                yield (stat.st_mtime, filename, stat.st_size)
+
+
+def _remove_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+_fix_caches = {}
+
+
+def get_fix_cache(options):
+    """Return the FixCache selected by options or None."""
+    path = getattr(options, 'cache_dir', None)
+    if not path:
+        return None
+    max_size = getattr(options, 'cache_size', DEFAULT_CACHE_SIZE) * 1024 * 1024
+    key = (path, max_size)
+    if key not in _fix_caches:
+        _fix_caches[key] = FixCache(path, max_size)
+    return _fix_caches[key]
+
+
 def fix_lines(source_lines, options, filename=''):
     """Return fixed source code."""
+    return fix_lines_result(source_lines, options, filename).source
+
+
+def fix_lines_result(source_lines, options, filename=''):
+    """Return a FixResult of source_lines, see fix_lines()."""
+    fix_cache = get_fix_cache(options)
+    # The verbose report is not stored, so it needs a real run.
+    if fix_cache is None or options.verbose:
+        return _fix_lines(source_lines, options, filename)
+
+    key = fix_cache.key(''.join(source_lines), options)
+    cached = fix_cache.get(key)
+    if cached is not None:
+        try:
+            result = FixResult(**json.loads(cached))
+        except (TypeError, ValueError):
+            pass
+        else:
+            profile = current_profile()
+            if profile is not None:
+                profile.add('fix cache hit', 0)
+            return result
+    result = _fix_lines(source_lines, options, filename)
+    fix_cache.put(key, json.dumps(result._asdict()))
+    return result
+
+
+def _fix_lines(source_lines, options, filename):
     # Transform everything to line feed. Then change them back to original
     # before returning fixed source code.
     original_newline = find_newline(source_lines)
@@ -3544,19 +4693,21 @@ def fix_lines(source_lines, options, filename=''):
     # Keep a history to break out of cycles.
     previous_hashes = set()
 
-    if options.line_range:
+    # Passes only re-check the lines changed by the previous pass.
+    incremental_pep8 = IncrementalPep8({
+        'ignore': options.ignore,
+        'select': options.select,
+        'max_line_length': options.max_line_length,
+        'hang_closing': options.hang_closing,
+    })
+
+    if options.line_range or getattr(options, 'line_ranges', None):
         # Disable "apply_local_fixes()" for now due to issue #175.
         fixed_source = tmp_source
     else:
-        pep8_options = {
-            'ignore': options.ignore,
-            'select': options.select,
-            'max_line_length': options.max_line_length,
-            'hang_closing': options.hang_closing,
-        }
         sio = io.StringIO(tmp_source)
         contents = sio.readlines()
-        results = _execute_pep8(pep8_options, contents)
+        results = incremental_pep8.check(contents)
         codes = {result['id'] for result in results
                  if result['id'] in SELECTED_GLOBAL_FIXED_METHOD_CODES}
         # Apply global fixes only once (for efficiency).
@@ -3567,6 +4718,8 @@ def fix_lines(source_lines, options, filename=''):
 
     passes = 0
     long_line_ignore_cache = set()
+    not_fixed = []
+    profile = current_profile()
     while hash(fixed_source) not in previous_hashes:
         if options.pep8_passes >= 0 and passes > options.pep8_passes:
             break
@@ -3574,18 +4727,23 @@ def fix_lines(source_lines, options, filename=''):
 
         previous_hashes.add(hash(fixed_source))
 
-        tmp_source = copy.copy(fixed_source)
+        with _timed(profile, 'fix_lines: pass', {'pass': passes}):
+            tmp_source = copy.copy(fixed_source)
 
-        fix = FixPEP8(
-            filename,
-            options,
-            contents=tmp_source,
-            long_line_ignore_cache=long_line_ignore_cache)
+            fix = FixPEP8(
+                filename,
+                options,
+                contents=tmp_source,
+                long_line_ignore_cache=long_line_ignore_cache,
+                incremental_pep8=incremental_pep8)
 
-        fixed_source = fix.fix()
+            fixed_source = fix.fix()
+            not_fixed = fix.not_fixed
 
     sio = io.StringIO(fixed_source)
-    return ''.join(normalize_line_endings(sio.readlines(), original_newline))
+    return FixResult(
+        ''.join(normalize_line_endings(sio.readlines(), original_newline)),
+        not_fixed)
 
 
 def fix_file(filename, options=None, output=None, apply_config=False):
@@ -3602,7 +4760,12 @@ def fix_file(filename, options=None, output=None, apply_config=False):
     if output:
         output = LineEndingWrapper(wrap_output(output, encoding=encoding))
 
-    fixed_source = fix_lines(fixed_source, options, filename=filename)
+    line_ranges = getattr(options, 'line_ranges', None)
+    if line_ranges:
+        fixed_source = fix_line_ranges(''.join(fixed_source), line_ranges,
+                                       options)
+    else:
+        fixed_source = fix_lines(fixed_source, options, filename=filename)
 
     if options.diff:
         new = io.StringIO(fixed_source)
@@ -3670,12 +4833,20 @@ def apply_global_fixes(source, options, where='global', filename='',
     FixPEP8, which are dependent on pycodestyle).
 
     """
+    profile = current_profile()
+    with _timed(profile, 'apply_global_fixes'):
+        return _apply_global_fixes(source, options, where, filename, codes,
+                                   profile)
+
+
+def _apply_global_fixes(source, options, where, filename, codes, profile):
     if codes is None:
         codes = []
     if any(code_match(code, select=options.select, ignore=options.ignore)
            for code in ['E101', 'E111']):
-        source = reindent(source,
-                          indent_size=options.indent_size)
+        with _timed(profile, 'global: reindent'):
+            source = reindent(source,
+                              indent_size=options.indent_size)
 
     for (code, function) in global_fixes():
         if code.upper() in SELECTED_GLOBAL_FIXED_METHOD_CODES \
@@ -3686,16 +4857,18 @@ def apply_global_fixes(source, options, where='global', filename='',
                 print('--->  Applying {} fix for {}'.format(where,
                                                             code.upper()),
                       file=sys.stderr)
-            source = function(source,
-                              aggressive=options.aggressive)
-
-    source = fix_2to3(source,
-                      aggressive=options.aggressive,
-                      select=options.select,
-                      ignore=options.ignore,
-                      filename=filename,
-                      where=where,
-                      verbose=options.verbose)
+            with _timed(profile, 'global: ' + function.__name__):
+                source = function(source,
+                                  aggressive=options.aggressive)
+
+    with _timed(profile, 'global: lib2to3'):
+        source = fix_2to3(source,
+                          aggressive=options.aggressive,
+                          select=options.select,
+                          ignore=options.ignore,
+                          filename=filename,
+                          where=where,
+                          verbose=options.verbose)
 
     return source
 
@@ -3784,6 +4957,26 @@ def create_parser():
                         type=int, help=argparse.SUPPRESS)
     parser.add_argument('--hang-closing', action='store_true',
                         help='hang-closing option passed to pycodestyle')
+    parser.add_argument('--git-diff', metavar='ref', default=None,
+                        help='only fix the lines changed since this git '
+                             'ref, in the files changed below the given '
+                             'paths (e.g. HEAD, origin/master)')
+    parser.add_argument('--cache-dir', metavar='path', default=None,
+                        help='store fixed sources in this directory and '
+                             'reuse them for unchanged files')
+    parser.add_argument('--cache-size', metavar='n', type=int,
+                        default=DEFAULT_CACHE_SIZE,
+                        help='maximum size of the --cache-dir store in '
+                             'megabytes (default: %(default)s)')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='remove everything from the --cache-dir store '
+                             'and exit')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the call counts and the time spent in '
+                             'each stage of fixing to stderr')
+    parser.add_argument('--trace', metavar='filename',
+                        help='save the stages of fixing as a trace in the '
+                             'Chrome Trace Event format (JSON) to filename')
     parser.add_argument('--exit-code', action='store_true',
                         help='change to behavior of exit code.'
                              ' default behavior of return value, 0 is no '
@@ -3838,7 +5031,7 @@ def parse_args(arguments, apply_config=False):
     parser = create_parser()
     args = parser.parse_args(arguments)
 
-    if not args.files and not args.list_fixes:
+    if not args.files and not (args.list_fixes or args.clear_cache):
         parser.error('incorrect number of arguments')
 
     args.files = [decode_filename(name) for name in args.files]
@@ -3868,6 +5061,12 @@ def parse_args(arguments, apply_config=False):
         if args.recursive:
             parser.error('--recursive cannot be used with standard input')
 
+        if args.git_diff:
+            parser.error('--git-diff cannot be used with standard input')
+
+    if args.git_diff and args.line_range:
+        parser.error('--git-diff and --line-range are mutually exclusive')
+
     if len(args.files) > 1 and not (args.in_place or args.diff):
         parser.error('autopep8 only takes one filename as argument '
                      'unless the "--in-place" or "--diff" args are '
@@ -3882,6 +5081,12 @@ def parse_args(arguments, apply_config=False):
     if args.max_line_length <= 0:
         parser.error('--max-line-length must be greater than 0')
 
+    if args.clear_cache and not args.cache_dir:
+        parser.error('--clear-cache requires --cache-dir')
+
+    if args.cache_size <= 0:
+        parser.error('--cache-size must be greater than 0')
+
     if args.select:
         args.select = _expand_codes(
             _split_comma_separated(args.select),
@@ -4341,10 +5546,19 @@ def _fix_file(parameters):
     """Helper function for optionally running fix_file() in parallel."""
     if parameters[1].verbose:
         print('[file:{}]'.format(parameters[0]), file=sys.stderr)
-    try:
-        return fix_file(*parameters)
-    except IOError as error:
-        print(unicode(error), file=sys.stderr)
+    with _timed(current_profile(), 'file', {'filename': parameters[0]}):
+        try:
+            return fix_file(*parameters)
+        except IOError as error:
+            print(unicode(error), file=sys.stderr)
+
+
+def _profile_fix_file(parameters):
+    """Run _fix_file() in a worker process and return its Profile too."""
+    (parameters, profile_class) = parameters
+    profile = profile_class()
+    with profiling(profile):
+        return _fix_file(parameters), profile
 
 
 def fix_multiple_files(filenames, options, output=None):
@@ -4358,7 +5572,18 @@ def fix_multiple_files(filenames, options, output=None):
     if options.jobs > 1:
         import multiprocessing
         pool = multiprocessing.Pool(options.jobs)
-        ret = pool.map(_fix_file, [(name, options) for name in filenames])
+        profile = current_profile()
+        if profile is None:
+            ret = pool.map(_fix_file,
+                           [(name, options) for name in filenames])
+        else:
+            ret = []
+            for (result, worker_profile) in pool.map(
+                    _profile_fix_file,
+                    [((name, options), type(profile))
+                     for name in filenames]):
+                ret.append(result)
+                profile.merge(worker_profile)
         if options.diff:
             for r in ret:
                 sys.stdout.write(r.decode())
@@ -4381,6 +5606,83 @@ def fix_multiple_files(filenames, options, output=None):
     return results
 
 
+def _git(arguments):
+    """Return the output of git with arguments, run in the current folder."""
+    command = ['git'] + arguments
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return output.decode('utf-8', 'replace')
+
+
+def git_diff_line_ranges(paths, ref):
+    """Return {filename: line ranges} of the lines changed since ref.
+
+    The working tree is compared with ref by "git diff", and its hunks are
+    read like pycodestyle reads diffs for --diff. Python files which git
+    does not track yet are changed as a whole. Line ranges are inclusive
+    (start, end) line numbers of the current files; filenames are relative
+    to the current folder, like paths.
+
+    """
+    paths = list(paths)
+    # git names the files of a diff relative to the top of the work tree,
+    # also those outside the current folder.
+    toplevel = _git(['rev-parse', '--show-toplevel']).strip()
+    current = os.path.realpath(os.getcwd())
+    diff = _git(['diff', '-U0', '--no-color', '--no-ext-diff', ref, '--'] +
+                paths)
+
+    changed = {}
+    for filename, rows in pycodestyle.parse_udiff(
+            diff, parent=toplevel).items():
+        line_ranges = []
+        for row in sorted(rows):
+            if line_ranges and line_ranges[-1][1] == row - 1:
+                line_ranges[-1][1] = row
+            else:
+                line_ranges.append([row, row])
+        changed[os.path.relpath(filename, current)] = line_ranges
+
+    untracked = _git(['ls-files', '-z', '--others', '--exclude-standard',
+                      '--'] + paths)
+    for filename in untracked.split('\0'):
+        if filename and is_python_file(filename):
+            line_count = len(readlines_from_file(filename))
+            changed[os.path.normpath(filename)] = [[1, max(line_count, 1)]]
+    return changed
+
+
+def fix_git_diff(paths, options, output=None):
+    """Fix the lines changed since options.git_diff in the given paths."""
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        # git diff matches nothing for them and would succeed.
+        raise OSError('No such file or directory: {0}'.format(
+            ', '.join(missing)))
+    results = []
+    changed = git_diff_line_ranges(paths, options.git_diff)
+    for name in sorted(changed):
+        if not match_file(name, options.exclude):
+            continue
+        file_options = copy.copy(options)
+        file_options.line_ranges = changed[name]
+        ret = _fix_file((name, file_options, output))
+        if ret is None:
+            continue
+        if options.diff:
+            if ret != '':
+                results.append(ret)
+        elif options.in_place:
+            results.append(ret)
+        else:
+            original_source = readlines_from_file(name)
+            if "".join(original_source).splitlines() != ret.splitlines():
+                results.append(ret)
+    return results
+
+
 def is_python_file(filename):
     """Return True if filename is Python file."""
     if filename.endswith('.py'):
@@ -4450,65 +5752,177 @@ def main(argv=None, apply_config=True):
                     code=code, description=description))
             return EXIT_CODE_OK
 
-        if args.files == ['-']:
-            assert not args.in_place
+        if args.clear_cache:
+            get_fix_cache(args).clear()
+            return EXIT_CODE_OK
+
+        profile = None
+        if args.trace:
+            profile = Trace()
+        elif args.profile:
+            profile = Profile()
+        try:
+            with profiling(profile):
+                return _main(args)
+        finally:
+            if args.profile:
+                sys.stderr.write(profile.report())
+            if args.trace:
+                profile.write(args.trace)
+    except KeyboardInterrupt:
+        return EXIT_CODE_ERROR  # pragma: no cover
+
 
-            encoding = sys.stdin.encoding or get_encoding()
-            read_stdin = sys.stdin.read()
-            fixed_stdin = fix_code(read_stdin, args, encoding=encoding)
+def _main(args):
+    """Fix the files or the standard input selected by args."""
+    if args.files == ['-']:
+        assert not args.in_place
 
-            # LineEndingWrapper is unnecessary here due to the symmetry between
-            # standard in and standard out.
-            wrap_output(sys.stdout, encoding=encoding).write(fixed_stdin)
+        encoding = sys.stdin.encoding or get_encoding()
+        read_stdin = sys.stdin.read()
+        fixed_stdin = fix_code(read_stdin, args, encoding=encoding)
 
-            if hash(read_stdin) != hash(fixed_stdin):
-                if args.exit_code:
-                    return EXIT_CODE_EXISTS_DIFF
+        # LineEndingWrapper is unnecessary here due to the symmetry between
+        # standard in and standard out.
+        wrap_output(sys.stdout, encoding=encoding).write(fixed_stdin)
+
+        if hash(read_stdin) != hash(fixed_stdin):
+            if args.exit_code:
+                return EXIT_CODE_EXISTS_DIFF
+    else:
+        if args.in_place or args.diff:
+            args.files = list(set(args.files))
         else:
-            if args.in_place or args.diff:
-                args.files = list(set(args.files))
-            else:
-                assert len(args.files) == 1
-                assert not args.recursive
+            assert len(args.files) == 1
+            assert not args.recursive
 
+        if args.git_diff:
+            try:
+                results = fix_git_diff(args.files, args, sys.stdout)
+            except (OSError, subprocess.CalledProcessError) as error:
+                print(unicode(error), file=sys.stderr)
+                return EXIT_CODE_ERROR
+        else:
             results = fix_multiple_files(args.files, args, sys.stdout)
-            if args.diff:
-                ret = any([len(ret) != 0 for ret in results])
-            else:
-                # with in-place option
-                ret = any([ret is not None for ret in results])
-            if args.exit_code and ret:
-                return EXIT_CODE_EXISTS_DIFF
-    except KeyboardInterrupt:
-        return EXIT_CODE_ERROR  # pragma: no cover
+        if args.diff:
+            ret = any([len(ret) != 0 for ret in results])
+        else:
+            # with in-place option
+            ret = any([ret is not None for ret in results])
+        if args.exit_code and ret:
+            return EXIT_CODE_EXISTS_DIFF
 
 
 class CachedTokenizer(object):
 
-    """A one-element cache around tokenize.generate_tokens().
+    """A least recently used cache around tokenize.generate_tokens().
+
+    Texts are looked up by content, so the candidate lines tokenized while
+    shortening long lines don't evict the whole file tokenized for the
+    logical lines. The cache is bounded by max_entries and by max_bytes,
+    an estimate of the memory held by the cached texts and tokens, but it
+    always keeps the most recent text. It may be shared by several threads.
 
     Original code written by Ned Batchelder, in coverage.py.
 
     """
 
-    def __init__(self):
-        self.last_text = None
-        self.last_tokens = None
+    # Bytes held by one token of the list: the TokenInfo tuple, its start
+    # and end tuples, its string and its share of the line (CPython 3,
+    # 64-bit). A token list is 40-50 times the size of its text.
+    token_size = 260
+
+    def __init__(self, max_entries=256, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
 
     def generate_tokens(self, text):
         """A stand-in for tokenize.generate_tokens()."""
-        if text != self.last_text:
-            string_io = io.StringIO(text)
-            self.last_tokens = list(
-                tokenize.generate_tokens(string_io.readline)
-            )
-            self.last_text = text
-        return self.last_tokens
+        with self._lock:
+            tokens = self._entries.pop(text, None)
+            if tokens is not None:
+                self._entries[text] = tokens
+                self.hits += 1
+                return tokens
+            self.misses += 1
+
+        string_io = io.StringIO(text)
+        tokens = list(tokenize.generate_tokens(string_io.readline))
+
+        with self._lock:
+            previous = self._entries.pop(text, None)
+            if previous is not None:
+                self._size -= self._entry_size(text, previous)
+            self._size += self._entry_size(text, tokens)
+            self._entries[text] = tokens
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or
+                self._size > self.max_bytes
+            ):
+                (evicted, evicted_tokens) = self._entries.popitem(last=False)
+                self._size -= self._entry_size(evicted, evicted_tokens)
+        return tokens
+
+    def _entry_size(self, text, tokens):
+        return len(text) + len(tokens) * self.token_size
+
+    def clear(self):
+        """Drop all cached tokens and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
 
 
 _cached_tokenizer = CachedTokenizer()
 generate_tokens = _cached_tokenizer.generate_tokens
 
 
+class CachedSourceAnalysis(object):
+
+    """A one-element cache of SourceAnalysis objects.
+
+    All the consumers within one FixPEP8 pass look at the same version of
+    the source, so they share a single analysis of it.
+
+    """
+
+    def __init__(self):
+        self.last_analysis = None
+
+    def analyze(self, source):
+        """Return the SourceAnalysis of source."""
+        analysis = self.last_analysis
+        if analysis is None or analysis.source != source:
+            analysis = SourceAnalysis(source)
+            self.last_analysis = analysis
+        return analysis
+
+    def clear(self):
+        """Drop the last analysis."""
+        self.last_analysis = None
+
+
+_cached_source_analysis = CachedSourceAnalysis()
+analyze_source = _cached_source_analysis.analyze
+
+
+def clear_caches():
+    """Free the tokens and the analysis kept from the last fixes."""
+    _cached_tokenizer.clear()
+    _cached_source_analysis.clear()
+
+
+# Build the fixer tables of FixPEP8 at import time.
+get_fixers(FixPEP8)
+get_fixers(FixPEP8, long_line_logically=True)
+
+
 if __name__ == '__main__':
     sys.exit(main())
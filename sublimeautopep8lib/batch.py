@@ -0,0 +1,122 @@
+# coding=utf-8
+"""Format many files in the background."""
+
+import logging
+import threading
+
+import sublime
+
+from AutoPEP8.sublimeautopep8lib import common
+from AutoPEP8.sublimeautopep8lib import scheduler
+
+DEFAULT_FOLDER_PROCESSES = 0
+
+logger = logging.getLogger('SublimeAutoPEP8.sublimeautopep8lib.batch')
+
+
+class BatchFormatter(object):
+    """Format files as bulk jobs of the scheduler.
+
+    Each slot formats one file per job and then submits its next job, so
+    commands on the current view and format-on-save run in between.
+    Paths are taken lazily from the shared iterator and only the files in
+    flight are held in memory. With processes, every slot drives its own
+    formatter process; without them a single slot formats in place.
+    """
+
+    def __init__(self, paths, pep8_params, preview, processes=0):
+        self.paths = iter(paths)
+        self.pep8_params = pep8_params
+        self.preview = preview
+        self.processes = processes
+        self.results = []
+        self.done = 0
+        self.cancelled = False
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        sublime.status_message('AutoPEP8: formatting ...')
+        self._running = max(min(self.processes,
+                                common.get_scheduler().max_workers), 1)
+        for _ in range(self._running):
+            formatter_process = None
+            if self.processes:
+                formatter_process = common.new_formatter_process()
+            self._submit(formatter_process)
+
+    def _submit(self, formatter_process):
+        common.get_scheduler().submit(
+            lambda: self._run(formatter_process), scheduler.PRIORITY_BULK,
+            name='format files',
+            on_done=lambda job: self._next(job, formatter_process))
+
+    def _next_path(self):
+        with self._lock:
+            return next(self.paths, None)
+
+    def _run(self, formatter_process):
+        """Format the next file; return False when there is none."""
+        path = self._next_path()
+        if path is None:
+            return False
+        try:
+            command_result = self._format(path, formatter_process)
+        except (IOError, OSError, UnicodeError) as exc:
+            logger.error('Can not format %s: %s', path, exc)
+            command_result = self._failed(path, exc)
+        except Exception as exc:
+            # e.g. a tokenize error: the other files are formatted anyway.
+            logger.exception('Can not format %s.', path)
+            command_result = self._failed(path, exc)
+        self._add_result(command_result)
+        return True
+
+    @staticmethod
+    def _failed(path, exc):
+        return {'not_fixed': 'File "{0}": not formatted, {1}: {2}\n'.format(
+            path, type(exc).__name__, exc)}
+
+    def _next(self, job, formatter_process):
+        if job.cancelled:
+            self.cancelled = True
+        if job.result and not self.cancelled:
+            self._submit(formatter_process)
+            return
+        if formatter_process is not None:
+            formatter_process.stop()
+        self._stop_slot()
+
+    def _format(self, path, formatter_process):
+        with open(path, 'r') as fd:
+            source = fd.read()
+        encoding = common.get_pyencoding(source)
+
+        formatted, not_fixed = common.fix_code(
+            source, self.pep8_params, formatter_process)
+        command_result = {
+            'not_fixed': common.format_not_fixed(not_fixed, path)}
+        if formatted != source:
+            if self.preview:
+                command_result['diff'] = common.create_diff(
+                    source1=source, source2=formatted, filepath=path)
+            else:
+                common.rewrite_file(path, formatted, encoding)
+                command_result['has_changes'] = True
+        return command_result
+
+    def _add_result(self, command_result):
+        with self._lock:
+            self.results.append(command_result)
+            self.done += 1
+            done = self.done
+        sublime.status_message(
+            'AutoPEP8: formatted {0} file(s) ...'.format(done))
+
+    def _stop_slot(self):
+        with self._lock:
+            self._running -= 1
+            finished = not self._running
+        if finished:
+            logger.debug('Formatted %s file(s): show result.', self.done)
+            common.show_result(self.results)
@@ -1,18 +1,21 @@
-from collections import namedtuple
-from contextlib import contextmanager
+from collections import namedtuple, OrderedDict
 import difflib
+import hashlib
+import json
 import locale
 import logging
 import os
 import re
+import subprocess
 import sys
+import threading
 
 import sublime
 
 from io import StringIO
-from queue import Queue  # NOQA
 
-from AutoPEP8.sublimeautopep8lib import autopep8
+from AutoPEP8.sublimeautopep8lib import daemon
+from AutoPEP8.sublimeautopep8lib import scheduler
 
 DEFAULT_FILE_MENU_BEHAVIOUR = 'ifneed'
 DEFAULT_SEARCH_DEPTH = 3
@@ -21,28 +24,41 @@ NEW_LINE = os.linesep
 VIEW_SKIP_FORMAT = 'autopep8_view_skip_format'
 VIEW_AUTOSAVE = 'autopep8_view_autosave'
 
-WORKER_TIMEOUT = 0
-WORKER_START_TIMEOUT = 100
+DEFAULT_PYTHON_INTERPRETER = 'python3'
+DEFAULT_FORMATTER_PROCESS_TIMEOUT = 30
+DEFAULT_GIT_DIFF_REF = 'HEAD'
+CHANGED_SINCE_SAVE = 'save'
+CHANGED_SINCE_GIT = 'git'
+DEFAULT_FORMAT_ON_SAVE_DELAY = 100
 STATUS_MESSAGE_TIMEOUT = 3000
+ENGINE_MODULE = 'AutoPEP8.sublimeautopep8lib.autopep8'
 
 USER_CONFIG_NAME = 'AutoPep8.sublime-settings'
 # TODO: make different settings for different platforms
 
-ViewState = namedtuple('ViewState', ['row', 'col', 'vector'])
-
-PATTERN = re.compile(r'Not fixing (?P<code>[A-Z]{1}\d+) on line (?P<line>\d+)')
+FormatJob = namedtuple('FormatJob', ['source', 'filepath', 'view', 'region',
+                                     'encoding', 'changed_since',
+                                     'change_count', 'base_lines'])
 
 logger = logging.getLogger('SublimeAutoPEP8.sublimeautopep8lib.common')
 
+_formatter_process = None
+
+
+def engine():
+    """Return the autopep8 module, importing it on first use.
+
+    autopep8 and pycodestyle are slow to import, so they are not loaded
+    at startup in sessions which never format Python code.
+    """
+    from AutoPEP8.sublimeautopep8lib import autopep8
+    return autopep8
 
-@contextmanager
-def custom_stderr(stderr=None):
-    try:
-        _stderr = sys.stderr
-        sys.stderr = stderr or StringIO()
-        yield sys.stderr
-    finally:
-        sys.stderr = _stderr
+
+def engine_version():
+    autopep8 = engine()
+    return 'autopep8 {0}, pycodestyle {1}'.format(
+        autopep8.__version__, autopep8.pycodestyle.__version__)
 
 
 def get_pyencoding(text):
@@ -69,11 +85,30 @@ def create_diff(source1, source2, filepath):
     return u''.join(lines) if len(lines) >= 3 else u''
 
 
+def line_hunks(source, formatted):
+    """Return (begin, end, text) hunks which turn source into formatted.
+
+    begin and end are offsets in source. Hunks go from the bottom up,
+    so applying one does not move the offsets of the next ones.
+    """
+    source_lines = source.splitlines(True)
+    formatted_lines = formatted.splitlines(True)
+    offsets = [0]
+    for line in source_lines:
+        offsets.append(offsets[-1] + len(line))
+
+    matcher = difflib.SequenceMatcher(None, source_lines, formatted_lines)
+    hunks = []
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag != 'equal':
+            hunks.append(
+                (offsets[i1], offsets[i2], ''.join(formatted_lines[j1:j2])))
+    return hunks
+
+
 def replace_text(view, region, text):
-    state = save_state(view)
     view.run_command(
         'auto_pep8_replace', {'text': text, 'a': region.a, 'b': region.b})
-    restore_state(view, state)
 
 
 def rewrite_file(filepath, text, encoding):
@@ -109,10 +144,11 @@ def show_result(result):
         lambda: sublime.status_message(''), STATUS_MESSAGE_TIMEOUT)
 
 
-def format_source(formatted, filepath, view, region, encoding):
+def format_source(formatted, filepath, view, region, encoding,
+                  autosave=False):
     if view:
         replace_text(view, region, formatted)
-        if view.settings().get(VIEW_AUTOSAVE, False):
+        if autosave:
             # prevent double formatting.
             view.settings().set(VIEW_SKIP_FORMAT, True)
             view.run_command("save")
@@ -120,66 +156,433 @@ def format_source(formatted, filepath, view, region, encoding):
         rewrite_file(filepath, formatted, encoding)
 
 
-def worker(queue, preview, pep8_params, result=None):
-    logger.debug('Start worker.')
-    sublime.status_message('AutoPEP8: formatting ...')
-    if queue.empty():
-        logger.debug('Queue is empty: show result.')
-        return show_result(result)
+def new_formatter_process():
+    """Return a new formatter process or None if it can not be used."""
+    settings = sublime.load_settings(USER_CONFIG_NAME)
+    # The process imports the package by name, so it only works when the
+    # package is unpacked into the Packages folder; "Installed Packages",
+    # which holds the zipped .sublime-package, is a folder too.
+    packages_path = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if not os.path.isdir(
+            os.path.join(packages_path, 'AutoPEP8', 'sublimeautopep8lib')):
+        logger.warning('Formatter process needs an unpacked package.')
+        return None
+
+    python = settings.get('python_interpreter', DEFAULT_PYTHON_INTERPRETER)
+    env = dict(os.environ, PYTHONPATH=packages_path)
+    return daemon.FormatterProcess(
+        [python, '-m', daemon.MODULE], cwd=packages_path, env=env)
+
+
+def get_formatter_process():
+    """Return the shared formatter process or None if it is disabled."""
+    global _formatter_process
+    settings = sublime.load_settings(USER_CONFIG_NAME)
+    if not settings.get('formatter_process', False):
+        stop_formatter_process()
+        return None
+
+    formatter_process = new_formatter_process()
+    if formatter_process is None:
+        return None
+    if (_formatter_process is None or
+            _formatter_process.command != formatter_process.command):
+        stop_formatter_process()
+        _formatter_process = formatter_process
+    return _formatter_process
+
+
+def stop_formatter_process():
+    global _formatter_process
+    if _formatter_process is not None:
+        _formatter_process.stop()
+        _formatter_process = None
+
+
+class ResultCache(object):
+    """LRU cache of fix_code() results shared by all views.
+
+    Results are keyed by the hash of the source, the hash of the options
+    and the engine version. A clean source is stored as None instead of a
+    copy of the text.
+    """
+
+    max_size = 64
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(source, pep8_params):
+        options = daemon.encode_options(pep8_params)
+        # the fake file only locates the configs, which are applied already.
+        options['values'].pop('files', None)
+        options_hash = hashlib.sha1(
+            json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+        source_hash = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        return source_hash, options_hash, engine_version()
+
+    def get(self, key, source):
+        """Return the cached (formatted, not_fixed) or None."""
+        with self._lock:
+            result = self.entries.pop(key, None)
+            if result is None:
+                return None
+            self.entries[key] = result
+        formatted, not_fixed = result
+        return (source if formatted is None else formatted), not_fixed
+
+    def put(self, key, source, formatted, not_fixed):
+        with self._lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (
+                None if formatted == source else formatted, not_fixed)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+_result_cache = ResultCache()
+
+
+def fix_code(source, pep8_params, formatter_process=None):
+    """Return fixed source and the issues autopep8 could not fix.
+
+    The source is formatted by formatter_process if it is given,
+    otherwise in place. Sources which were formatted before with the
+    same options are not formatted again; autopep8 itself keeps them in
+    the "cache-dir" store too.
+
+    """
+    key = _result_cache.key(source, pep8_params)
+    result = _result_cache.get(key, source)
+    if result is not None:
+        logger.debug('Use cached result.')
+        return result
+
+    result = _fix_code(source, pep8_params, formatter_process)
+    if result is None:
+        return source, []
+    _result_cache.put(key, source, *result)
+    return result
+
+
+def clear_caches(pep8_params):
+    """Forget the results of fix_code()."""
+    _result_cache.clear()
+    engine().clear_caches()
+    fix_cache = engine().get_fix_cache(pep8_params)
+    if fix_cache is not None:
+        fix_cache.clear()
+
+
+def clear_engine_caches():
+    """Free the memory autopep8 keeps between fixes, if it was loaded."""
+    autopep8 = sys.modules.get(ENGINE_MODULE)
+    if autopep8 is not None:
+        autopep8.clear_caches()
+
+
+def _fix_code(source, pep8_params, formatter_process):
+    if formatter_process is not None and not formatter_process.failed:
+        settings = sublime.load_settings(USER_CONFIG_NAME)
+        timeout = settings.get('formatter_process_timeout',
+                               DEFAULT_FORMATTER_PROCESS_TIMEOUT)
+        try:
+            return formatter_process.fix_code(source, pep8_params, timeout)
+        except daemon.FormatterProcessTimeout as exc:
+            # Running the stuck job again in plugin_host would block it too.
+            logger.error('Formatter process was killed: %s', exc)
+            return None
+        except daemon.FormatterProcessError as exc:
+            logger.error('Formatter process failed, format in place: %s',
+                         exc)
+
+    return run_engine(engine().fix_code_result, source, pep8_params)
+
+
+def run_engine(func, *args):
+    """Return tuple(func(*args)) of an engine function.
+
+    In debug mode the time spent in each stage of autopep8 is logged.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return tuple(func(*args))
+    profile = engine().Profile()
+    with engine().profiling(profile):
+        result = tuple(func(*args))
+    logger.debug('autopep8 profile:\n%s', profile.report())
+    return result
+
+
+def read_saved_lines(filepath):
+    """Return lines of the file on disk or None if it can not be read."""
+    try:
+        return engine().readlines_from_file(filepath)
+    except (IOError, OSError, UnicodeError, TypeError):
+        return None
+
+
+_saved_lines = {}
+
+
+def remember_saved_lines(view_id, filepath):
+    """Keep the lines of the saved file of a view as its save baseline.
+
+    Format-on-save runs after the file was written, so the changed lines
+    are found by comparing with the lines kept at the previous save.
+    """
+    lines = read_saved_lines(filepath)
+    if lines is None:
+        _saved_lines.pop(view_id, None)
+    else:
+        _saved_lines[view_id] = lines
+
+
+def saved_lines(view_id):
+    """Return the lines kept by remember_saved_lines() or None."""
+    return _saved_lines.get(view_id)
+
+
+def read_git_lines(filepath, ref):
+    """Return lines of the file at git ref or None if it is not there."""
+    directory, filename = os.path.split(filepath)
+    startupinfo = None
+    if os.name == 'nt':
+        # Do not flash a console window on Windows.
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    try:
+        process = subprocess.Popen(
+            ['git', 'show', '{0}:./{1}'.format(ref, filename)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=directory,
+            startupinfo=startupinfo)
+        content, errors = process.communicate()
+    except OSError as exc:
+        logger.error('Can not run git: %s', exc)
+        return None
+    if process.returncode:
+        logger.info('git show: %s', errors.decode('utf-8', 'replace'))
+        return None
+    encoding = engine().detect_encoding(filepath)
+    return StringIO(content.decode(encoding, 'replace')).readlines()
+
+
+def changed_line_ranges(source, base_lines):
+    """Return line ranges of source which differ from base_lines.
+
+    Ranges are inclusive (start, end) line numbers of source. A deletion
+    marks the line after it.
+    """
+    base_lines = [line.rstrip('\r\n') for line in base_lines]
+    source_lines = [line.rstrip('\r\n')
+                    for line in StringIO(source).readlines()]
+
+    matcher = difflib.SequenceMatcher(None, base_lines, source_lines)
+    line_ranges = []
+    for tag, _, _, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        start = min(j1 + 1, len(source_lines))
+        line_ranges.append((start, max(j2, start)))
+    return line_ranges
+
+
+def fix_changed_lines(source, filepath, pep8_params, changed_since,
+                      base_lines=None):
+    """Return fixed source and the issues autopep8 could not fix.
+
+    Only the lines which differ from base_lines, the lines of the previous
+    save (CHANGED_SINCE_SAVE), or from the file at the git ref from the
+    settings (CHANGED_SINCE_GIT) are fixed. The whole source is fixed if
+    there is nothing to compare with.
+    """
+    if changed_since == CHANGED_SINCE_GIT:
+        settings = sublime.load_settings(USER_CONFIG_NAME)
+        base_lines = read_git_lines(
+            filepath, settings.get('git_diff_ref', DEFAULT_GIT_DIFF_REF))
+    if base_lines is None:
+        return fix_code(source, pep8_params, get_formatter_process())
+
+    line_ranges = changed_line_ranges(source, base_lines)
+    logger.debug('Fix changed lines: %s', line_ranges)
+    return run_engine(engine().fix_line_ranges_result, source, line_ranges,
+                      pep8_params)
+
+
+def get_scheduler():
+    """Return the shared scheduler sized by the worker_threads setting."""
+    settings = sublime.load_settings(USER_CONFIG_NAME)
+    _scheduler.max_workers = max(1, settings.get(
+        'worker_threads', scheduler.DEFAULT_MAX_WORKERS))
+    return _scheduler
+
+
+_scheduler = scheduler.Scheduler()
 
-    result = result or []
+
+def submit_job(job, preview, pep8_params):
+    """Format job ahead of the format-on-save and folder jobs."""
+    return get_scheduler().submit(
+        lambda: show_result([format_job(job, preview, pep8_params)]),
+        scheduler.PRIORITY_VIEW, name=job.filepath or 'view')
+
+
+_checked_views = {}
+
+
+def submit_check(view, pep8_params):
+    """Format the text of view into the caches when nothing else runs."""
+    state = (view.change_count(), pep8_params)
+    if _checked_views.get(view.id()) == state:
+        return
+    _checked_views[view.id()] = state
+
+    def check():
+        if view.change_count() != state[0]:
+            return
+        source = view.substr(sublime.Region(0, view.size()))
+        fix_code(source, pep8_params, get_formatter_process())
+
+    get_scheduler().submit(check, scheduler.PRIORITY_IDLE,
+                           name=view.file_name() or 'view')
+
+
+def forget_view(view_id):
+    _checked_views.pop(view_id, None)
+    _saved_lines.pop(view_id, None)
+
+
+class ViewJobs(object):
+    """Format-on-save jobs of one view.
+
+    At most one job runs and one waits; a newer job replaces the waiting
+    one. scheduled is the waiting job once it was given to the scheduler.
+    """
+
+    def __init__(self):
+        self.running = None
+        self.pending = None
+        self.scheduled = None
+
+
+_view_jobs = {}
+_view_jobs_lock = threading.Lock()
+
+
+def submit_view_job(job, preview, pep8_params):
+    """Format job once its view has not been saved again for a while."""
+    view_id = job.view.id()
+    entry = (job, preview, pep8_params)
+    with _view_jobs_lock:
+        jobs = _view_jobs.setdefault(view_id, ViewJobs())
+        if jobs.pending is not None:
+            logger.debug('Drop pending job of view %s.', view_id)
+        jobs.pending = entry
+
+    settings = sublime.load_settings(USER_CONFIG_NAME)
+    delay = settings.get('format_on_save_delay', DEFAULT_FORMAT_ON_SAVE_DELAY)
+    sublime.set_timeout_async(lambda: _schedule_view_job(view_id, entry),
+                              delay)
+
+
+def _schedule_view_job(view_id, entry):
+    with _view_jobs_lock:
+        jobs = _view_jobs.get(view_id)
+        # a newer job replaced this one or the view is busy: the newer
+        # job or the running one schedules it later. Both the debounce
+        # timer and the running job may get here, so it is submitted once.
+        if (jobs is None or jobs.pending is not entry or jobs.running or
+                jobs.scheduled is entry):
+            return
+        jobs.scheduled = entry
+    get_scheduler().submit(
+        lambda: _start_view_job(view_id, entry), scheduler.PRIORITY_SAVE,
+        name=entry[0].filepath or 'view',
+        on_done=lambda scheduled: _finish_view_job(view_id, entry,
+                                                   scheduled.cancelled))
+
+
+def _start_view_job(view_id, entry):
+    with _view_jobs_lock:
+        jobs = _view_jobs.get(view_id)
+        if jobs is None or jobs.pending is not entry or jobs.running:
+            return
+        jobs.pending = None
+        jobs.scheduled = None
+        jobs.running = entry
+
+    job, preview, pep8_params = entry
+    if job.view.change_count() != job.change_count:
+        logger.debug('Drop outdated job of view %s.', view_id)
+        return
+
+    show_result([format_job(job, preview, pep8_params, autosave=True)])
+
+
+def _finish_view_job(view_id, entry, cancelled):
+    with _view_jobs_lock:
+        jobs = _view_jobs.get(view_id)
+        if jobs is None:
+            return
+        if jobs.running is entry:
+            jobs.running = None
+        elif cancelled and jobs.pending is entry:
+            jobs.pending = None
+            jobs.scheduled = None
+        else:
+            return
+        next_entry = jobs.pending
+        if next_entry is None and jobs.running is None:
+            del _view_jobs[view_id]
+    if next_entry is not None:
+        _schedule_view_job(view_id, next_entry)
+
+
+def format_job(job, preview, pep8_params, autosave=False):
+    """Format one FormatJob and return its result for show_result().
+
+    With autosave the view is saved after the formatted text was applied.
+    """
+    sublime.status_message('AutoPEP8: formatting ...')
     command_result = {}
-    source, filepath, view, region, encoding = queue.get()
-    with custom_stderr() as stdoutput:
-        # TODO(wistful): pass 'encoding' parameter to the 'fix_code' function.
-        logger.info('Run autopep8 with %s', pep8_params)
-        formatted = autopep8.fix_code(source, pep8_params)
-        logger.debug('Got formatted text.')
-        if preview:
-            logger.debug('Create diff for preview.')
-            formatted = create_diff(source1=source, source2=formatted,
-                                    filepath=filepath)
-
-    command_result['not_fixed'] = find_not_fixed(stdoutput.getvalue(),
-                                                 filepath)
+    (source, filepath, view, region, encoding, changed_since,
+     change_count, base_lines) = job
+    # TODO(wistful): pass 'encoding' parameter to the 'fix_code' function.
+    logger.info('Run autopep8 with %s', pep8_params)
+    if changed_since and filepath:
+        formatted, not_fixed = fix_changed_lines(
+            source, filepath, pep8_params, changed_since, base_lines)
+    else:
+        formatted, not_fixed = fix_code(source, pep8_params,
+                                        get_formatter_process())
+    logger.debug('Got formatted text.')
+    if preview:
+        logger.debug('Create diff for preview.')
+        formatted = create_diff(source1=source, source2=formatted,
+                                filepath=filepath)
+
+    command_result['not_fixed'] = format_not_fixed(not_fixed, filepath)
     if command_result['not_fixed']:
         logger.debug('Can not fix all issues.')
 
-    if formatted and formatted != source:
+    if not preview and view and view.change_count() != change_count:
+        # never write over text which was changed in the meantime.
+        logger.debug('View was changed: drop formatted text.')
+    elif formatted and formatted != source:
         if not preview:
             command_result['has_changes'] = True
             logger.debug('Format source text.')
-            format_source(formatted, filepath, view, region, encoding)
+            format_source(formatted, filepath, view, region, encoding,
+                          autosave)
         else:
             command_result['diff'] = formatted
-
-    result.append(command_result)
-
-    sublime.set_timeout_async(
-        lambda: worker(queue, preview, pep8_params, result),
-        WORKER_TIMEOUT)
-
-
-def save_state(view):
-    # save cursor position
-    row, col = view.rowcol(view.sel()[0].begin())
-    # save viewport
-    vector = view.text_to_layout(view.visible_region().begin())
-    return ViewState(row, col, vector)
-
-
-def restore_state(view, state):
-    # restore cursor position
-    sel = view.sel()
-    if len(sel) == 1 and sel[0].a == sel[0].b:
-        point = view.text_point(state.row, state.col)
-        sel.subtract(sel[0])
-        sel.add(sublime.Region(point, point))
-
-    # restore viewport
-    # magic, next line doesn't work without it
-    view.set_viewport_position((0.0, 0.0))
-    view.set_viewport_position(state.vector)
+    return command_result
 
 
 def new_view(encoding, text):
@@ -213,11 +616,11 @@ def show_error_panel(text):
             'show_panel', {'panel': 'output.autopep8'})
 
 
-def find_not_fixed(text, filepath):
+def format_not_fixed(not_fixed, filepath):
+    """Return the issues autopep8 could not fix as output panel text."""
     result = ''
-    last_to_fix = text.rfind('issue(s) to fix')
-    if last_to_fix > 0:
-        for code, line in PATTERN.findall(text[last_to_fix:]):
-            message = 'File "{0}", line {1}: not fixed {2}\n'
-            result += message.format(filepath, line, code)
+    for issue in not_fixed:
+        message = 'File "{0}", line {1}, column {2}: not fixed {3}\n'
+        result += message.format(filepath, issue['line'], issue['column'],
+                                 issue['info'])
     return result
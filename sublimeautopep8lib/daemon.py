@@ -0,0 +1,297 @@
+# coding=utf-8
+"""Long-lived formatter process.
+
+The plugin starts the process once and sends it the buffer text over a
+pipe, so heavy formatting does not run inside Sublime's plugin_host and a
+stuck job can be killed.
+
+Every message is a frame: a 4-byte big-endian length followed by that many
+bytes of UTF-8 encoded JSON.
+
+Requests:
+    {"id": 1, "command": "fix_code", "source": "...", "options": {...},
+     "profile": false}
+    {"id": 2, "command": "ping"}
+
+Responses:
+    {"id": 1, "formatted": "...", "not_fixed": [{"id": "E501", ...}],
+     "profile": "..."}
+    {"id": 1, "error": "..."}
+
+This module must not import sublime: it is also the entry point of the
+formatter process (python -m AutoPEP8.sublimeautopep8lib.daemon).
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import subprocess
+import sys
+import threading
+
+try:
+    from queue import Empty, Queue
+except ImportError:  # pragma: no cover
+    from Queue import Empty, Queue
+
+HEADER = struct.Struct('>I')
+MODULE = 'AutoPEP8.sublimeautopep8lib.daemon'
+
+logger = logging.getLogger('SublimeAutoPEP8.sublimeautopep8lib.daemon')
+
+
+class FormatterProcessError(Exception):
+
+    """The formatter process failed or closed the pipe."""
+
+
+class FormatterProcessTimeout(FormatterProcessError):
+
+    """The formatter process did not answer in time and was killed."""
+
+
+def read_frame(stream):
+    """Return the next message from stream or None at the end of stream."""
+    header = _read_exactly(stream, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    payload = _read_exactly(stream, size)
+    if payload is None:
+        raise FormatterProcessError('Truncated frame.')
+    return json.loads(payload.decode('utf-8'))
+
+
+def write_frame(stream, message):
+    """Write message to stream as one frame."""
+    payload = json.dumps(message).encode('utf-8')
+    stream.write(HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def _read_exactly(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            if data:
+                raise FormatterProcessError('Truncated frame.')
+            return None
+        data += chunk
+    return data
+
+
+def encode_options(options):
+    """Return parsed autopep8 options as a JSON-compatible dict."""
+    values = {}
+    sets = []
+    for name, value in vars(options).items():
+        if isinstance(value, (set, frozenset)):
+            sets.append(name)
+            value = sorted(value)
+        values[name] = value
+    return {'values': values, 'sets': sorted(sets)}
+
+
+def decode_options(data):
+    """Return the autopep8 options encoded by encode_options()."""
+    values = dict(data['values'])
+    for name in data['sets']:
+        values[name] = set(values[name])
+    return argparse.Namespace(**values)
+
+
+class FormatterProcess(object):
+
+    """Client side of the formatter process.
+
+    Requests are sent one at a time. If the process does not answer within
+    the timeout it is killed, and the next request starts a new one.
+    A process which can not be started or exits before its first answer
+    (e.g. it can not import the package) is not started again: failed is
+    set and every request raises FormatterProcessError.
+
+    """
+
+    def __init__(self, command, cwd=None, env=None):
+        self.command = command
+        self.cwd = cwd
+        self.env = env
+        self.failed = False
+        self._answered = False
+        self._process = None
+        self._responses = None
+        self._request_id = 0
+        self._lock = threading.Lock()
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """Start the process unless it is already running."""
+        if self.is_alive():
+            return
+        if self.failed:
+            raise FormatterProcessError(
+                'Formatter process failed to start: {0}'.format(self.command))
+        startupinfo = None
+        if os.name == 'nt':
+            # Do not flash a console window on Windows.
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        logger.info('Start formatter process: %s', self.command)
+        try:
+            self._process = subprocess.Popen(
+                self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                cwd=self.cwd, env=self.env, startupinfo=startupinfo)
+        except OSError as exc:
+            self._process = None
+            self.failed = True
+            raise FormatterProcessError(
+                'Can not start {0}: {1}'.format(self.command, exc))
+        self._answered = False
+        self._responses = Queue()
+        reader = threading.Thread(
+            target=self._read_responses,
+            args=(self._process.stdout, self._responses))
+        reader.daemon = True
+        reader.start()
+
+    def stop(self):
+        """Kill the process."""
+        with self._lock:
+            self._kill()
+
+    def fix_code(self, source, options, timeout=None):
+        """Return (formatted, not_fixed) of autopep8.fix_code_result().
+
+        not_fixed lists the issues that autopep8 could not fix. In debug
+        mode the time spent in each stage of autopep8 is logged.
+
+        """
+        response = self.request({'command': 'fix_code',
+                                 'source': source,
+                                 'options': encode_options(options),
+                                 'profile': logger.isEnabledFor(
+                                     logging.DEBUG)},
+                                timeout)
+        if 'profile' in response:
+            logger.debug('autopep8 profile:\n%s', response['profile'])
+        return response['formatted'], response['not_fixed']
+
+    def request(self, message, timeout=None):
+        """Send message and return the response to it."""
+        with self._lock:
+            self.start()
+            self._request_id += 1
+            message = dict(message, id=self._request_id)
+            try:
+                write_frame(self._process.stdin, message)
+            except (IOError, OSError) as exc:
+                self._fail()
+                raise FormatterProcessError(
+                    'Can not send request: {0}'.format(exc))
+
+            while True:
+                try:
+                    response = self._responses.get(timeout=timeout)
+                except Empty:
+                    self._kill()
+                    raise FormatterProcessTimeout(
+                        'No response in {0} seconds.'.format(timeout))
+                if response is None:
+                    self._fail()
+                    raise FormatterProcessError('Formatter process exited.')
+                self._answered = True
+                # Skip the late answers to requests that timed out.
+                if response.get('id') == message['id']:
+                    break
+
+        if 'error' in response:
+            raise FormatterProcessError(response['error'])
+        return response
+
+    def _fail(self):
+        if not self._answered:
+            logger.error('Formatter process exited before its first answer, '
+                         'it is not started again: %s', self.command)
+            self.failed = True
+        self._kill()
+
+    def _kill(self):
+        if self._process is None:
+            return
+        logger.info('Stop formatter process.')
+        try:
+            self._process.kill()
+            self._process.wait()
+        except OSError:
+            pass
+        for stream in (self._process.stdin, self._process.stdout):
+            try:
+                stream.close()
+            except (IOError, OSError):
+                pass
+        self._process = None
+
+    @staticmethod
+    def _read_responses(stream, responses):
+        try:
+            while True:
+                response = read_frame(stream)
+                if response is None:
+                    break
+                responses.put(response)
+        except (IOError, OSError, ValueError, FormatterProcessError) as exc:
+            logger.debug('Formatter process pipe closed: %s', exc)
+        responses.put(None)
+
+
+def handle(request):
+    """Return the response to one request."""
+    from AutoPEP8.sublimeautopep8lib import autopep8
+
+    command = request.get('command')
+    response = {'id': request.get('id')}
+    if command == 'ping':
+        return response
+    if command != 'fix_code':
+        response['error'] = 'Unknown command: {0}'.format(command)
+        return response
+
+    options = decode_options(request['options'])
+    profile = autopep8.Profile() if request.get('profile') else None
+    try:
+        with autopep8.profiling(profile):
+            result = autopep8.fix_code_result(request['source'], options)
+    except Exception as exc:
+        response['error'] = '{0}: {1}'.format(type(exc).__name__, exc)
+    else:
+        response['formatted'] = result.source
+        response['not_fixed'] = result.not_fixed
+        if profile is not None:
+            response['profile'] = profile.report()
+    return response
+
+
+def serve(reader, writer):
+    """Answer requests from reader until it is closed."""
+    while True:
+        request = read_frame(reader)
+        if request is None:
+            return
+        write_frame(writer, handle(request))
+
+
+def main():
+    reader = getattr(sys.stdin, 'buffer', sys.stdin)
+    writer = getattr(sys.stdout, 'buffer', sys.stdout)
+    # Anything printed by mistake must not corrupt the frames.
+    sys.stdout = sys.stderr
+    serve(reader, writer)
+
+
+if __name__ == '__main__':
+    main()
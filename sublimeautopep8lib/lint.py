@@ -0,0 +1,131 @@
+# coding=utf-8
+"""Highlight pycodestyle issues of a view while typing."""
+
+import io
+import logging
+import threading
+
+import sublime
+
+from AutoPEP8.sublimeautopep8lib import common
+from AutoPEP8.sublimeautopep8lib import scheduler
+
+DEFAULT_LINT_DELAY = 500
+REGION_KEY = 'autopep8_lint'
+REGION_SCOPE = 'invalid.deprecated'
+STATUS_KEY = 'autopep8_lint'
+
+logger = logging.getLogger('SublimeAutoPEP8.sublimeautopep8lib.lint')
+
+
+class ViewLinter(object):
+    """Incremental pycodestyle run over the versions of one view.
+
+    Only the logical lines around the last edit are checked again; see
+    autopep8.IncrementalPep8.
+    """
+
+    def __init__(self, pep8_options):
+        self.pep8_options = pep8_options
+        self.checker = common.engine().IncrementalPep8(pep8_options)
+        self.messages = {}
+        self.lock = threading.Lock()
+
+    def check(self, source):
+        """Return pycodestyle results for source."""
+        lines = io.StringIO(source).readlines()
+        with self.lock:
+            self.checker.record_edit(lines)
+            return self.checker.check(lines)
+
+
+_linters = {}
+_linters_lock = threading.Lock()
+
+
+def schedule(view, get_pep8_params):
+    """Lint view once it has not been modified for a while."""
+    settings = sublime.load_settings(common.USER_CONFIG_NAME)
+    delay = settings.get('lint_delay', DEFAULT_LINT_DELAY)
+    change_count = view.change_count()
+    sublime.set_timeout_async(
+        lambda: _on_idle(view, change_count, get_pep8_params), delay)
+
+
+def _on_idle(view, change_count, get_pep8_params):
+    # a later modification scheduled its own run.
+    if view.change_count() != change_count or view.window() is None:
+        return
+    pep8_params = get_pep8_params()
+    common.get_scheduler().submit(
+        lambda: lint_view(view, change_count, pep8_params),
+        scheduler.PRIORITY_LINT, name=view.file_name() or 'view')
+
+
+def lint_view(view, change_count, pep8_params):
+    if view.change_count() != change_count:
+        return
+    pep8_options = {
+        'ignore': pep8_params.ignore,
+        'select': pep8_params.select,
+        'max_line_length': pep8_params.max_line_length,
+        'hang_closing': pep8_params.hang_closing,
+    }
+    with _linters_lock:
+        linter = _linters.get(view.id())
+        if linter is None or linter.pep8_options != pep8_options:
+            linter = _linters[view.id()] = ViewLinter(pep8_options)
+
+    try:
+        results = linter.check(view.substr(sublime.Region(0, view.size())))
+    except Exception:
+        # text the engine can not check, like a source which does not
+        # tokenize: no highlights rather than stale ones.
+        logger.debug('Can not lint view %s.', view.id(), exc_info=True)
+        clear(view)
+        return
+    if view.change_count() != change_count:
+        logger.debug('View was changed: drop lint results.')
+        return
+    with _linters_lock:
+        if _linters.get(view.id()) is not linter:
+            logger.debug('View was cleared: drop lint results.')
+            return
+
+    regions = []
+    messages = {}
+    for result in results:
+        point = view.text_point(result['line'] - 1, result['column'] - 1)
+        end = min(point + 1, view.line(point).end())
+        regions.append(sublime.Region(point, end))
+        messages.setdefault(result['line'] - 1, []).append(result['info'])
+    linter.messages = messages
+    view.add_regions(REGION_KEY, regions, REGION_SCOPE, 'dot',
+                     sublime.DRAW_EMPTY | sublime.DRAW_NO_FILL |
+                     sublime.DRAW_NO_OUTLINE |
+                     sublime.DRAW_SQUIGGLY_UNDERLINE)
+    show_status(view)
+
+
+def show_status(view):
+    """Show the issues of the line with the caret in the status bar."""
+    with _linters_lock:
+        linter = _linters.get(view.id())
+    selection = view.sel()
+    if linter is None or not len(selection):
+        return
+    row = view.rowcol(selection[0].b)[0]
+    messages = linter.messages.get(row)
+    if messages:
+        view.set_status(STATUS_KEY, 'AutoPep8: ' + '; '.join(messages))
+    else:
+        view.erase_status(STATUS_KEY)
+
+
+def clear(view):
+    """Remove the highlights of a linted view."""
+    with _linters_lock:
+        linter = _linters.pop(view.id(), None)
+    if linter is not None:
+        view.erase_regions(REGION_KEY)
+        view.erase_status(STATUS_KEY)
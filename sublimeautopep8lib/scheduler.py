@@ -0,0 +1,145 @@
+# coding=utf-8
+"""Run the background work of the plugin.
+
+Jobs wait in a priority queue and run on a bounded pool of threads: jobs
+of the commands run on the current view first, then format-on-save jobs,
+then live lint, then the files of the folder commands, then speculative
+checks.
+"""
+
+import itertools
+import logging
+import threading
+
+from queue import PriorityQueue
+
+PRIORITY_VIEW = 0
+PRIORITY_SAVE = 1
+PRIORITY_LINT = 2
+PRIORITY_BULK = 3
+PRIORITY_IDLE = 4
+
+DEFAULT_MAX_WORKERS = 2
+
+logger = logging.getLogger('SublimeAutoPEP8.sublimeautopep8lib.scheduler')
+
+
+class Job(object):
+    """A function queued in the scheduler.
+
+    on_done(job) is called once the job has run, failed or was dropped
+    after cancel(); result holds what the function returned.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+
+    def __init__(self, func, priority, name, on_done=None):
+        self.func = func
+        self.priority = priority
+        self.name = name
+        self.on_done = on_done
+        self.state = self.PENDING
+        self.cancelled = False
+        self.result = None
+
+    def cancel(self):
+        """Drop the job if it waits, or flag it if it runs.
+
+        A running job is not interrupted: its owner checks the flag in
+        on_done to stop follow-up work.
+        """
+        if self.state != self.DONE:
+            self.cancelled = True
+
+    def __repr__(self):
+        return '<Job {0!r} {1}{2}>'.format(
+            self.name, self.state, ' cancelled' if self.cancelled else '')
+
+
+class Scheduler(object):
+    """Run jobs by priority on at most max_workers threads.
+
+    Jobs of the same priority run in the order they were submitted.
+    A thread is started when a job is submitted and no thread is idle;
+    extra threads stop once max_workers is lowered.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._queue = PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._running = []
+        self._threads = 0
+        self._idle = 0
+
+    def submit(self, func, priority=PRIORITY_BULK, name='', on_done=None):
+        """Queue func() and return its job."""
+        job = Job(func, priority, name, on_done)
+        with self._lock:
+            self._pending.append(job)
+            self._queue.put((priority, next(self._counter), job))
+            start_thread = (self._idle < len(self._pending) and
+                            self._threads < self.max_workers)
+            if start_thread:
+                self._threads += 1
+        if start_thread:
+            thread = threading.Thread(target=self._work,
+                                      name='AutoPEP8 worker')
+            thread.daemon = True
+            thread.start()
+        logger.debug('Submit %r.', job)
+        return job
+
+    def pending(self):
+        """Return the waiting jobs in the order they will run."""
+        with self._lock:
+            return sorted(self._pending, key=lambda job: job.priority)
+
+    def running(self):
+        with self._lock:
+            return list(self._running)
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._pending)
+
+    def cancel_all(self):
+        """Cancel the waiting and the running jobs."""
+        for job in self.pending() + self.running():
+            job.cancel()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                if self._threads > self.max_workers:
+                    self._threads -= 1
+                    return
+                self._idle += 1
+            (_, _, job) = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+                self._pending.remove(job)
+                if not job.cancelled:
+                    job.state = Job.RUNNING
+                    self._running.append(job)
+
+            if job.cancelled:
+                logger.debug('Drop %r.', job)
+            else:
+                try:
+                    job.result = job.func()
+                except Exception:
+                    logger.exception('%r failed.', job)
+                with self._lock:
+                    self._running.remove(job)
+            job.state = Job.DONE
+
+            if job.on_done is not None:
+                try:
+                    job.on_done(job)
+                except Exception:
+                    logger.exception('on_done of %r failed.', job)
@@ -0,0 +1,40 @@
+# coding=utf-8
+"""Import the package like Sublime Text does, for the tests.
+
+The package is imported as AutoPEP8, the name of its folder in Sublime
+Text's Packages, through a symlink in a temporary folder. The modules of
+the plugin import sublime and sublime_plugin, the stand-ins of
+benchmarks/fake.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_PATH = os.path.join(PACKAGE_PATH, 'benchmarks', 'fake')
+
+packages_path = tempfile.mkdtemp()
+os.symlink(PACKAGE_PATH, os.path.join(packages_path, 'AutoPEP8'))
+atexit.register(shutil.rmtree, packages_path, True)
+sys.path.insert(0, packages_path)
+sys.path.insert(0, FAKE_PATH)
+
+
+def import_engine():
+    """Return the autopep8 module of the package."""
+    from AutoPEP8.sublimeautopep8lib import autopep8
+    return autopep8
+
+
+def wait_until(predicate, timeout=10, poll=0.001):
+    """Wait until predicate() is true; return False on timeout."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(poll)
+    return False
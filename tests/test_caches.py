@@ -0,0 +1,61 @@
+# coding=utf-8
+"""The memory kept by the engine between fixes can be freed.
+
+    python3 -m unittest discover tests
+"""
+
+import sys
+import unittest
+from unittest import mock
+
+import support
+
+autopep8 = support.import_engine()
+from AutoPEP8 import sublautopep8  # noqa: E402
+from AutoPEP8.sublimeautopep8lib import common  # noqa: E402
+from AutoPEP8.sublimeautopep8lib import scheduler  # noqa: E402
+
+SOURCE = 'x=1\nif x :\n    y=[1,2]\n'
+
+
+class TestClearCaches(unittest.TestCase):
+
+    def fill(self):
+        autopep8.fix_code(SOURCE)
+        self.assertTrue(autopep8._cached_tokenizer._entries)
+        self.assertIsNotNone(autopep8._cached_source_analysis.last_analysis)
+
+    def assertCleared(self):
+        self.assertEqual(len(autopep8._cached_tokenizer._entries), 0)
+        self.assertEqual(autopep8._cached_tokenizer._size, 0)
+        self.assertIsNone(autopep8._cached_source_analysis.last_analysis)
+
+    def test_clear_caches(self):
+        self.fill()
+        autopep8.clear_caches()
+        self.assertCleared()
+        # The caches fill again.
+        self.assertEqual(autopep8.fix_code(SOURCE),
+                         'x = 1\nif x:\n    y = [1, 2]\n')
+        self.assertTrue(autopep8._cached_tokenizer._entries)
+
+    def test_plugin_clear_caches(self):
+        self.fill()
+        common.clear_caches(autopep8.parse_args(['']))
+        self.assertCleared()
+
+    def test_plugin_unloaded(self):
+        self.fill()
+        with mock.patch.object(common, '_scheduler', scheduler.Scheduler()):
+            sublautopep8.plugin_unloaded()
+        self.assertCleared()
+
+    def test_engine_is_not_imported_to_clear_it(self):
+        with mock.patch.dict(sys.modules):
+            del sys.modules[common.ENGINE_MODULE]
+            common.clear_engine_caches()
+            self.assertNotIn(common.ENGINE_MODULE, sys.modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
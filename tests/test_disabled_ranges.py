@@ -0,0 +1,120 @@
+# coding=utf-8
+"""Lines between "# autopep8: off" and "# autopep8: on" are not fixed.
+
+    python3 -m unittest discover tests
+"""
+
+import unittest
+
+import support
+
+autopep8 = support.import_engine()
+
+
+class TestGetDisabledRanges(unittest.TestCase):
+
+    def test_several_ranges(self):
+        source = ('x=1\n'
+                  '# autopep8: off\n'
+                  'y=2\n'
+                  '# autopep8: on\n'
+                  'z=3\n'
+                  '# autopep8: off\n'
+                  'w=4\n'
+                  '# autopep8: on\n')
+        self.assertEqual(autopep8.get_disabled_ranges(source),
+                         [(2, 4), (6, 8)])
+
+    def test_fmt_comments(self):
+        source = ('x=1\n'
+                  '# fmt: off\n'
+                  'y=2\n'
+                  '# fmt: on\n'
+                  '#autopep8:off\n'
+                  'z=3\n'
+                  '# fmt: on\n')
+        self.assertEqual(autopep8.get_disabled_ranges(source),
+                         [(2, 4), (5, 7)])
+
+    def test_nested_off(self):
+        source = ('# autopep8: off\n'
+                  'x=1\n'
+                  '# autopep8: off\n'
+                  'y=2\n'
+                  '# autopep8: on\n'
+                  'z=3\n'
+                  '# autopep8: on\n')
+        self.assertEqual(autopep8.get_disabled_ranges(source), [(1, 5)])
+
+    def test_on_without_off(self):
+        source = 'x=1\n# autopep8: on\ny=2\n'
+        self.assertEqual(autopep8.get_disabled_ranges(source), [])
+
+    def test_unterminated_off(self):
+        source = 'x=1\n# autopep8: off\ny=2\nz=3\n'
+        (disabled,) = autopep8.get_disabled_ranges(source)
+        self.assertEqual(disabled[0], 2)
+        self.assertTrue(all(line in range(*disabled) for line in (2, 3, 4)))
+
+    def test_unterminated_off_without_final_newline(self):
+        source = 'x=1\n# autopep8: off\ny=2'
+        (disabled,) = autopep8.get_disabled_ranges(source)
+        self.assertIn(3, range(*disabled))
+
+
+class TestLineRanges(unittest.TestCase):
+
+    def test_contains(self):
+        ranges = autopep8.LineRanges([(2, 4), (6, 8), (10, 11)])
+        self.assertEqual([line for line in range(13) if line in ranges],
+                         [2, 3, 6, 7, 10])
+        self.assertEqual(len(ranges), 3)
+
+    def test_empty(self):
+        ranges = autopep8.LineRanges([])
+        self.assertNotIn(1, ranges)
+        self.assertFalse(ranges)
+
+    def test_exclude(self):
+        ranges = autopep8.LineRanges([(2, 4), (6, 8)])
+        results = [{'line': line} for line in range(1, 10)]
+        self.assertEqual(
+            [result['line'] for result in ranges.exclude(results)],
+            [1, 4, 5, 8, 9])
+
+
+class TestFixDisabledRanges(unittest.TestCase):
+
+    def test_several_ranges(self):
+        # Each line is outside one of the ranges, which used to keep all
+        # the results.
+        source = ('a=1\n'
+                  '# autopep8: off\n'
+                  'b=2\n'
+                  '# autopep8: on\n'
+                  'c=3\n'
+                  '# fmt: off\n'
+                  'd=4\n'
+                  '# fmt: on\n'
+                  'e=5\n')
+        self.assertEqual(autopep8.fix_code(source),
+                         source.replace('a=1', 'a = 1')
+                         .replace('c=3', 'c = 3').replace('e=5', 'e = 5'))
+
+    def test_nested_and_unterminated_off(self):
+        source = ('a=1\n'
+                  '# autopep8: off\n'
+                  'b=2\n'
+                  '# autopep8: off\n'
+                  'c=3\n'
+                  '# autopep8: on\n'
+                  'd=4\n'
+                  '# autopep8: off\n'
+                  'e=5')
+        self.assertEqual(autopep8.fix_code(source),
+                         source.replace('a=1', 'a = 1')
+                         .replace('d=4', 'd = 4') + '\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# coding=utf-8
+"""FixCache keeps fixed sources on disk, see autopep8 --cache-dir.
+
+    python3 -m unittest discover tests
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import support
+
+autopep8 = support.import_engine()
+
+SOURCE = 'x=1\nif x :\n    y=[1,2]\n'
+FIXED = 'x = 1\nif x:\n    y = [1, 2]\n'
+
+# A value of each hashed option which differs from the default.
+OTHER_VALUES = {
+    'aggressive': 2,
+    'experimental': True,
+    'hang_closing': True,
+    'ignore': {'E226'},
+    'indent_size': 2,
+    'line_range': [1, 2],
+    'line_ranges': [[1, 2]],
+    'max_line_length': 100,
+    'pep8_passes': 3,
+    'select': {'E2'},
+}
+
+
+class TestFixCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def options(self, *arguments):
+        return autopep8.parse_args(
+            ['--cache-dir', self.path] + list(arguments) + ['file.py'])
+
+    def stored_files(self):
+        return sorted(os.path.join(directory, name)
+                      for (directory, _, names) in os.walk(self.path)
+                      for name in names)
+
+    def test_every_hashed_option_changes_the_key(self):
+        self.assertEqual(sorted(OTHER_VALUES),
+                         sorted(autopep8.FixCache.hashed_options))
+        cache = autopep8.FixCache(self.path)
+        options = self.options()
+        key = cache.key(SOURCE, options)
+        self.assertEqual(cache.key(SOURCE, self.options()), key)
+        for (name, value) in sorted(OTHER_VALUES.items()):
+            changed = self.options()
+            setattr(changed, name, value)
+            self.assertNotEqual(cache.key(SOURCE, changed), key, name)
+
+    def test_source_and_namespace_change_the_key(self):
+        cache = autopep8.FixCache(self.path)
+        options = self.options()
+        key = cache.key(SOURCE, options)
+        self.assertNotEqual(cache.key(SOURCE + '\n', options), key)
+        self.assertNotEqual(cache.key(SOURCE, options, 'other'), key)
+
+    def test_code_version_changes_the_key(self):
+        cache = autopep8.FixCache(self.path)
+        options = self.options()
+        key = cache.key(SOURCE, options)
+        with mock.patch.object(autopep8, '_code_version',
+                               lambda: 'patched'):
+            self.assertNotEqual(cache.key(SOURCE, options), key)
+
+    def test_fix_is_stored(self):
+        options = self.options()
+        self.assertEqual(autopep8.fix_lines([SOURCE], options), FIXED)
+        (filename,) = self.stored_files()
+        with mock.patch.object(autopep8, '_fix_lines') as fix_lines:
+            self.assertEqual(autopep8.fix_lines([SOURCE], options), FIXED)
+        self.assertFalse(fix_lines.called)
+
+    def test_corrupt_entry_is_ignored(self):
+        options = self.options()
+        autopep8.fix_lines([SOURCE], options)
+        (filename,) = self.stored_files()
+        with open(filename, 'rb') as fd:
+            data = fd.read()
+        for corrupt in (data[:len(data) // 2], b'{"source": 1}', b'\xff'):
+            with open(filename, 'wb') as fd:
+                fd.write(corrupt)
+            self.assertEqual(autopep8.fix_lines([SOURCE], options), FIXED)
+            # The entry is written again.
+            with open(filename, 'rb') as fd:
+                self.assertEqual(fd.read(), data)
+
+    def put(self, cache, key, size, mtime):
+        cache.put(key, 'x' * size)
+        filename = cache._filename(key)
+        if os.path.exists(filename):
+            os.utime(filename, (mtime, mtime))
+
+    def test_evict_least_recently_used(self):
+        cache = autopep8.FixCache(self.path, max_size=1000)
+        keys = ['{0:02x}{1}'.format(index, 'a' * 62) for index in range(6)]
+        for (index, key) in enumerate(keys):
+            self.put(cache, key, 150, 1000 + index)
+        self.assertEqual(sum(os.path.getsize(name)
+                             for name in self.stored_files()), 900)
+
+        # A read makes the oldest entry the most recently used.
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.put(cache, 'ff' + 'b' * 62, 150, 2000)
+        remaining = [key for key in keys
+                     if os.path.exists(cache._filename(key))]
+        # 1050 bytes are trimmed to at most 800: the two least recently
+        # used entries go.
+        self.assertEqual(remaining, [keys[0]] + keys[3:])
+        self.assertLessEqual(sum(os.path.getsize(name)
+                                 for name in self.stored_files()), 800)
+
+    def test_evict_keeps_a_store_within_max_size(self):
+        cache = autopep8.FixCache(self.path, max_size=1000)
+        self.put(cache, 'aa' + 'a' * 62, 500, 1000)
+        cache.evict()
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_overwriting_does_not_grow_the_size(self):
+        cache = autopep8.FixCache(self.path, max_size=1000)
+        self.put(cache, 'aa' + 'a' * 62, 100, 1000)
+        for _ in range(20):
+            self.put(cache, 'bb' + 'b' * 62, 400, 1000)
+        self.assertEqual(cache._size, 500)
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_writes_of_other_processes_are_counted(self):
+        cache = autopep8.FixCache(self.path, max_size=1000)
+        other = autopep8.FixCache(self.path, max_size=1000)
+        cache.recount_interval = 0
+        self.put(cache, 'aa' + 'a' * 62, 100, 1000)
+        self.put(other, 'bb' + 'b' * 62, 600, 1001)
+        self.put(cache, 'cc' + 'c' * 62, 350, 1002)
+        self.assertLessEqual(sum(os.path.getsize(name)
+                                 for name in self.stored_files()), 800)
+
+    def test_clear(self):
+        cache = autopep8.FixCache(self.path)
+        cache.put('aa' + 'a' * 62, 'text')
+        cache.clear()
+        self.assertEqual(self.stored_files(), [])
+        self.assertIsNone(cache.get('aa' + 'a' * 62))
+
+    def test_clear_cache_requires_cache_dir(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                autopep8.parse_args(['--clear-cache'])
+        args = autopep8.parse_args(['--clear-cache', '--cache-dir',
+                                    self.path])
+        self.assertTrue(args.clear_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# coding=utf-8
+"""autopep8 --git-diff formats the lines changed since a git ref.
+
+The tests run git in a temporary repository.
+
+    python3 -m unittest discover tests
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import support
+
+autopep8 = support.import_engine()
+
+COMMITTED = '''\
+import os
+x = 1
+y = 2
+z = 3
+
+
+def function():
+    return os.sep
+'''
+
+
+def git(*arguments):
+    subprocess.check_call(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+         '-c', 'commit.gpgsign=false'] + list(arguments),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def write(filename, text):
+    with open(filename, 'w') as fd:
+        fd.write(text)
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class TestGitDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.repository = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repository)
+        self.addCleanup(os.chdir, self.cwd)
+        os.chdir(self.repository)
+        os.mkdir('sub')
+        write('a.py', COMMITTED)
+        write(os.path.join('sub', 'b.py'), COMMITTED)
+        git('init', '-q')
+        git('add', '.')
+        git('commit', '-q', '-m', 'initial')
+
+    def fix(self, *paths):
+        options = autopep8.parse_args(
+            ['--git-diff', 'HEAD', '--diff'] + list(paths))
+        return ''.join(autopep8.fix_git_diff(paths, options))
+
+    def test_modified_file(self):
+        write('a.py', COMMITTED.replace('y = 2', 'y=2'))
+        self.assertEqual(autopep8.git_diff_line_ranges(['.'], 'HEAD'),
+                         {'a.py': [[3, 3]]})
+        diff = self.fix('a.py')
+        self.assertIn('-y=2\n+y = 2\n', diff)
+
+    def test_unchanged_lines_are_not_fixed(self):
+        write('a.py', COMMITTED.replace('x = 1', 'x=1').replace(
+            'z = 3', 'z=3  '))
+        git('commit', '-q', '-a', '-m', 'bad style')
+        write('a.py', COMMITTED.replace('x = 1', 'x=1').replace(
+            'z = 3', 'z=3  ').replace('y = 2', 'y=2'))
+        diff = self.fix('a.py')
+        self.assertIn('+y = 2\n', diff)
+        self.assertNotIn('+x = 1\n', diff)
+        self.assertNotIn('+z = 3\n', diff)
+
+    def test_adjacent_rows_are_merged(self):
+        lines = COMMITTED.splitlines(True)
+        lines[1] = 'x=1\n'
+        lines[2] = 'y=2\n'
+        lines[3:3] = ['w=0\n']
+        lines[6:6] = ['v=1\n']
+        write('a.py', ''.join(lines))
+        self.assertEqual(autopep8.git_diff_line_ranges(['a.py'], 'HEAD'),
+                         {'a.py': [[2, 4], [7, 7]]})
+
+    def test_deleted_lines_are_not_ranges(self):
+        write('a.py', COMMITTED.replace('y = 2\n', ''))
+        self.assertEqual(autopep8.git_diff_line_ranges(['a.py'], 'HEAD'),
+                         {})
+
+    def test_untracked_file(self):
+        write(os.path.join('sub', 'new.py'), 'a=1\nb=2\n')
+        write(os.path.join('sub', 'notes.txt'), 'a=1\n')
+        self.assertEqual(autopep8.git_diff_line_ranges(['.'], 'HEAD'),
+                         {os.path.join('sub', 'new.py'): [[1, 2]]})
+        diff = self.fix(os.path.join('sub', 'new.py'))
+        self.assertIn('+a = 1\n+b = 2\n', diff)
+
+    def test_run_from_subdirectory(self):
+        write('a.py', COMMITTED.replace('y = 2', 'y=2'))
+        write(os.path.join('sub', 'b.py'), COMMITTED.replace('z = 3', 'z=3'))
+        os.chdir('sub')
+        self.assertEqual(
+            autopep8.git_diff_line_ranges([os.path.join('..', 'a.py')],
+                                          'HEAD'),
+            {os.path.join('..', 'a.py'): [[3, 3]]})
+        self.assertEqual(autopep8.git_diff_line_ranges(['..'], 'HEAD'), {
+            os.path.join('..', 'a.py'): [[3, 3]],
+            'b.py': [[4, 4]],
+        })
+        diff = self.fix(os.path.join('..', 'a.py'))
+        self.assertIn('-y=2\n+y = 2\n', diff)
+
+    def test_missing_path_is_an_error(self):
+        with self.assertRaises(OSError):
+            self.fix('missing.py')
+
+
+if __name__ == '__main__':
+    unittest.main()
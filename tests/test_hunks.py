@@ -0,0 +1,87 @@
+# coding=utf-8
+"""Only the changed lines of a view are replaced, see line_hunks().
+
+    python3 -m unittest discover tests
+"""
+
+import unittest
+
+import support  # noqa: F401
+from AutoPEP8.sublimeautopep8lib import common  # noqa: E402
+
+
+def apply_hunks(source, hunks):
+    text = source
+    end_of_previous = len(source)
+    for begin, end, hunk in hunks:
+        # Each hunk is above the ones already applied.
+        assert begin <= end <= end_of_previous
+        text = text[:begin] + hunk + text[end:]
+        end_of_previous = begin
+    return text
+
+
+class TestLineHunks(unittest.TestCase):
+
+    def check(self, source, formatted):
+        hunks = common.line_hunks(source, formatted)
+        self.assertEqual(apply_hunks(source, hunks), formatted)
+        return hunks
+
+    def test_unchanged(self):
+        self.assertEqual(self.check('a\nb\n', 'a\nb\n'), [])
+        self.assertEqual(self.check('', ''), [])
+
+    def test_modified_lines(self):
+        source = 'a=1\nb = 2\nc=3\n'
+        self.assertEqual(
+            self.check(source, 'a = 1\nb = 2\nc = 3\n'),
+            [(10, 14, 'c = 3\n'), (0, 4, 'a = 1\n')])
+
+    def test_insertions(self):
+        source = 'import os\ndef f():\n    pass\nx = 1\n'
+        formatted = 'import os\n\n\ndef f():\n    pass\n\n\nx = 1\n'
+        self.assertEqual(self.check(source, formatted),
+                         [(28, 28, '\n\n'), (10, 10, '\n\n')])
+
+    def test_deletions(self):
+        source = 'a = 1\n\n\n\n\nb = 2\n\n\n'
+        self.assertEqual(self.check(source, 'a = 1\n\n\nb = 2\n'),
+                         [(16, 18, ''), (8, 10, '')])
+
+    def test_all_lines(self):
+        self.check('a=1\nb=2\n', 'c = 3\n')
+        self.check('a=1\n', '')
+        self.check('', 'a = 1\n')
+
+    def test_trailing_newline_added(self):
+        source = 'a = 1\nb = 2'
+        self.assertEqual(self.check(source, 'a = 1\nb = 2\n'),
+                         [(6, 11, 'b = 2\n')])
+
+    def test_trailing_newline_removed(self):
+        self.check('a = 1\nb = 2\n', 'a = 1\nb = 2')
+
+    def test_crlf(self):
+        source = 'a=1\r\nb = 2\r\nc=3\r\n'
+        self.assertEqual(
+            self.check(source, 'a = 1\r\nb = 2\r\nc = 3\r\n'),
+            [(12, 17, 'c = 3\r\n'), (0, 5, 'a = 1\r\n')])
+
+    def test_crlf_to_lf(self):
+        self.check('a = 1\r\nb = 2\r\n', 'a = 1\nb = 2\n')
+        self.check('a = 1\r\nb=2', 'a = 1\r\nb = 2\r\n')
+
+    def test_other_line_boundaries(self):
+        # str.splitlines() also splits at form feeds and a lone \r.
+        source = 'a=1\n# \x0c page\nb = 2\rc=3\n'
+        self.check(source, source.replace('a=1', 'a = 1'))
+        self.check(source, source.replace('c=3', 'c = 3'))
+
+    def test_non_ascii(self):
+        source = 's="é"\nt = "ü"\nu="ß"\n'
+        self.check(source, 's = "é"\nt = "ü"\nu = "ß"\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
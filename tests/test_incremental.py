@@ -0,0 +1,241 @@
+# coding=utf-8
+"""IncrementalPep8 must report what a full pycodestyle run reports.
+
+    python3 -m unittest discover tests
+"""
+
+import io
+import random
+import unittest
+from unittest import mock
+
+import support
+
+autopep8 = support.import_engine()
+
+
+PEP8_OPTIONS = {
+    'ignore': [],
+    'select': [],
+    'max_line_length': 79,
+    'hang_closing': False,
+}
+
+SOURCE = '''\
+import os, sys
+def function(first,second = None):
+    """Docstring
+    over lines
+    """
+    total = (first +
+        second)
+    values = [1,2,
+              3 ,4]
+    if total:
+        return  values
+    text = """
+a  multi-line   string
+    with indent
+"""
+    return text
+class Thing( object ):
+    def method(self):
+        x=1; y = 2
+        return x+y \\
+            + 1
+'''
+
+FRAGMENTS = [
+    'x=1\n',
+    '    y = (1,\n',
+    '         2)\n',
+    '"""\n',
+    "'''\n",
+    '    # comment\n',
+    '\n',
+    '\n\n\n',
+    'def f( a ):\n',
+    '        return a\n',
+    'z = [\n',
+    ']\n',
+    '\\\n',
+    '\t\tmixed = 1\n',
+    'if x :\n',
+    'long = ' + 'a' * 90 + '\n',
+    'trailing = 1   \n',
+    'nonewline = 1',
+]
+
+
+def lines_of(text):
+    return io.StringIO(text).readlines()
+
+
+def full_check(lines):
+    return sorted_results(autopep8._execute_pep8(PEP8_OPTIONS, lines))
+
+
+def sorted_results(results):
+    return sorted((result['line'], result['column'], result['id'],
+                   result['info']) for result in results)
+
+
+# Sources which autopep8 fixes in several passes.
+MULTI_PASS_SOURCES = [
+    SOURCE,
+    'def f(a,b):\n'
+    '  if a :\n'
+    '     return [a,b , {"key":a,"other":b}, (a,b), "' + 'x' * 60 + '"]\n'
+    '  return  None\n',
+    'import os,sys\n'
+    'x=os.path.join("' + 'a' * 40 + '","' + 'b' * 40 + '")\n'
+    'class A( object ):\n'
+    '    def m( self ):return 1\n'
+    'y = lambda: 0\n'
+    'if x == None :pass\n',
+    'result = function_one(argument_one, argument_two)[0] + '
+    'function_two(argument_three)\n'
+    '\n\n\n\n'
+    'def g():\n'
+    '\tvalue=1\n'
+    '\treturn value\n',
+]
+
+
+def random_edit(rng, lines):
+    """Return lines with a random edit, which may break the syntax."""
+    lines = list(lines)
+    kind = rng.choice(['insert', 'delete', 'replace', 'type', 'eof'])
+    index = rng.randint(0, len(lines))
+    if kind == 'insert' or not lines:
+        lines[index:index] = lines_of(''.join(
+            rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 3))))
+    elif kind == 'delete':
+        del lines[index:index + rng.randint(1, 3)]
+    elif kind == 'replace':
+        lines[index:index + rng.randint(1, 3)] = lines_of(
+            rng.choice(FRAGMENTS))
+    elif kind == 'type':
+        index = min(index, len(lines) - 1)
+        line = lines[index]
+        column = rng.randint(0, len(line))
+        text = rng.choice([' ', '(', ')', '"""', ',', 'a', '#', '\n'])
+        lines[index:index + 1] = lines_of(line[:column] + text +
+                                          line[column:])
+    else:
+        action = rng.choice(['append', 'drop', 'strip'])
+        if action == 'append':
+            lines.extend(lines_of(rng.choice(FRAGMENTS)))
+        elif action == 'drop':
+            del lines[-rng.randint(1, 3):]
+        elif lines:
+            lines[-1] = lines[-1].rstrip('\n')
+    # Keep every item one line, as readlines() of the joined text is.
+    return lines_of(''.join(lines))
+
+
+class TestIncrementalPep8(unittest.TestCase):
+
+    def check_edits(self, versions):
+        checker = autopep8.IncrementalPep8(PEP8_OPTIONS)
+        for lines in versions:
+            checker.record_edit(lines)
+            self.assertEqual(sorted_results(checker.check(lines)),
+                             full_check(lines), ''.join(lines))
+
+    def test_edit_spanning_logical_line(self):
+        lines = lines_of(SOURCE)
+        edited = list(lines)
+        # join the two physical lines of "total = (first +\n second)".
+        edited[5:7] = ['    total = (first+second)\n']
+        self.check_edits([lines, edited, lines])
+
+    def test_edit_in_multiline_string(self):
+        lines = lines_of(SOURCE)
+        edited = list(lines)
+        edited[12] = 'a  multi-line \\\n'
+        closed = list(lines)
+        closed[12] = '"""\n'
+        self.check_edits([lines, edited, closed, lines])
+
+    def test_line_count_changes_at_eof(self):
+        lines = lines_of(SOURCE)
+        self.check_edits([
+            lines,
+            lines + ['\n', '\n'],
+            lines[:-1],
+            lines[:-1] + [lines[-1].rstrip('\n')],
+            lines + ['x = 1'],
+            lines,
+        ])
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        for _ in range(30):
+            versions = [lines_of(SOURCE)]
+            for _ in range(15):
+                versions.append(random_edit(rng, versions[-1]))
+            self.check_edits(versions)
+
+    def test_random_edits_which_tokenize(self):
+        # Sources which do not tokenize are checked in full, so these
+        # edits are the ones that go through IncrementalChecker.recheck.
+        rng = random.Random(1)
+        for _ in range(30):
+            versions = [lines_of(SOURCE)]
+            while len(versions) < 16:
+                lines = random_edit(rng, versions[-1])
+                if not autopep8.analyze_source(''.join(lines)).error:
+                    versions.append(lines)
+            self.check_edits(versions)
+
+
+class TestFixPasses(unittest.TestCase):
+    """Every pass of fix_lines() reports what a full run reports.
+
+    FixPEP8 records the lines each pass fixed with record_fixes(), so the
+    check of the next pass re-checks only the logical lines around them.
+    """
+
+    def fix_checked(self, source, options):
+        test = self
+        checks = []
+
+        class CheckedPep8(autopep8.IncrementalPep8):
+
+            def check(self, source_lines):
+                incremental = self.changes is not None
+                results = super(CheckedPep8, self).check(source_lines)
+                test.assertEqual(
+                    sorted_results(results),
+                    sorted_results(autopep8._execute_pep8(
+                        self.pep8_options, source_lines)),
+                    ''.join(source_lines))
+                checks.append(incremental)
+                return results
+
+        with mock.patch.object(autopep8, 'IncrementalPep8', CheckedPep8):
+            fixed = autopep8.fix_code(source, options)
+        self.assertEqual(fixed, autopep8.fix_code(source, options))
+        return checks
+
+    def test_passes(self):
+        incremental = 0
+        for options in ({}, {'aggressive': 2},
+                        {'select': ['E1', 'E2', 'E3', 'W']}):
+            for source in MULTI_PASS_SOURCES:
+                checks = self.fix_checked(source, options)
+                incremental += sum(checks)
+        # The fixes of at least one pass were re-checked incrementally.
+        self.assertTrue(incremental)
+
+    def test_random_sources(self):
+        rng = random.Random(2)
+        for _ in range(20):
+            source = ''.join(rng.choice(FRAGMENTS)
+                             for _ in range(rng.randint(5, 30)))
+            self.fix_checked(source, {'aggressive': rng.randint(0, 2)})
+
+
+if __name__ == '__main__':
+    unittest.main()
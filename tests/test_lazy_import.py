@@ -0,0 +1,66 @@
+# coding=utf-8
+"""autopep8 is not imported until the plugin first needs it.
+
+The plugin is loaded in a new interpreter, since the other tests import
+the engine; see benchmarks/startup.py.
+
+    python3 -m unittest discover tests
+"""
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import support
+
+SCRIPT = '''
+import json
+import sys
+
+import sublime
+import sublime_plugin
+
+ENGINE_MODULES = ('AutoPEP8.sublimeautopep8lib.autopep8',
+                  'AutoPEP8.sublimeautopep8lib.pycodestyle')
+
+
+def loaded():
+    return [name for name in ENGINE_MODULES if name in sys.modules]
+
+
+import AutoPEP8.sublautopep8 as plugin
+steps = {'import': loaded()}
+sublime_plugin.load_plugin(plugin)
+sublime.wait_idle()
+steps['plugin_loaded'] = loaded()
+sublime_plugin.unload_plugins()
+steps['plugin_unloaded'] = loaded()
+plugin.common.engine()
+steps['engine'] = loaded()
+print(json.dumps(steps))
+'''
+
+
+class TestLazyImport(unittest.TestCase):
+
+    def test_engine_is_imported_on_first_use(self):
+        # -B: no bytecode is written into the package.
+        output = subprocess.check_output(
+            [sys.executable, '-B', '-c', SCRIPT],
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(
+                [support.packages_path, support.FAKE_PATH])),
+            universal_newlines=True)
+        steps = json.loads(output.splitlines()[-1])
+        self.assertEqual(steps, {
+            'import': [],
+            'plugin_loaded': [],
+            'plugin_unloaded': [],
+            'engine': ['AutoPEP8.sublimeautopep8lib.autopep8',
+                       'AutoPEP8.sublimeautopep8lib.pycodestyle'],
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# coding=utf-8
+"""Only the changed lines are fixed on save, see fix_line_ranges().
+
+    python3 -m unittest discover tests
+"""
+
+import io
+import unittest
+
+import support
+
+autopep8 = support.import_engine()
+from AutoPEP8.sublimeautopep8lib import common  # noqa: E402
+
+
+def lines_of(text):
+    return io.StringIO(text).readlines()
+
+
+class TestChangedLineRanges(unittest.TestCase):
+
+    def ranges(self, base, source):
+        return common.changed_line_ranges(source, lines_of(base))
+
+    def test_unchanged(self):
+        self.assertEqual(self.ranges('a\nb\n', 'a\nb\n'), [])
+
+    def test_modified_line(self):
+        self.assertEqual(self.ranges('a\nb\nc\n', 'a\nB\nc\n'), [(2, 2)])
+
+    def test_inserted_lines(self):
+        self.assertEqual(self.ranges('a\nc\n', 'a\nb1\nb2\nc\n'), [(2, 3)])
+
+    def test_deleted_line_marks_the_next_line(self):
+        self.assertEqual(self.ranges('a\nb\nc\n', 'a\nc\n'), [(2, 2)])
+
+    def test_deleted_last_line(self):
+        self.assertEqual(self.ranges('a\nb\nc\n', 'a\nb\n'), [(2, 2)])
+
+    def test_first_and_last_lines(self):
+        self.assertEqual(self.ranges('a\nb\nc\n', 'A\nb\nC\n'),
+                         [(1, 1), (3, 3)])
+
+    def test_line_endings_do_not_count(self):
+        self.assertEqual(self.ranges('a\r\nb\r\n', 'a\nb\n'), [])
+
+    def test_only_newlines_split_lines(self):
+        # str.splitlines() would split these lines in two.
+        base = 'a = 1\n# \x0c page\nb = " "\n'
+        self.assertEqual(self.ranges(base, base.replace('a = 1', 'a=1')),
+                         [(1, 1)])
+        self.assertEqual(self.ranges(base, base + 'c\n'), [(4, 4)])
+
+
+class TestFixLineRanges(unittest.TestCase):
+
+    def fix(self, source, line_ranges):
+        return autopep8.fix_line_ranges(source, line_ranges,
+                                        autopep8.parse_args(['']))
+
+    def test_changed_else_line(self):
+        source = ('if x :\n'
+                  '    y=1\n'
+                  'else :\n'
+                  '    y=2\n'
+                  'z=3\n')
+        self.assertEqual(self.fix(source, [(3, 3)]),
+                         source.replace('else :', 'else:'))
+
+    def test_changed_nested_else_line(self):
+        source = ('def f():\n'
+                  '    a=1\n'
+                  '    if a :\n'
+                  '        b=2\n'
+                  '    else :\n'
+                  '        b=3\n'
+                  '    return b\n')
+        self.assertEqual(self.fix(source, [(5, 5)]),
+                         source.replace('else :', 'else:'))
+
+    def test_changed_except_line(self):
+        source = ('try :\n'
+                  '    y=1\n'
+                  'except ValueError :\n'
+                  '    y=2\n'
+                  'finally :\n'
+                  '    z=3\n')
+        self.assertEqual(self.fix(source, [(3, 3)]),
+                         source.replace('ValueError :', 'ValueError:'))
+
+    def test_changed_decorator_line(self):
+        source = ('import os\n'
+                  '@decorator( 1 )\n'
+                  'def f( a ):\n'
+                  '    return a+1\n')
+        self.assertEqual(self.fix(source, [(2, 2)]),
+                         'import os\n'
+                         '\n'
+                         '\n'
+                         '@decorator(1)\n'
+                         'def f( a ):\n'
+                         '    return a+1\n')
+
+    def test_range_across_multiline_string(self):
+        source = ('a=1\n'
+                  's = """\n'
+                  'keep  this=1\n'
+                  '"""\n'
+                  'b=2\n'
+                  'c=3\n')
+        self.assertEqual(self.fix(source, [(3, 5)]),
+                         source.replace('b=2', 'b = 2'))
+
+    def test_range_within_multiline_string_widens_to_the_statement(self):
+        source = ('a=1\n'
+                  'value=f("""\n'
+                  'keep  this=1\n'
+                  '""",x)\n'
+                  'c=3\n')
+        self.assertEqual(self.fix(source, [(3, 3)]),
+                         source.replace('value=f', 'value = f')
+                         .replace('""",x)', '""", x)'))
+
+    def test_first_line(self):
+        self.assertEqual(self.fix('a=1\nb=2\nc=3\n', [(1, 1)]),
+                         'a = 1\nb=2\nc=3\n')
+
+    def test_last_line(self):
+        self.assertEqual(self.fix('a=1\nb=2\nc=3\n', [(3, 3)]),
+                         'a=1\nb=2\nc = 3\n')
+
+    def test_last_line_without_newline(self):
+        self.assertEqual(self.fix('a=1\nb=2\nc=3', [(3, 3)]),
+                         'a=1\nb=2\nc = 3\n')
+
+    def test_trailing_blank_lines(self):
+        self.assertEqual(self.fix('a=1\nb=2\nc=3\n\n\n', [(3, 5)]),
+                         'a=1\nb=2\nc = 3\n')
+        self.assertEqual(self.fix('a=1\nb=2\nc=3\n\n\n', [(1, 1)]),
+                         'a = 1\nb=2\nc=3\n\n\n')
+
+    def test_unchanged_lines_stay_byte_identical(self):
+        source = ('import os,sys\r\n'
+                  'def f( a ):\r\n'
+                  '\treturn a+1   \r\n'
+                  '\r\n'
+                  '\r\n'
+                  'x=1\r\n'
+                  'class C :\r\n'
+                  '  y  =  [1,2 ]\r\n'
+                  'z=f( x )\r\n')
+        fixed = self.fix(source, [(6, 6)])
+        self.assertEqual(fixed, source.replace('x=1', 'x = 1'))
+
+    def test_several_ranges(self):
+        source = ''.join('v{0}={0}\n'.format(index) for index in range(10))
+        self.assertEqual(
+            self.fix(source, [(2, 3), (8, 8)]),
+            source.replace('v1=1', 'v1 = 1').replace('v2=2', 'v2 = 2')
+            .replace('v7=7', 'v7 = 7'))
+
+    def test_no_ranges(self):
+        self.assertEqual(self.fix('a=1\n', []), 'a=1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# coding=utf-8
+"""Live lint highlights the pycodestyle issues of a view.
+
+    python3 -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+import support
+
+autopep8 = support.import_engine()
+from AutoPEP8 import sublautopep8  # noqa: E402
+from AutoPEP8.sublimeautopep8lib import common  # noqa: E402
+from AutoPEP8.sublimeautopep8lib import lint  # noqa: E402
+from AutoPEP8.sublimeautopep8lib import scheduler  # noqa: E402
+import sublime  # noqa: E402
+
+
+class TestLintView(unittest.TestCase):
+
+    def setUp(self):
+        self.view = sublime.active_window().new_file()
+        self.addCleanup(self.view.close)
+        self.addCleanup(lint.clear, self.view)
+        self.view.run_command('append', {'characters': 'import os,sys\n'})
+        self.params = autopep8.parse_args([''])
+
+    def lint(self):
+        lint.lint_view(self.view, self.view.change_count(), self.params)
+
+    def test_issues_are_highlighted(self):
+        self.lint()
+        # E231 and E401 at the comma.
+        self.assertEqual(self.view.get_regions(lint.REGION_KEY),
+                         [sublime.Region(9, 10)] * 2)
+        status = self.view.get_status(lint.STATUS_KEY)
+        self.assertIn('E231', status)
+        self.assertIn('E401', status)
+
+    def test_engine_error_clears_the_highlights(self):
+        self.lint()
+        self.assertTrue(self.view.get_regions(lint.REGION_KEY))
+        self.view.run_command('append', {'characters': 'x=1\n'})
+        with mock.patch.object(autopep8.IncrementalPep8, 'check',
+                               side_effect=IndexError('list index')):
+            with self.assertLogs(lint.logger, 'DEBUG') as logs:
+                self.lint()
+        self.assertIn('IndexError', logs.output[0])
+        self.assertEqual(self.view.get_regions(lint.REGION_KEY), [])
+        self.assertEqual(self.view.get_status(lint.STATUS_KEY), '')
+        self.assertNotIn(self.view.id(), lint._linters)
+
+        # A new linter picks up the next change: E225 of x=1 is added.
+        self.lint()
+        self.assertEqual(len(self.view.get_regions(lint.REGION_KEY)), 3)
+
+    def test_plugin_unloaded_clears_the_highlights(self):
+        self.lint()
+        self.assertTrue(self.view.get_regions(lint.REGION_KEY))
+        with mock.patch.object(common, '_scheduler', scheduler.Scheduler()):
+            sublautopep8.plugin_unloaded()
+        self.assertEqual(self.view.get_regions(lint.REGION_KEY), [])
+        self.assertEqual(self.view.get_status(lint.STATUS_KEY), '')
+        self.assertNotIn(self.view.id(), lint._linters)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+# coding=utf-8
+"""The scheduler runs the background work of the plugin.
+
+    python3 -m unittest discover tests
+"""
+
+import threading
+import unittest
+
+import support
+from AutoPEP8.sublimeautopep8lib import scheduler  # noqa: E402
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = scheduler.Scheduler(max_workers=1)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.ran = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.most_active = 0
+
+    def block(self):
+        """Submit a job which runs until self.release is set."""
+        job = self.scheduler.submit(self.release.wait, name='block')
+        self.assertTrue(support.wait_until(
+            lambda: job.state == scheduler.Job.RUNNING))
+        return job
+
+    def record(self, name, wait=False):
+        def func():
+            with self.lock:
+                self.active += 1
+                self.most_active = max(self.most_active, self.active)
+            if wait:
+                self.release.wait()
+            with self.lock:
+                self.active -= 1
+                self.ran.append(name)
+            return name
+        return func
+
+    def wait_done(self, jobs):
+        self.assertTrue(support.wait_until(
+            lambda: all(job.state == scheduler.Job.DONE for job in jobs)))
+
+    def test_priority_order(self):
+        self.block()
+        submitted = [
+            ('bulk 1', scheduler.PRIORITY_BULK),
+            ('idle', scheduler.PRIORITY_IDLE),
+            ('lint', scheduler.PRIORITY_LINT),
+            ('bulk 2', scheduler.PRIORITY_BULK),
+            ('view', scheduler.PRIORITY_VIEW),
+            ('save', scheduler.PRIORITY_SAVE),
+        ]
+        jobs = [self.scheduler.submit(self.record(name), priority, name)
+                for (name, priority) in submitted]
+        expected = ['view', 'save', 'lint', 'bulk 1', 'bulk 2', 'idle']
+        self.assertEqual([job.name for job in self.scheduler.pending()],
+                         expected)
+        self.assertEqual(self.scheduler.queue_depth(), 6)
+
+        self.release.set()
+        self.wait_done(jobs)
+        self.assertEqual(self.ran, expected)
+        self.assertEqual([job.result for job in jobs],
+                         [name for (name, _) in submitted])
+        self.assertEqual(self.scheduler.queue_depth(), 0)
+
+    def test_cancel_all(self):
+        blocked = self.block()
+        done = []
+        waiting = self.scheduler.submit(self.record('waiting'),
+                                        on_done=done.append)
+        self.scheduler.cancel_all()
+        self.assertTrue(blocked.cancelled)
+        self.assertTrue(waiting.cancelled)
+
+        self.release.set()
+        self.wait_done([blocked, waiting])
+        self.assertTrue(support.wait_until(lambda: done))
+        # The running job is not interrupted, the waiting one is dropped
+        # but still reports to its owner.
+        self.assertEqual(blocked.result, True)
+        self.assertEqual(self.ran, [])
+        self.assertEqual(done, [waiting])
+        self.assertIsNone(waiting.result)
+
+        # Jobs submitted later run as usual.
+        later = self.scheduler.submit(self.record('later'))
+        self.wait_done([later])
+        self.assertEqual(self.ran, ['later'])
+        self.assertFalse(later.cancelled)
+
+    def test_cancel_done_job(self):
+        job = self.scheduler.submit(self.record('job'))
+        self.wait_done([job])
+        job.cancel()
+        self.assertFalse(job.cancelled)
+
+    def test_max_workers(self):
+        self.scheduler.max_workers = 2
+        jobs = [self.scheduler.submit(self.record(index, wait=True))
+                for index in range(5)]
+        self.assertTrue(support.wait_until(
+            lambda: len(self.scheduler.running()) == 2))
+        self.assertEqual(self.scheduler.queue_depth(), 3)
+        self.assertEqual(self.scheduler._threads, 2)
+
+        self.release.set()
+        self.wait_done(jobs)
+        self.assertEqual(self.most_active, 2)
+        self.assertEqual(sorted(self.ran), list(range(5)))
+
+    def test_lower_max_workers(self):
+        self.scheduler.max_workers = 3
+        first = [self.scheduler.submit(self.record(index, wait=True))
+                 for index in range(3)]
+        self.assertTrue(support.wait_until(
+            lambda: len(self.scheduler.running()) == 3))
+        self.scheduler.max_workers = 1
+        self.release.set()
+        self.wait_done(first)
+        self.assertTrue(support.wait_until(
+            lambda: self.scheduler._threads == 1))
+
+        self.release.clear()
+        self.most_active = 0
+        second = [self.scheduler.submit(self.record(index, wait=True))
+                  for index in range(3, 6)]
+        self.assertTrue(support.wait_until(
+            lambda: len(self.scheduler.running()) == 1))
+        self.release.set()
+        self.wait_done(second)
+        self.assertEqual(self.most_active, 1)
+
+    def test_failed_job(self):
+        def fail():
+            raise ValueError('failed')
+        done = []
+        with self.assertLogs(scheduler.logger, 'ERROR'):
+            job = self.scheduler.submit(fail, on_done=done.append)
+            self.assertTrue(support.wait_until(lambda: done))
+        self.assertEqual(done, [job])
+        self.assertIsNone(job.result)
+        later = self.scheduler.submit(self.record('later'))
+        self.wait_done([later])
+        self.assertEqual(self.ran, ['later'])
+
+
+if __name__ == '__main__':
+    unittest.main()
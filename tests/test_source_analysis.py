@@ -0,0 +1,63 @@
+# coding=utf-8
+"""SourceAnalysis collects what the fixes need from the tokens.
+
+    python3 -m unittest discover tests
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+import warnings
+from unittest import mock
+
+import support
+
+autopep8 = support.import_engine()
+
+SOURCE = '''\
+x = 1
+# x is 1
+# not code at all
+#y = [1, 2]
+'''
+
+
+class TestCommentedOutCode(unittest.TestCase):
+
+    def test_commented_out_code(self):
+        analysis = autopep8.SourceAnalysis(SOURCE)
+        self.assertEqual(analysis.commented_out_code_line_numbers, [2, 4])
+
+    def test_syntax_warnings_are_ignored(self):
+        # A test runner may drop the filters set while the tests were
+        # imported, so the engine is imported in a new interpreter. With
+        # an error filter, the comment would not compile without the
+        # filter of the engine.
+        script = ('from AutoPEP8.sublimeautopep8lib import autopep8\n'
+                  'analysis = autopep8.SourceAnalysis({0!r})\n'
+                  'print(analysis.commented_out_code_line_numbers)\n')
+        output = subprocess.check_output(
+            [sys.executable, '-W', 'error::SyntaxWarning', '-c',
+             script.format(SOURCE)],
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        self.assertEqual(output, '[2, 4]\n')
+
+    def test_warning_filters_are_not_swapped(self):
+        # catch_warnings() replaces warnings.filters for all threads.
+        filters = warnings.filters
+        check_syntax = autopep8.check_syntax
+        seen = []
+
+        def checked(*args):
+            seen.append(warnings.filters is filters)
+            return check_syntax(*args)
+
+        with mock.patch.object(autopep8, 'check_syntax', checked):
+            autopep8.SourceAnalysis(SOURCE)
+        self.assertEqual(seen, [True] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# coding=utf-8
+"""Format-on-save jobs are debounced and coalesced per view.
+
+    python3 -m unittest discover tests
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+import support
+from AutoPEP8.sublimeautopep8lib import common  # noqa: E402
+from AutoPEP8.sublimeautopep8lib import scheduler  # noqa: E402
+import sublime  # noqa: E402
+
+DELAY = 50
+
+
+class TestViewJobs(unittest.TestCase):
+
+    def setUp(self):
+        sublime.start()
+        settings = {'format_on_save_delay': DELAY, 'worker_threads': 1}
+        patches = [
+            mock.patch.dict(sublime._settings, {
+                common.USER_CONFIG_NAME: sublime.Settings(settings)}),
+            mock.patch.object(common, '_scheduler', scheduler.Scheduler()),
+            mock.patch.object(common, 'format_job', self.format_job),
+            mock.patch.object(common, 'show_result', lambda result: None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.release = threading.Event()
+        self.release.set()
+        self.addCleanup(self.release.set)
+        self.lock = threading.Lock()
+        self.formatted = []
+        self.autosave = []
+        self.active = 0
+        self.most_active = 0
+        self.view = sublime.View(sublime.Window())
+        self.addCleanup(common._view_jobs.pop, self.view.id(), None)
+
+    def format_job(self, job, preview, pep8_params, autosave=False):
+        with self.lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+            self.formatted.append(job.source)
+            self.autosave.append(autosave)
+        self.release.wait()
+        with self.lock:
+            self.active -= 1
+        return {}
+
+    def submit(self, source):
+        job = common.FormatJob(source, None, self.view, None, 'utf-8', None,
+                               self.view.change_count(), None)
+        common.submit_view_job(job, False, None)
+
+    def wait_done(self):
+        self.assertTrue(support.wait_until(
+            lambda: self.view.id() not in common._view_jobs))
+        self.assertTrue(support.wait_until(
+            lambda: not common._scheduler.running()))
+
+    def test_repeated_saves_are_coalesced(self):
+        for index in range(5):
+            self.submit('x = {0}\n'.format(index))
+        self.wait_done()
+        self.assertEqual(self.formatted, ['x = 4\n'])
+        self.assertEqual(self.autosave, [True])
+
+    def test_saves_after_the_delay_are_not_coalesced(self):
+        self.submit('x = 1\n')
+        self.wait_done()
+        self.submit('x = 2\n')
+        self.wait_done()
+        self.assertEqual(self.formatted, ['x = 1\n', 'x = 2\n'])
+
+    def test_save_while_a_job_runs(self):
+        self.release.clear()
+        self.submit('x = 1\n')
+        self.assertTrue(support.wait_until(lambda: self.formatted))
+
+        # The newer saves wait for the running job, then only the last
+        # one runs.
+        self.submit('x = 2\n')
+        self.submit('x = 3\n')
+        self.assertTrue(support.wait_until(
+            lambda: common._view_jobs[self.view.id()].pending[0].source ==
+            'x = 3\n'))
+        time.sleep(DELAY * 3 / 1000.0)
+        self.assertTrue(sublime.wait_idle())
+        self.assertEqual(common._scheduler.queue_depth(), 0)
+        self.assertEqual(self.formatted, ['x = 1\n'])
+
+        self.release.set()
+        self.wait_done()
+        self.assertEqual(self.formatted, ['x = 1\n', 'x = 3\n'])
+        self.assertEqual(self.most_active, 1)
+
+    def test_outdated_job_is_dropped(self):
+        job = common.FormatJob('x = 1\n', None, self.view, None, 'utf-8',
+                               None, self.view.change_count() - 1, None)
+        common.submit_view_job(job, False, None)
+        self.wait_done()
+        self.assertEqual(self.formatted, [])
+
+    def test_cancelled_job(self):
+        # A job of the current view keeps the only worker busy.
+        blocked = threading.Event()
+        self.addCleanup(blocked.set)
+        common._scheduler.submit(blocked.wait, scheduler.PRIORITY_VIEW)
+        self.submit('x = 1\n')
+        self.assertTrue(support.wait_until(
+            lambda: common._scheduler.queue_depth() == 1))
+        common._scheduler.cancel_all()
+        blocked.set()
+        self.wait_done()
+        self.assertEqual(self.formatted, [])
+
+        # The view takes new jobs again.
+        self.submit('x = 2\n')
+        self.wait_done()
+        self.assertEqual(self.formatted, ['x = 2\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()